@@ -0,0 +1,48 @@
+"""
+Compara dois resultados de benchmarks/executar.py (por exemplo, de dois commits).
+
+Para cada tamanho do conjunto de dados e cenário presentes nos dois arquivos,
+mostra a mediana (p50) de cada um e a razão novo/antigo: abaixo de 1 o novo
+é mais rápido.
+
+    python benchmarks/comparar.py antes.json depois.json
+"""
+import argparse
+import json
+from pathlib import Path
+
+
+def medianas(resultado):
+    """{(linhas, cenário): p50_ms}; cenários de consulta viram "cenário/frio" e "cenário/quente" """
+    valores = {}
+    for execucao in resultado["execucoes"]:
+        for nome, estatisticas in execucao["cenarios"].items():
+            if "p50_ms" in estatisticas:
+                valores[(execucao["linhas"], nome)] = estatisticas["p50_ms"]
+            else:
+                for variante, est in estatisticas.items():
+                    valores[(execucao["linhas"], f"{nome}/{variante}")] = est["p50_ms"]
+    return valores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("antigo", help="Resultado de referência (JSON)")
+    parser.add_argument("novo", help="Resultado a comparar (JSON)")
+    args = parser.parse_args()
+
+    antigo = json.loads(Path(args.antigo).read_text())
+    novo = json.loads(Path(args.novo).read_text())
+    print(f"antigo: {antigo['commit']} ({antigo['banco']['vendor']})  novo: {novo['commit']} ({novo['banco']['vendor']})")
+    print(f"{'linhas':>10}  {'cenário':<28} {'antigo p50':>12} {'novo p50':>12} {'razão':>7}")
+
+    medianas_antigo, medianas_novo = medianas(antigo), medianas(novo)
+    for chave in sorted(medianas_antigo.keys() & medianas_novo.keys()):
+        linhas, cenario = chave
+        a, n = medianas_antigo[chave], medianas_novo[chave]
+        razao = f"{n / a:.2f}" if a else "-"
+        print(f"{linhas:>10}  {cenario:<28} {a:>10.3f}ms {n:>10.3f}ms {razao:>7}")
+
+
+if __name__ == "__main__":
+    main()
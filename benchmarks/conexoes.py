@@ -0,0 +1,149 @@
+"""
+Custo de conexão e das consultas de ingestão por requisição no PostgreSQL.
+
+Simula ``--requisicoes`` requisições de ingestão, cada uma obtendo a conexão,
+executando em uma transação as consultas de um POST /fluxo/ (última leitura
+do sensor, INSERT, atualização do consumo diário e consulta do total do dia)
+e devolvendo a conexão, em três configurações:
+
+- nova_conexao: sem pool, uma conexão nova por requisição (CONN_MAX_AGE=0)
+- pool: pool de conexões do Django (psycopg 3)
+- pool_preparado: pool com prepared statements (server_side_binding e
+  prepare_threshold), como em setup/settings.py
+
+Mede o tempo para obter a conexão, o das consultas e o total. Usa as
+leituras já existentes no banco de DATABASE_URL (gere-as com
+benchmarks/dados.py). As transações são confirmadas, e não desfeitas, porque
+o psycopg descarta os prepared statements da conexão a cada ROLLBACK: as
+leituras inseridas repetem o último valor (diferença zero) e são removidas ao
+final.
+
+    python benchmarks/conexoes.py --requisicoes 1000 --saida conexoes.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "setup.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, connections, transaction  # noqa: E402
+from django.db.models import F, Max  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from executar import commit_atual, estatisticas, versao_banco  # noqa: E402
+from fluxo.models import ConsumoDiario, ConsumoResidenciaDiario, FluxoAgua, Sensor  # noqa: E402
+
+AQUECIMENTO = 20
+
+
+def configuracoes(prepare_threshold):
+    """{alias: OPTIONS} de cada cenário, a partir das opções de conexão de DATABASES["default"]"""
+    base = {
+        chave: valor for chave, valor in connections.settings["default"]["OPTIONS"].items()
+        if chave not in ("pool", "server_side_binding", "prepare_threshold")
+    }
+    pool = {"min_size": 1, "max_size": 2}
+    return {
+        "nova_conexao": base,
+        "pool": {**base, "pool": pool},
+        "pool_preparado": {
+            **base, "pool": pool, "server_side_binding": True, "prepare_threshold": prepare_threshold,
+        },
+    }
+
+
+def registrar_conexao(alias, opcoes):
+    connections.settings[alias] = {
+        **connections.settings["default"], "OPTIONS": opcoes, "CONN_MAX_AGE": 0,
+    }
+
+
+def consultas_de_ingestao(alias, sensor_id):
+    """As consultas de um POST /fluxo/, com uma leitura de diferença zero"""
+    agora = timezone.now()
+    hoje = timezone.localdate(agora)
+    with transaction.atomic(using=alias):
+        ultimo = (
+            FluxoAgua.objects.using(alias).filter(sensor_id=sensor_id).order_by("-id")
+            .values_list("valor", flat=True).first()
+        ) or Decimal("0")
+        FluxoAgua.objects.using(alias).bulk_create([
+            FluxoAgua(sensor_id=sensor_id, data_hora=agora, valor=ultimo, valor_diferenca=Decimal("0")),
+        ])
+        ConsumoDiario.objects.using(alias).filter(sensor_id=sensor_id, data=hoje).update(
+            consumo_total=F("consumo_total") + Decimal("0")
+        )
+        ConsumoResidenciaDiario.objects.using(alias).filter(data=hoje).values_list(
+            "consumo_total", flat=True
+        ).first()
+
+
+def medir(alias, sensor_id, requisicoes):
+    conexao = connections[alias]
+    tempos = {"conexao": [], "consultas": [], "total": []}
+    for i in range(AQUECIMENTO + requisicoes):
+        inicio = time.perf_counter()
+        conexao.ensure_connection()
+        conectado = time.perf_counter()
+        consultas_de_ingestao(alias, sensor_id)
+        fim = time.perf_counter()
+        # Fim da requisição: fecha a conexão ou a devolve ao pool
+        conexao.close()
+        if i >= AQUECIMENTO:
+            tempos["conexao"].append(conectado - inicio)
+            tempos["consultas"].append(fim - conectado)
+            tempos["total"].append(fim - inicio)
+    if conexao.pool:
+        conexao.close_pool()
+    return {nome: estatisticas(valores) for nome, valores in tempos.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requisicoes", type=int, default=500, help="Requisições por cenário")
+    parser.add_argument("--prepare-threshold", type=int, default=5,
+                        help="Execuções antes de preparar a consulta no cenário pool_preparado")
+    parser.add_argument("--saida", help="Arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    if connection.vendor != "postgresql":
+        raise SystemExit("Este benchmark requer PostgreSQL (DATABASE_URL).")
+    sensor_id = Sensor.objects.order_by("id").values_list("id", flat=True).first()
+    if sensor_id is None:
+        raise SystemExit("O banco não tem sensores. Gere os dados com benchmarks/dados.py.")
+
+    maior_id = FluxoAgua.objects.aggregate(maior=Max("id"))["maior"] or 0
+    cenarios = {}
+    try:
+        for alias, opcoes in configuracoes(args.prepare_threshold).items():
+            registrar_conexao(alias, opcoes)
+            cenarios[alias] = medir(alias, sensor_id, args.requisicoes)
+            sys.stderr.write(f"{alias}: total p50 {cenarios[alias]['total']['p50_ms']} ms\n")
+    finally:
+        FluxoAgua.objects.filter(id__gt=maior_id).delete()
+
+    resultado = {
+        "commit": commit_atual(),
+        "data_hora": timezone.now().isoformat(),
+        "banco": {"vendor": connection.vendor, "versao": versao_banco()},
+        "parametros": {"requisicoes": args.requisicoes, "prepare_threshold": args.prepare_threshold},
+        "cenarios": cenarios,
+    }
+    texto = json.dumps(resultado, indent=2)
+    if args.saida:
+        Path(args.saida).write_text(texto + "\n")
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Gerador determinístico de leituras para os benchmarks.
+
+Gera ``--linhas`` leituras de ``--sensores`` sensores, igualmente espaçadas
+ao longo de ``--anos`` anos até agora. O consumo segue um perfil diário
+(picos de manhã e à noite, quase nada de madrugada), é maior nos fins de
+semana e varia por sensor; de vez em quando o contador do hidrômetro é
+reiniciado. A mesma ``--semente`` gera sempre os mesmos valores (as datas
+são relativas ao momento da geração).
+
+As leituras são carregadas com COPY no PostgreSQL e com executemany nos
+demais bancos, já com ``valor_diferenca``, sem passar pela API nem pelo
+signal. Os consumos consolidados são somados durante a geração (o mesmo
+resultado de rebuild_consumo_diario, sem reler as leituras).
+
+Uso (APAGA as leituras do banco configurado em DATABASE_URL):
+
+    python benchmarks/dados.py --linhas 1000000 --substituir
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "setup.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from fluxo import estado_sensores, historico, versoes  # noqa: E402
+from fluxo.models import (  # noqa: E402
+    ConsumoDiario, ConsumoHorario, ConsumoResidenciaDiario, DiaCompactado, FluxoAgua, MetaConsumo, Sensor,
+)
+from fluxo.rollups import inicio_intervalo  # noqa: E402
+
+# Peso do consumo em cada hora do dia (0h a 23h)
+PERFIL_DIARIO = [
+    0.05, 0.03, 0.02, 0.02, 0.03, 0.3, 1.6, 2.4, 1.8, 1.0, 0.8, 0.9,
+    1.3, 1.1, 0.7, 0.6, 0.8, 1.2, 1.9, 2.2, 1.6, 1.0, 0.5, 0.2,
+]
+LITROS_POR_HORA = 20.0
+FATOR_FIM_DE_SEMANA = 1.25
+# Probabilidade de o contador do hidrômetro reiniciar em uma leitura
+PROBABILIDADE_REINICIO = 1e-5
+LINHAS_POR_CARGA = 100000
+
+
+def gerar_leituras(linhas, sensores, anos, semente, agora):
+    """
+    Gera tuplas (sensor_id, data_hora, hora local, valor, valor_diferenca) em
+    ordem de data_hora, intercalando os sensores. ``sensores`` é a lista de ids.
+    """
+    rng = random.Random(semente)
+    por_sensor = max(linhas // len(sensores), 1)
+    inicio = agora - timedelta(days=365 * anos)
+    passo = (agora - inicio) / por_sensor
+    horas_passo = passo.total_seconds() / 3600
+    escala = {sensor_id: rng.uniform(0.5, 1.5) for sensor_id in sensores}
+    acumulado = {sensor_id: Decimal(rng.randint(0, 100000)) for sensor_id in sensores}
+
+    gerados = 0
+    for i in range(1, por_sensor + 1):
+        data_hora = inicio + passo * i
+        local = timezone.localtime(data_hora)
+        fator = PERFIL_DIARIO[local.hour] * (FATOR_FIM_DE_SEMANA if local.weekday() >= 5 else 1)
+        for sensor_id in sensores:
+            if gerados >= linhas:
+                return
+            litros = LITROS_POR_HORA * horas_passo * fator * escala[sensor_id] * rng.uniform(0.2, 1.8)
+            diferenca = Decimal(f"{litros:.2f}")
+            if rng.random() < PROBABILIDADE_REINICIO:
+                # Contador reiniciado: a diferença é o próprio valor (ver calcular_valor_diferenca)
+                acumulado[sensor_id] = diferenca
+            else:
+                acumulado[sensor_id] += diferenca
+            yield sensor_id, data_hora, local, acumulado[sensor_id], diferenca
+            gerados += 1
+
+
+def _carregar_copy(cursor, lote):
+    with cursor.copy("COPY fluxo_fluxoagua (sensor_id, data_hora, valor, valor_diferenca) FROM STDIN") as copia:
+        for sensor_id, data_hora, _, valor, diferenca in lote:
+            copia.write_row((sensor_id, data_hora, valor, diferenca))
+
+
+def _carregar_executemany(cursor, lote):
+    ops = connection.ops
+    cursor.executemany(
+        "INSERT INTO fluxo_fluxoagua (sensor_id, data_hora, valor, valor_diferenca) VALUES (%s, %s, %s, %s)",
+        [
+            (
+                sensor_id,
+                ops.adapt_datetimefield_value(data_hora),
+                ops.adapt_decimalfield_value(valor, 10, 2),
+                ops.adapt_decimalfield_value(diferenca, 10, 2),
+            )
+            for sensor_id, data_hora, _, valor, diferenca in lote
+        ],
+    )
+
+
+class Consolidado:
+    """Soma as leituras geradas nos totais de ConsumoDiario, ConsumoHorario e ConsumoResidenciaDiario"""
+
+    def __init__(self):
+        self.diario = defaultdict(Decimal)
+        self.ultima_hora = {}
+        self.horario = defaultdict(Decimal)
+        self.residencia = defaultdict(Decimal)
+        self._local = self._intervalo = None
+
+    def adicionar(self, sensor_id, local, diferenca):
+        if local is not self._local:
+            # Os sensores de um mesmo instante compartilham a hora local
+            self._local, self._intervalo = local, inicio_intervalo(local)
+        dia = local.date()
+        self.diario[(sensor_id, dia)] += diferenca
+        self.ultima_hora[(sensor_id, dia)] = local.time()
+        self.horario[(sensor_id, self._intervalo)] += diferenca
+        self.residencia[dia] += diferenca
+
+    def gravar(self):
+        ConsumoDiario.objects.bulk_create(
+            [
+                ConsumoDiario(sensor_id=sensor_id, data=dia, consumo_total=total, hora=self.ultima_hora[(sensor_id, dia)])
+                for (sensor_id, dia), total in self.diario.items()
+            ],
+            batch_size=1000,
+        )
+        ConsumoHorario.objects.bulk_create(
+            [
+                ConsumoHorario(sensor_id=sensor_id, inicio=inicio, consumo_total=total)
+                for (sensor_id, inicio), total in self.horario.items()
+            ],
+            batch_size=1000,
+        )
+        ConsumoResidenciaDiario.objects.bulk_create(
+            [ConsumoResidenciaDiario(data=dia, consumo_total=total) for dia, total in self.residencia.items()],
+            batch_size=1000,
+        )
+
+
+def limpar():
+    """Remove leituras, consumos consolidados e sensores"""
+    with transaction.atomic():
+        for model in (FluxoAgua, ConsumoDiario, ConsumoHorario, ConsumoResidenciaDiario, DiaCompactado, Sensor):
+            model.objects.all().delete()
+        transaction.on_commit(estado_sensores.invalidar)
+        transaction.on_commit(historico.invalidar)
+
+
+def gerar(linhas, sensores=4, anos=3, semente=42, substituir=False, saida=sys.stdout):
+    """Gera e carrega o conjunto de dados; retorna os segundos gastos"""
+    if FluxoAgua.objects.exists():
+        if not substituir:
+            raise SystemExit("O banco já tem leituras. Use --substituir para apagá-las.")
+        limpar()
+
+    ids = [Sensor.objects.create(nome=f"bench-{n + 1}").id for n in range(sensores)]
+    if not MetaConsumo.objects.exists():
+        # Meta alta: a verificação roda a cada leitura, mas o fluxo não é desligado
+        MetaConsumo.objects.create(meta_diaria_litros=Decimal("99999999.99"))
+
+    carregar = _carregar_copy if connection.vendor == "postgresql" else _carregar_executemany
+    consolidado = Consolidado()
+    inicio = time.perf_counter()
+    lote = []
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for leitura in gerar_leituras(linhas, ids, anos, semente, timezone.now()):
+                lote.append(leitura)
+                consolidado.adicionar(leitura[0], leitura[2], leitura[4])
+                if len(lote) >= LINHAS_POR_CARGA:
+                    carregar(cursor, lote)
+                    lote = []
+            if lote:
+                carregar(cursor, lote)
+        consolidado.gravar()
+    segundos = round(time.perf_counter() - inicio, 2)
+    saida.write(f"{linhas} leituras e consumos consolidados carregados em {segundos}s\n")
+
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+    estado_sensores.invalidar()
+    versoes.incrementar("consumo")
+    return segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--linhas", type=int, default=100000, help="Número de leituras")
+    parser.add_argument("--sensores", type=int, default=4, help="Número de sensores")
+    parser.add_argument("--anos", type=int, default=3, help="Anos cobertos pelas leituras, até agora")
+    parser.add_argument("--semente", type=int, default=42, help="Semente do gerador")
+    parser.add_argument("--substituir", action="store_true", help="Apaga as leituras existentes")
+    args = parser.parse_args()
+    gerar(args.linhas, args.sensores, args.anos, args.semente, args.substituir)
+
+
+if __name__ == "__main__":
+    main()
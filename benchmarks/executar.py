@@ -0,0 +1,204 @@
+"""
+Benchmarks de ingestão e consulta sobre o conjunto de dados de benchmarks/dados.py.
+
+Para cada tamanho em ``--linhas`` o conjunto é gerado (com a mesma semente) e
+cada cenário é repetido ``--repeticoes`` vezes:
+
+- create: POST /fluxo/ (FluxoViewSet.create, incluindo o signal)
+- post_save: apenas o signal post_save de FluxoAgua (consumos e meta)
+- consumo_residencia: GET /consumo-residencia/
+- consumo_mensal: GET /consumo-mensal/ (ano atual)
+- consumo_mensal_mes: GET /consumo-mensal/?mes=1
+- consumo_serie: GET /consumo/?granularidade=mes desde a primeira leitura
+
+As consultas são medidas com os caches esvaziados antes de cada repetição
+(``frio``) e com os caches preenchidos (``quente``). O resultado é um JSON
+com o commit, o banco e as estatísticas de cada cenário, para comparar
+execuções com benchmarks/comparar.py.
+
+Uso (APAGA as leituras do banco configurado em DATABASE_URL):
+
+    python benchmarks/executar.py --linhas 100000 1000000 --saida resultados.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "setup.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+import dados  # noqa: E402
+from fluxo import configuracao, controle_fluxo, historico  # noqa: E402
+from fluxo.ingestao import ultimo_valor_do_sensor  # noqa: E402
+from fluxo.models import FluxoAgua, Sensor  # noqa: E402
+from fluxo.signals import verificar_consumo_e_controlar_fluxo  # noqa: E402
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def estatisticas(tempos):
+    ordenados = sorted(tempos)
+    return {
+        "n": len(tempos),
+        "media_ms": round(statistics.fmean(tempos) * 1000, 3),
+        "p50_ms": round(statistics.median(tempos) * 1000, 3),
+        "p95_ms": round(ordenados[max(int(len(ordenados) * 0.95) - 1, 0)] * 1000, 3),
+        "min_ms": round(ordenados[0] * 1000, 3),
+        "max_ms": round(ordenados[-1] * 1000, 3),
+    }
+
+
+def esvaziar_caches():
+    cache.clear()
+    historico.invalidar()
+    configuracao.invalidar()
+    controle_fluxo.invalidar()
+
+
+def medir(funcao, repeticoes, antes=None):
+    """Executa ``funcao`` repetidamente; retorna as estatísticas e as consultas de uma execução"""
+    funcao()  # aquecimento (imports, conexão, planos)
+    tempos = []
+    for _ in range(repeticoes):
+        if antes:
+            antes()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    if antes:
+        antes()
+    with CaptureQueriesContext(connection) as consultas:
+        funcao()
+    return {**estatisticas(tempos), "consultas": len(consultas)}
+
+
+def cenario_create(sensor_id, repeticoes):
+    cliente = Client(HTTP_HOST="localhost")
+    valor = [ultimo_valor_do_sensor(sensor_id) or Decimal("0")]
+
+    def post():
+        valor[0] += Decimal("1.25")
+        resposta = cliente.post("/fluxo/", {"sensor": sensor_id, "valor": str(valor[0])})
+        assert resposta.status_code in (201, 202), resposta.content
+
+    return medir(post, repeticoes)
+
+
+def cenario_post_save(sensor_id, repeticoes):
+    valor = ultimo_valor_do_sensor(sensor_id) or Decimal("0")
+    tempos = []
+    for i in range(repeticoes + 1):
+        valor += Decimal("1.25")
+        with transaction.atomic():
+            leitura = FluxoAgua(
+                sensor_id=sensor_id, data_hora=timezone.now(), valor=valor, valor_diferenca=Decimal("1.25")
+            )
+            # bulk_create não dispara o signal: apenas a chamada abaixo é medida
+            FluxoAgua.objects.bulk_create([leitura])
+            inicio = time.perf_counter()
+            verificar_consumo_e_controlar_fluxo(FluxoAgua, leitura, created=True)
+            tempo = time.perf_counter() - inicio
+        if i:  # a primeira execução é o aquecimento
+            tempos.append(tempo)
+    return estatisticas(tempos)
+
+
+def cenario_get(caminho, repeticoes):
+    cliente = Client(HTTP_HOST="localhost")
+
+    def get():
+        resposta = cliente.get(caminho)
+        assert resposta.status_code == 200, resposta.content
+
+    return {
+        "frio": medir(get, repeticoes, antes=esvaziar_caches),
+        "quente": medir(get, repeticoes),
+    }
+
+
+def executar(linhas, args):
+    segundos_geracao = dados.gerar(
+        linhas, sensores=args.sensores, anos=args.anos, semente=args.semente, substituir=True,
+        saida=sys.stderr,
+    )
+    sensor_id = Sensor.objects.order_by("id").values_list("id", flat=True).first()
+    primeiro_dia = timezone.localtime(FluxoAgua.objects.order_by("data_hora").first().data_hora).date()
+    n = args.repeticoes
+
+    resultados = {
+        "consumo_residencia": cenario_get("/consumo-residencia/", n),
+        "consumo_mensal": cenario_get("/consumo-mensal/", n),
+        "consumo_mensal_mes": cenario_get("/consumo-mensal/?mes=1", n),
+        "consumo_serie": cenario_get(f"/consumo/?granularidade=mes&inicio={primeiro_dia}", n),
+        # Por último: as escritas alteram o conjunto de dados
+        "create": cenario_create(sensor_id, n),
+        "post_save": cenario_post_save(sensor_id, n),
+    }
+    return {"linhas": linhas, "geracao_s": segundos_geracao, "cenarios": resultados}
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def versao_banco():
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SHOW server_version")
+        else:
+            cursor.execute("SELECT sqlite_version()")
+        return cursor.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--linhas", type=int, nargs="+", default=[100000],
+                        help="Tamanhos do conjunto de dados (ex.: 100000 1000000 10000000)")
+    parser.add_argument("--repeticoes", type=int, default=50, help="Repetições de cada cenário")
+    parser.add_argument("--sensores", type=int, default=4, help="Número de sensores")
+    parser.add_argument("--anos", type=int, default=3, help="Anos cobertos pelas leituras")
+    parser.add_argument("--semente", type=int, default=42, help="Semente do gerador")
+    parser.add_argument("--saida", help="Arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    resultado = {
+        "commit": commit_atual(),
+        "data_hora": timezone.now().isoformat(),
+        "python": platform.python_version(),
+        "banco": {"vendor": connection.vendor, "versao": versao_banco()},
+        "parametros": {
+            "repeticoes": args.repeticoes, "sensores": args.sensores, "anos": args.anos, "semente": args.semente,
+        },
+        "execucoes": [executar(linhas, args) for linhas in args.linhas],
+    }
+    texto = json.dumps(resultado, indent=2)
+    if args.saida:
+        Path(args.saida).write_text(texto + "\n")
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
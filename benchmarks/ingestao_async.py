@@ -0,0 +1,140 @@
+"""
+Compara a ingestão síncrona (POST /fluxo/) com a assíncrona (POST /fluxo/async/)
+quando parte dos sensores tem conexões lentas ou intermitentes.
+
+Os clientes rápidos enviam cada leitura de uma vez. Os lentos abrem a
+conexão, enviam os cabeçalhos e só enviam o corpo depois de ``--atraso``
+segundos. Cada leitura usa uma conexão nova, como os sensores. Os caminhos de
+``--caminhos`` são medidos em sequência, contra o mesmo servidor.
+
+Em um servidor ASGI (uvicorn) o Django lê o corpo da requisição no loop de
+eventos antes de chamar a view, síncrona ou assíncrona: a espera pelos
+sensores lentos não ocupa uma thread em nenhum dos dois caminhos. Rode os
+dois no mesmo servidor para separar o efeito da view assíncrona do efeito do
+servidor; rodar /fluxo/ também em um gunicorn síncrono mostra o do servidor.
+
+Uso (servidor já rodando, com os sensores cadastrados):
+
+    gunicorn setup.asgi:application -k uvicorn.workers.UvicornWorker --workers 4 --bind 127.0.0.1:8000
+    python benchmarks/ingestao_async.py --caminhos /fluxo/ /fluxo/async/ --conexoes 50 --lentos 20 --atraso 2
+
+    # Referência: gunicorn síncrono, apenas /fluxo/
+    gunicorn setup.wsgi:application --workers 4 --bind 127.0.0.1:8000
+    python benchmarks/ingestao_async.py --caminhos /fluxo/ --conexoes 50 --lentos 20 --atraso 2
+
+O resultado é impresso em JSON, com vazão e latências dos clientes rápidos e
+dos lentos de cada caminho. Depende apenas da biblioteca padrão.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+
+async def enviar_leitura(host, porta, caminho, corpo, atraso):
+    """Envia um POST em uma conexão nova; retorna (status, segundos)"""
+    inicio = time.perf_counter()
+    leitor, escritor = await asyncio.open_connection(host, porta)
+    try:
+        cabecalhos = (
+            f"POST {caminho} HTTP/1.1\r\n"
+            f"Host: {host}:{porta}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(corpo)}\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        escritor.write(cabecalhos.encode())
+        await escritor.drain()
+        if atraso:
+            await asyncio.sleep(atraso)
+        escritor.write(corpo)
+        await escritor.drain()
+        linha_status = await leitor.readline()
+        await leitor.read()
+    finally:
+        escritor.close()
+    status = int(linha_status.split()[1]) if linha_status else 0
+    return status, time.perf_counter() - inicio
+
+
+async def cliente(sensor, atraso, caminho, args, host, porta, leituras, resultados):
+    for _ in range(args.requisicoes):
+        # Valor acumulado crescente e pequeno, para não estourar os totais de consumo
+        corpo = json.dumps({"sensor": sensor, "valor": f"{next(leituras) / 100:.2f}"}).encode()
+        try:
+            resultados.append(await enviar_leitura(host, porta, caminho, corpo, atraso))
+        except OSError:
+            resultados.append((0, None))
+
+
+def percentil(valores, p):
+    if len(valores) < 2:
+        return round(valores[0], 4) if valores else None
+    return round(statistics.quantiles(valores, n=100, method="inclusive")[p - 1], 4)
+
+
+def resumo(resultados, duracao):
+    latencias = [segundos for status, segundos in resultados if status == 201]
+    return {
+        "requisicoes": len(resultados),
+        "sucesso": len(latencias),
+        # 0 = falha de conexão
+        "por_status": dict(Counter(status for status, _ in resultados)),
+        "leituras_por_s": round(len(latencias) / duracao, 2) if duracao else None,
+        "latencia_p50_s": percentil(latencias, 50),
+        "latencia_p95_s": percentil(latencias, 95),
+        "latencia_max_s": round(max(latencias), 4) if latencias else None,
+    }
+
+
+async def medir(caminho, args, host, porta, leituras):
+    rapidos, lentos = [], []
+    clientes = [
+        cliente(args.sensores[i % len(args.sensores)], 0, caminho, args, host, porta, leituras, rapidos)
+        for i in range(args.conexoes)
+    ] + [
+        cliente(args.sensores[i % len(args.sensores)], args.atraso, caminho, args, host, porta, leituras, lentos)
+        for i in range(args.lentos)
+    ]
+    inicio = time.perf_counter()
+    await asyncio.gather(*clientes)
+    duracao = time.perf_counter() - inicio
+    return {
+        "duracao_s": round(duracao, 3),
+        "rapidos": resumo(rapidos, duracao),
+        "clientes_lentos": resumo(lentos, duracao),
+    }
+
+
+async def executar(args):
+    url = urlsplit(args.url)
+    host, porta = url.hostname, url.port or 80
+    # Um único contador: o valor acumulado continua crescendo entre os caminhos
+    leituras = itertools.count(1)
+    return {
+        "conexoes": args.conexoes,
+        "lentos": args.lentos,
+        "atraso": args.atraso,
+        "caminhos": {caminho: await medir(caminho, args, host, porta, leituras) for caminho in args.caminhos},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Endereço do servidor")
+    parser.add_argument("--caminhos", nargs="+", default=["/fluxo/", "/fluxo/async/"],
+                        help="Caminhos da ingestão medidos em sequência")
+    parser.add_argument("--sensores", type=int, nargs="+", default=[1], help="IDs de sensores existentes")
+    parser.add_argument("--conexoes", type=int, default=50, help="Clientes rápidos simultâneos")
+    parser.add_argument("--lentos", type=int, default=20, help="Clientes lentos simultâneos")
+    parser.add_argument("--requisicoes", type=int, default=5, help="Leituras enviadas por cliente")
+    parser.add_argument("--atraso", type=float, default=2.0, help="Segundos entre os cabeçalhos e o corpo (clientes lentos)")
+    print(json.dumps(asyncio.run(executar(parser.parse_args())), indent=2))
+
+
+if __name__ == "__main__":
+    main()
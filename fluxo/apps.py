@@ -13,12 +13,19 @@ class FluxoConfig(AppConfig):
                 self.limpar_fluxo_agua()
 
     def limpar_fluxo_agua(self):
-        from .models import FluxoAgua
+        from . import estado_sensores, historico
+        from .models import FluxoAgua, ConsumoDiario, ConsumoHorario, ConsumoResidenciaDiario, DiaCompactado
         from django.db import connections
         from django.db.utils import OperationalError
 
         try:
             num_deleted, _ = FluxoAgua.objects.all().delete()
+            ConsumoDiario.objects.all().delete()
+            ConsumoResidenciaDiario.objects.all().delete()
+            ConsumoHorario.objects.all().delete()
+            DiaCompactado.objects.all().delete()
+            estado_sensores.invalidar()
+            historico.invalidar()
             print(f"FluxoAgua zerado. Registros excluídos: {num_deleted}")
         except OperationalError:
             pass
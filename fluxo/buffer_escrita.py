@@ -0,0 +1,171 @@
+"""
+Buffer de escrita (write-behind) do POST /fluxo/.
+
+Com ``settings.FLUXO_BUFFER_ESCRITA`` ativo, a view valida a leitura, responde
+202 e apenas a adiciona ao buffer do processo. Uma thread grava o buffer com
+registrar_leituras_existentes a cada ``FLUXO_BUFFER_INTERVALO_MS`` ou assim que
+``FLUXO_BUFFER_LOTE`` leituras se acumulam, trocando milhares de transações
+de uma linha por poucas transações grandes (a diferença, os totais e a meta
+seguem as regras do POST /fluxo/bulk/).
+
+As leituras são gravadas na ordem de chegada: o buffer é uma única fila e
+as gravações do processo são serializadas (``_escrita``). O buffer é limitado
+a ``FLUXO_BUFFER_MAX`` leituras: cheio, a requisição que chega grava a fila
+inteira, com a sua leitura no final, antes de responder. A leitura nunca é
+gravada à frente das anteriores do mesmo sensor, que seriam comparadas com um
+valor mais novo e contadas como contador reiniciado.
+
+Cada worker tem o seu buffer, então leituras de um sensor aceitas por workers
+diferentes podem ser gravadas fora de ordem. Na gravação, as leituras
+anteriores à última já gravada do sensor são descartadas
+(``registrar_leituras(descartar_atrasadas=True)``): o valor enviado é
+acumulado e a leitura mais nova já inclui o consumo delas.
+
+Ao encerrar o processo (worker_exit do gunicorn ou atexit) o buffer é
+gravado. Leituras de um processo que morre sem encerrar (SIGKILL) se perdem;
+como o valor enviado é acumulado, a próxima leitura do sensor recupera o
+consumo.
+"""
+import atexit
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .ingestao import registrar_leituras_existentes
+
+_condicao = threading.Condition()
+# Serializa as gravações (thread, requisições com o buffer cheio e encerramento):
+# um lote só é retirado da fila depois que o anterior foi gravado
+_escrita = threading.Lock()
+_pendentes = deque()
+_thread = None
+_pid = None
+_encerrando = False
+_em_gravacao = 0
+_contadores = {"gravadas": 0, "descartadas": 0, "falhas": 0, "gravacoes_na_requisicao": 0, "lotes": 0}
+_ultima_gravacao = None
+
+
+def ativo():
+    return settings.FLUXO_BUFFER_ESCRITA
+
+
+def adicionar(leitura):
+    """
+    Adiciona a leitura (dict com sensor, valor e data_hora) ao final do buffer.
+    Com o buffer cheio (ou o processo encerrando), grava a fila inteira antes
+    de retornar.
+    """
+    with _condicao:
+        _garantir_thread()
+        _pendentes.append(leitura)
+        cheio = _encerrando or len(_pendentes) > settings.FLUXO_BUFFER_MAX
+        if cheio:
+            _contadores["gravacoes_na_requisicao"] += 1
+        elif len(_pendentes) >= settings.FLUXO_BUFFER_LOTE:
+            _condicao.notify()
+    if cheio:
+        _gravar_fila()
+
+
+def metricas():
+    """Profundidade do buffer e contadores deste processo"""
+    with _condicao:
+        return {
+            "pid": os.getpid(),
+            "ativo": ativo(),
+            "pendentes": len(_pendentes) if _pid == os.getpid() else 0,
+            "em_gravacao": _em_gravacao,
+            "capacidade": settings.FLUXO_BUFFER_MAX,
+            **_contadores,
+            "ultima_gravacao": _ultima_gravacao.isoformat() if _ultima_gravacao else None,
+        }
+
+
+def descarregar():
+    """Para a thread e grava tudo o que estiver no buffer (encerramento do processo)"""
+    global _encerrando
+    with _condicao:
+        if _thread is None or _pid != os.getpid():
+            return
+        _encerrando = True
+        _condicao.notify()
+    _thread.join()
+    close_old_connections()
+    _gravar_fila()
+
+
+def _gravar_fila():
+    """Grava, em ordem, as leituras que estão no buffer"""
+    with _escrita:
+        with _condicao:
+            restantes = len(_pendentes)
+        while restantes > 0:
+            with _condicao:
+                lote = _retirar(min(restantes, settings.FLUXO_BUFFER_LOTE))
+            if not lote:
+                return
+            _gravar(lote)
+            restantes -= len(lote)
+
+
+def _garantir_thread():
+    """Inicia a thread na primeira leitura do processo (os workers são criados por fork)"""
+    global _thread, _pid, _encerrando
+    if _thread is not None and _pid == os.getpid():
+        return
+    if _pid is None:
+        atexit.register(descarregar)
+    _pid = os.getpid()
+    _encerrando = False
+    _pendentes.clear()
+    _thread = threading.Thread(target=_executar, name="fluxo-buffer-escrita", daemon=True)
+    _thread.start()
+
+
+def _retirar(limite=None):
+    """Retira até FLUXO_BUFFER_LOTE leituras do buffer (com _condicao adquirida)"""
+    global _em_gravacao
+    lote = [_pendentes.popleft() for _ in range(min(len(_pendentes), limite or settings.FLUXO_BUFFER_LOTE))]
+    _em_gravacao = len(lote)
+    return lote
+
+
+def _executar():
+    intervalo = settings.FLUXO_BUFFER_INTERVALO_MS / 1000
+    while True:
+        with _condicao:
+            if len(_pendentes) < settings.FLUXO_BUFFER_LOTE and not _encerrando:
+                _condicao.wait(intervalo)
+            if _encerrando:
+                # descarregar() grava o restante; a conexão desta thread não é mais usada
+                connection.close()
+                return
+        with _escrita:
+            with _condicao:
+                lote = _retirar()
+            if lote:
+                close_old_connections()
+                _gravar(lote)
+
+
+def _gravar(lote):
+    global _em_gravacao, _ultima_gravacao
+    try:
+        gravadas, descartadas = registrar_leituras_existentes(lote)
+    except Exception as e:
+        with _condicao:
+            _contadores["falhas"] += len(lote)
+            _em_gravacao = 0
+        print(f"❌ Erro ao gravar {len(lote)} leituras do buffer de escrita: {e}")
+        return
+    with _condicao:
+        _contadores["gravadas"] += gravadas
+        _contadores["descartadas"] += descartadas
+        _contadores["lotes"] += 1
+        _em_gravacao = 0
+        _ultima_gravacao = timezone.now()
@@ -0,0 +1,59 @@
+"""
+Cache em memória da configuração consultada a cada leitura: a meta diária
+(MetaConsumo) e os emails ativos (EmailNotification).
+
+Esses dados mudam raramente; o cache é descartado quando o contador
+"configuracao" de fluxo.versoes muda (os signals de save/delete desses
+modelos o incrementam) e, sem estado compartilhado, também após
+FLUXO_CONFIG_TTL segundos.
+"""
+import time
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+
+from . import versoes
+from .models import EmailNotification, MetaConsumo
+
+
+class Configuracao(NamedTuple):
+    versao: int
+    expira_em: float
+    meta: Optional[MetaConsumo]
+    emails: tuple
+
+
+_cache = None
+
+
+def _atual():
+    global _cache
+    # A versão é lida antes das consultas: uma alteração concorrente força nova carga
+    versao = versoes.versao("configuracao")
+    agora = time.monotonic()
+    cache = _cache
+    if cache is not None and cache.versao == versao and (versoes.ativo() or agora < cache.expira_em):
+        return cache
+
+    cache = Configuracao(
+        versao=versao,
+        expira_em=agora + settings.FLUXO_CONFIG_TTL,
+        meta=MetaConsumo.get_meta_atual(),
+        emails=tuple(EmailNotification.objects.filter(ativo=True).values_list("email", flat=True)),
+    )
+    _cache = cache
+    return cache
+
+
+def meta_atual():
+    """Meta de consumo atual ou None (equivalente a MetaConsumo.get_meta_atual())"""
+    return _atual().meta
+
+
+def emails_ativos():
+    """Lista dos emails ativos para notificação"""
+    return list(_atual().emails)
+
+
+def invalidar():
+    versoes.incrementar("configuracao")
@@ -0,0 +1,40 @@
+"""
+Status do fluxo do dia servido pelo GET /controle-fluxo/, consultado a cada
+poucos segundos pelos controladores das válvulas.
+
+A leitura nunca grava: sem ControleFluxo do dia, o estado padrão (ligado,
+flags zeradas) é sintetizado; o registro só é criado pelos caminhos de
+escrita (desligamento automático em fluxo.signals e alteração manual).
+O resultado fica em cache no processo até o contador "controle" de
+fluxo.versoes mudar (qualquer gravação em ControleFluxo) ou, sem estado
+compartilhado, por FLUXO_CONTROLE_TTL segundos.
+"""
+import time
+
+from django.conf import settings
+
+from . import versoes
+from .models import ControleFluxo
+from .serializers import ControleFluxoSerializer
+
+_cache = {}
+
+
+def status_do_dia(data):
+    """Dados serializados do ControleFluxo do dia (ou do estado padrão, sem gravar)"""
+    versao = versoes.versao("controle")
+    agora = time.monotonic()
+    item = _cache.get(data)
+    if item is not None and item[0] == versao and (versoes.ativo() or agora < item[1]):
+        return dict(item[2])
+
+    controle = ControleFluxo.objects.filter(data=data).first() or ControleFluxo(data=data)
+    dados = dict(ControleFluxoSerializer(controle).data)
+    # Guarda apenas o dia consultado: os anteriores não são mais pedidos
+    _cache.clear()
+    _cache[data] = (versao, agora + settings.FLUXO_CONTROLE_TTL, dados)
+    return dict(dados)
+
+
+def invalidar():
+    versoes.incrementar("controle")
@@ -0,0 +1,86 @@
+"""
+Fila de emails (EmailOutbox).
+
+Quem precisa notificar apenas grava a mensagem com ``enfileirar_email``,
+dentro da própria transação. O comando run_email_worker chama
+``enviar_pendentes`` em loop, reaproveitando a mesma conexão SMTP para
+todas as mensagens e reagendando as falhas com espera exponencial.
+
+A entrega é "pelo menos uma vez": se o worker cair depois do envio e antes
+de marcar a mensagem, ela é enviada de novo.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.utils import timezone
+
+from . import metricas
+from .models import EmailOutbox
+
+
+def enfileirar_email(assunto, corpo, destinatarios):
+    """Grava o email na fila; será enviado pelo run_email_worker"""
+    return EmailOutbox.objects.create(assunto=assunto, corpo=corpo, destinatarios=list(destinatarios))
+
+
+def espera_nova_tentativa(tentativas):
+    """Espera antes da próxima tentativa: dobra a cada falha, até FLUXO_EMAIL_ESPERA_MAXIMA"""
+    segundos = settings.FLUXO_EMAIL_ESPERA_INICIAL * 2 ** max(tentativas - 1, 0)
+    return timedelta(seconds=min(segundos, settings.FLUXO_EMAIL_ESPERA_MAXIMA))
+
+
+def existem_pendentes():
+    """Se há algum email pendente com o envio já devido"""
+    return EmailOutbox.objects.filter(status='pendente', proxima_tentativa__lte=timezone.now()).exists()
+
+
+def enviar_pendentes(conexao, lote=50):
+    """
+    Envia até ``lote`` emails pendentes com a conexão ``conexao`` (já aberta ou não).
+    Retorna (enviados, falhas).
+
+    No PostgreSQL as linhas ficam bloqueadas com SKIP LOCKED durante o envio,
+    então mais de um worker pode drenar a fila sem enviar o mesmo email duas vezes.
+    """
+    enviados = falhas = 0
+    with transaction.atomic():
+        pendentes = list(
+            EmailOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status='pendente', proxima_tentativa__lte=timezone.now())
+            .order_by('proxima_tentativa', 'id')[:lote]
+        )
+        for email in pendentes:
+            mensagem = EmailMessage(
+                subject=email.assunto,
+                body=email.corpo,
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=email.destinatarios,
+                connection=conexao,
+            )
+            email.tentativas += 1
+            inicio = time.perf_counter()
+            try:
+                mensagem.send(fail_silently=False)
+            except Exception as e:
+                metricas.EMAIL_ENVIO_SEGUNDOS.labels("falha").observe(time.perf_counter() - inicio)
+                falhas += 1
+                email.ultimo_erro = str(e)
+                if email.tentativas >= settings.FLUXO_EMAIL_MAX_TENTATIVAS:
+                    email.status = 'falhou'
+                else:
+                    email.proxima_tentativa = timezone.now() + espera_nova_tentativa(email.tentativas)
+                # A conexão pode ter ficado inválida: o próximo envio abre outra
+                conexao.close()
+            else:
+                metricas.EMAIL_ENVIO_SEGUNDOS.labels("enviado").observe(time.perf_counter() - inicio)
+                enviados += 1
+                email.status = 'enviado'
+                email.data_envio = timezone.now()
+                email.ultimo_erro = ''
+            email.save(update_fields=[
+                'status', 'tentativas', 'proxima_tentativa', 'ultimo_erro', 'data_envio'
+            ])
+    return enviados, falhas
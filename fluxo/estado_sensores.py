@@ -0,0 +1,227 @@
+"""
+Estado por sensor compartilhado entre os workers do mesmo host.
+
+Guarda, para cada sensor, o último valor acumulado e a data/hora da última
+leitura. Com isso a diferença de uma nova leitura é calculada (e uma leitura
+atrasada é reconhecida) sem consultar a última linha de FluxoAgua no banco.
+
+A tabela fica em um arquivo mapeado em memória (mmap) dentro de
+``settings.FLUXO_ESTADO_DIR``; todos os processos que mapeiam o arquivo
+enxergam as mesmas páginas. Cada slot é protegido por um lock de intervalo
+de bytes (fcntl.lockf), então leituras de sensores diferentes não disputam
+o mesmo lock.
+
+Se ``FLUXO_ESTADO_DIR`` não estiver configurado o estado fica desativado e
+a ingestão consulta o banco como antes. O arquivo vale para um único host:
+com mais de um servidor gravando leituras, deixe a configuração vazia.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import FluxoAgua
+
+NOME_ARQUIVO = "estado_sensores.bin"
+MAGIC = b"FXS2"
+
+# magic, construído (0/1), número de slots, reservado
+CABECALHO = struct.Struct("<4sIII")
+# sensor_id (0 = vazio), último valor (centavos), data/hora (epoch)
+SLOT = struct.Struct("<qqd")
+
+_lock_thread = threading.Lock()
+_mapa = None
+_arquivo = None
+
+
+class EstadoSensor(NamedTuple):
+    ultimo_valor: Decimal
+    ultima_data_hora: datetime
+
+
+def ativo():
+    return bool(settings.FLUXO_ESTADO_DIR)
+
+
+def _para_centavos(valor):
+    return int((Decimal(valor) * 100).to_integral_value())
+
+
+def _de_centavos(centavos):
+    return Decimal(centavos).scaleb(-2)
+
+
+def _travar(inicio, tamanho, modo=fcntl.LOCK_EX):
+    fcntl.lockf(_arquivo, modo, tamanho, inicio, os.SEEK_SET)
+
+
+def _destravar(inicio, tamanho):
+    fcntl.lockf(_arquivo, fcntl.LOCK_UN, tamanho, inicio, os.SEEK_SET)
+
+
+def _abrir():
+    """Abre (criando se necessário) e mapeia o arquivo de estado"""
+    global _mapa, _arquivo
+    if _mapa is not None:
+        return _mapa
+
+    n_slots = settings.FLUXO_ESTADO_SLOTS
+    tamanho = CABECALHO.size + n_slots * SLOT.size
+    os.makedirs(settings.FLUXO_ESTADO_DIR, exist_ok=True)
+    caminho = os.path.join(settings.FLUXO_ESTADO_DIR, NOME_ARQUIVO)
+    _arquivo = open(caminho, "a+b")
+
+    _travar(0, CABECALHO.size)
+    try:
+        os.ftruncate(_arquivo.fileno(), max(tamanho, os.fstat(_arquivo.fileno()).st_size))
+        _mapa = mmap.mmap(_arquivo.fileno(), tamanho)
+        magic, _, slots_arquivo, _ = CABECALHO.unpack_from(_mapa, 0)
+        if magic != MAGIC or slots_arquivo != n_slots:
+            _mapa[:] = bytes(tamanho)
+            CABECALHO.pack_into(_mapa, 0, MAGIC, 0, n_slots, 0)
+    finally:
+        _destravar(0, CABECALHO.size)
+    return _mapa
+
+
+def _offset(indice):
+    return CABECALHO.size + indice * SLOT.size
+
+
+def _garantir_construido(mapa):
+    if CABECALHO.unpack_from(mapa, 0)[1]:
+        return
+    _reconstruir(mapa)
+
+
+def _localizar(mapa, sensor_id, criar):
+    """
+    Percorre a tabela (endereçamento aberto) a partir de sensor_id % n_slots.
+    Retorna o offset do slot já travado (LOCK_EX) ou None se não encontrado.
+    """
+    n_slots = CABECALHO.unpack_from(mapa, 0)[2]
+    for passo in range(n_slots):
+        offset = _offset((sensor_id + passo) % n_slots)
+        _travar(offset, SLOT.size)
+        id_slot = struct.unpack_from("<q", mapa, offset)[0]
+        if id_slot == sensor_id:
+            return offset
+        if id_slot == 0:
+            if criar:
+                SLOT.pack_into(mapa, offset, sensor_id, 0, 0.0)
+                return offset
+            _destravar(offset, SLOT.size)
+            return None
+        _destravar(offset, SLOT.size)
+    return None
+
+
+def obter(sensor_id):
+    """Retorna o EstadoSensor do sensor ou None se não houver estado (usar o banco)"""
+    if not ativo():
+        return None
+    with _lock_thread:
+        mapa = _abrir()
+        _garantir_construido(mapa)
+        offset = _localizar(mapa, int(sensor_id), criar=False)
+        if offset is None:
+            return None
+        try:
+            _, valor, data_hora = SLOT.unpack_from(mapa, offset)
+        finally:
+            _destravar(offset, SLOT.size)
+    return EstadoSensor(
+        ultimo_valor=_de_centavos(valor),
+        ultima_data_hora=datetime.fromtimestamp(data_hora, tz=dt_timezone.utc),
+    )
+
+
+def registrar_leitura(sensor_id, valor, data_hora):
+    """
+    Atualiza o estado do sensor após a gravação de uma leitura.
+
+    O último valor sempre acompanha a leitura mais recente gravada (maior id),
+    como na consulta ao banco.
+    """
+    if not ativo():
+        return
+    if timezone.is_naive(data_hora):
+        data_hora = timezone.make_aware(data_hora)
+    with _lock_thread:
+        mapa = _abrir()
+        _garantir_construido(mapa)
+        offset = _localizar(mapa, int(sensor_id), criar=True)
+        if offset is None:
+            return  # tabela cheia: o sensor continua sendo resolvido pelo banco
+        try:
+            SLOT.pack_into(mapa, offset, int(sensor_id), _para_centavos(valor), data_hora.timestamp())
+        finally:
+            _destravar(offset, SLOT.size)
+
+
+def invalidar():
+    """
+    Descarta todo o estado; a próxima consulta reconstrói a tabela a partir do banco.
+    Usado quando leituras são alteradas ou removidas fora do fluxo de ingestão.
+    """
+    if not ativo():
+        return
+    with _lock_thread:
+        mapa = _abrir()
+        _travar(0, CABECALHO.size)
+        try:
+            CABECALHO.pack_into(mapa, 0, MAGIC, 0, CABECALHO.unpack_from(mapa, 0)[2], 0)
+        finally:
+            _destravar(0, CABECALHO.size)
+
+
+def reconstruir():
+    """Reconstrói a tabela a partir do banco (chamado na inicialização do gunicorn)"""
+    if not ativo():
+        return
+    with _lock_thread:
+        _reconstruir(_abrir(), forcar=True)
+
+
+def _ultimas_leituras():
+    """Última leitura de cada sensor: DISTINCT ON no PostgreSQL, subconsulta nos demais bancos"""
+    campos = ("sensor_id", "valor", "data_hora")
+    if connection.vendor == "postgresql":
+        return FluxoAgua.objects.order_by("sensor_id", "-id").distinct("sensor_id").values_list(*campos)
+    ultimos_ids = FluxoAgua.objects.values("sensor_id").annotate(ultimo_id=Max("id")).values("ultimo_id")
+    return FluxoAgua.objects.filter(id__in=ultimos_ids).values_list(*campos)
+
+
+def _reconstruir(mapa, forcar=False):
+    _travar(0, CABECALHO.size)
+    try:
+        if CABECALHO.unpack_from(mapa, 0)[1] and not forcar:
+            return  # outro processo reconstruiu enquanto esperávamos o lock
+        n_slots = CABECALHO.unpack_from(mapa, 0)[2]
+
+        _travar(CABECALHO.size, n_slots * SLOT.size)
+        try:
+            mapa[CABECALHO.size:] = bytes(n_slots * SLOT.size)
+            for sensor_id, valor, data_hora in _ultimas_leituras():
+                for passo in range(n_slots):
+                    offset = _offset((sensor_id + passo) % n_slots)
+                    if struct.unpack_from("<q", mapa, offset)[0] == 0:
+                        SLOT.pack_into(mapa, offset, sensor_id, _para_centavos(valor), data_hora.timestamp())
+                        break
+        finally:
+            _destravar(CABECALHO.size, n_slots * SLOT.size)
+
+        CABECALHO.pack_into(mapa, 0, MAGIC, 1, n_slots, 0)
+    finally:
+        _destravar(0, CABECALHO.size)
@@ -0,0 +1,92 @@
+"""
+Exportação de leituras e consumos em CSV ou NDJSON com StreamingHttpResponse.
+
+As linhas são lidas com QuerySet.iterator(chunk_size=...) (cursor do lado do
+servidor no PostgreSQL) e enviadas em blocos, então a memória usada não
+depende da quantidade de linhas exportadas.
+
+Em servidores ASGI o Django só envia em streaming iteradores assíncronos (um
+iterador síncrono é lido inteiro para uma lista antes do envio), e em WSGI só
+iteradores síncronos; a resposta usa o tipo de iterador do servidor da requisição.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+FORMATOS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+# Tamanho aproximado (caracteres) de cada bloco enviado ao cliente
+TAMANHO_BLOCO = 64 * 1024
+
+
+def _texto(valor):
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).isoformat()
+    if isinstance(valor, (date, time)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _blocos_csv(campos, linhas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(campos)
+    for linha in linhas:
+        escritor.writerow([_texto(v) for v in linha])
+        if buffer.tell() >= TAMANHO_BLOCO:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _blocos_ndjson(campos, linhas):
+    partes = []
+    tamanho = 0
+    for linha in linhas:
+        parte = json.dumps(dict(zip(campos, (_texto(v) for v in linha))), ensure_ascii=False) + "\n"
+        partes.append(parte)
+        tamanho += len(parte)
+        if tamanho >= TAMANHO_BLOCO:
+            yield "".join(partes)
+            partes = []
+            tamanho = 0
+    yield "".join(partes)
+
+
+async def _blocos_assincronos(blocos):
+    """
+    Percorre o gerador síncrono de blocos em sync_to_async, um bloco por vez.
+    thread_sensitive: todas as chamadas usam a thread (e a conexão com o banco,
+    com o cursor aberto) da requisição.
+    """
+    proximo = sync_to_async(next, thread_sensitive=True)
+    while (bloco := await proximo(blocos, None)) is not None:
+        yield bloco
+
+
+def resposta_exportacao(request, queryset, campos, formato, nome_arquivo):
+    """
+    Resposta em streaming com as colunas ``campos`` do queryset.
+    ``campos`` é um dict {nome da coluna: campo do queryset}.
+    """
+    linhas = queryset.values_list(*campos.values()).iterator(chunk_size=settings.FLUXO_EXPORT_CHUNK)
+    blocos = (_blocos_csv if formato == "csv" else _blocos_ndjson)(list(campos), linhas)
+    if isinstance(getattr(request, "_request", request), ASGIRequest):
+        blocos = _blocos_assincronos(blocos)
+    resposta = StreamingHttpResponse(blocos, content_type=FORMATOS[formato])
+    resposta["Content-Disposition"] = f'attachment; filename="{nome_arquivo}.{formato}"'
+    return resposta
@@ -0,0 +1,113 @@
+"""
+Cache dos consumos de períodos fechados (dias e meses anteriores ao atual).
+
+Depois que o dia (ou mês) termina, seus totais só mudam se o histórico for
+reescrito: leituras com data_hora passada, edição ou remoção de leituras
+antigas, rebuild_consumo_diario, compactação ou reset. Esses caminhos chamam
+``invalidar``, que incrementa o contador "historico" de fluxo.versoes; a
+versão faz parte das chaves, então as entradas antigas deixam de ser usadas.
+
+Usa o cache padrão do Django (memória local ou arquivo, ver CACHES). Com
+FLUXO_ESTADO_DIR configurado as entradas não expiram; sem ele a invalidação
+não alcança os outros processos e as entradas expiram em FLUXO_HISTORICO_TTL.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import versoes
+from .models import ConsumoDiario, ConsumoResidenciaDiario
+from .periodos import datas_do_mes
+
+
+def _chave(tipo, periodo):
+    return f"fluxo:historico:{versoes.versao('historico')}:{tipo}:{periodo}"
+
+
+def _timeout():
+    return None if versoes.ativo() else settings.FLUXO_HISTORICO_TTL
+
+
+def consumo_dos_meses(ano):
+    """
+    {mes: consumo total da residência} para os 12 meses do ano.
+    Meses fechados vêm do cache; os demais são calculados a cada chamada.
+    """
+    hoje = timezone.localdate()
+    fechados = {
+        mes: _chave("mes", f"{ano:04d}-{mes:02d}")
+        for mes in range(1, 13)
+        if (ano, mes) < (hoje.year, hoje.month)
+    }
+    em_cache = cache.get_many(fechados.values())
+    consumos = {mes: em_cache[chave] for mes, chave in fechados.items() if chave in em_cache}
+
+    pendentes = [mes for mes in range(1, 13) if mes not in consumos]
+    if pendentes:
+        inicio, _ = datas_do_mes(ano, pendentes[0])
+        _, fim = datas_do_mes(ano, pendentes[-1])
+        por_mes = dict(
+            ConsumoResidenciaDiario.objects.filter(data__gte=inicio, data__lt=fim)
+            .values("data__month")
+            .annotate(consumo_total=Sum("consumo_total"))
+            .values_list("data__month", "consumo_total")
+        )
+        for mes in pendentes:
+            consumos[mes] = por_mes.get(mes) or Decimal("0.00")
+        cache.set_many({fechados[mes]: consumos[mes] for mes in pendentes if mes in fechados}, _timeout())
+    return consumos
+
+
+def consumo_por_dia_do_mes(ano, mes):
+    """
+    [(data, nome do sensor, consumo)] do mês, ordenado por data e sensor.
+    Dias fechados vêm do cache; o dia atual (e os seguintes) são consultados.
+    """
+    hoje = timezone.localdate()
+    primeiro_dia, proximo_mes = datas_do_mes(ano, mes)
+    dias_fechados = []
+    dia = primeiro_dia
+    while dia < min(proximo_mes, hoje):
+        dias_fechados.append(dia)
+        dia += timedelta(days=1)
+
+    chaves = {dia: _chave("dia", dia.isoformat()) for dia in dias_fechados}
+    em_cache = cache.get_many(chaves.values())
+    por_dia = {dia: em_cache[chave] for dia, chave in chaves.items() if chave in em_cache}
+
+    faltando = [dia for dia in dias_fechados if dia not in por_dia]
+    consultas = []
+    if faltando:
+        consultas.append((faltando[0], faltando[-1] + timedelta(days=1)))
+    if proximo_mes > hoje:
+        consultas.append((max(primeiro_dia, hoje), proximo_mes))
+
+    for inicio, fim in consultas:
+        linhas = defaultdict(list)
+        for data, sensor, consumo in (
+            ConsumoDiario.objects.filter(data__gte=inicio, data__lt=fim)
+            .values_list("data", "sensor__nome", "consumo_total")
+            .order_by("data", "sensor__nome")
+        ):
+            linhas[data].append((sensor, consumo))
+        for data, consumos in linhas.items():
+            por_dia.setdefault(data, consumos)
+    for dia in faltando:
+        por_dia.setdefault(dia, [])
+    cache.set_many({chaves[dia]: por_dia[dia] for dia in faltando}, _timeout())
+
+    return [
+        (dia, sensor, consumo)
+        for dia in sorted(por_dia)
+        for sensor, consumo in por_dia[dia]
+    ]
+
+
+def invalidar():
+    """Descarta os consumos em cache de todos os períodos fechados"""
+    versoes.incrementar("historico")
@@ -0,0 +1,241 @@
+"""
+Importação de leituras históricas (comando import_leituras).
+
+As leituras (valores acumulados do hidrômetro, com data/hora) são lidas em
+streaming de arquivos CSV ou NDJSON e processadas em blocos: cada bloco é
+ordenado por sensor e data/hora e a diferença é calculada como no POST
+/fluxo/ (contador reiniciado incluído), continuando do bloco anterior. As
+leituras de cada sensor precisam estar em ordem cronológica entre blocos.
+
+A carga usa COPY no PostgreSQL e bulk_create nos demais bancos, sem o signal
+post_save: não há desligamento automático nem email para dados históricos.
+Ao final, os consumos consolidados dos dias importados são recalculados.
+
+Tudo acontece em uma única transação: se algo falhar nada é importado.
+"""
+import csv
+import json
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import estado_sensores, versoes
+from .ingestao import calcular_valor_diferenca
+from .models import DiaCompactado, FluxoAgua, Sensor
+from .protocolo_linhas import interpretar_leitura
+from .rollups import reconstruir_consumos
+
+CAMPOS = ("sensor", "valor", "data_hora")
+
+
+class ErroImportacao(Exception):
+    pass
+
+
+def ler_csv(arquivo, delimitador=","):
+    """Gera (número da linha, registro) de um CSV com cabeçalho sensor, valor, data_hora"""
+    leitor = csv.DictReader(arquivo, delimiter=delimitador)
+    faltando = [campo for campo in CAMPOS if campo not in (leitor.fieldnames or [])]
+    if faltando:
+        raise ErroImportacao(f"Colunas ausentes no cabeçalho: {', '.join(faltando)}")
+    for registro in leitor:
+        yield leitor.line_num, registro
+
+
+def ler_ndjson(arquivo):
+    """Gera (número da linha, registro) de um arquivo com um objeto JSON por linha"""
+    for numero, linha in enumerate(arquivo, start=1):
+        if not linha.strip():
+            continue
+        try:
+            registro = json.loads(linha)
+        except ValueError:
+            registro = None
+        yield numero, registro if isinstance(registro, dict) else {}
+
+
+def importar(registros, lote=100000, ignorar_invalidas=False):
+    """
+    Importa os registros, um iterável de (origem, dict) em que origem identifica
+    a linha nas mensagens de erro. Retorna o resumo da importação.
+    """
+    with transaction.atomic():
+        importacao = _Importacao(lote)
+        bloco = []
+        for origem, registro in registros:
+            try:
+                if not registro.get("data_hora"):
+                    raise ValueError("data_hora é obrigatória")
+                leitura = interpretar_leitura(registro.get("sensor"), registro.get("valor"), registro["data_hora"])
+            except (ValueError, AttributeError) as e:
+                if not ignorar_invalidas:
+                    raise ErroImportacao(f"{origem}: {e}")
+                importacao.invalidas += 1
+                continue
+            leitura["origem"] = origem
+            bloco.append(leitura)
+            if len(bloco) >= lote:
+                importacao.carregar(bloco)
+                bloco = []
+        if bloco:
+            importacao.carregar(bloco)
+        return importacao.concluir()
+
+
+class _Importacao:
+    def __init__(self, lote):
+        self.lote = lote
+        # Leituras gravadas antes da importação têm id até este valor
+        self.maior_id_anterior = FluxoAgua.objects.aggregate(maior=Max("id"))["maior"] or 0
+        self.sensores = set()
+        self.ultimas = {}  # sensor_id: (data_hora, valor) da última leitura importada
+        self.periodos = {}  # sensor_id: [primeira data_hora, última data_hora]
+        self.por_sensor = Counter()
+        self.invalidas = 0
+        self.carregar_leituras = _carregar_copy if connection.vendor == "postgresql" else _carregar_bulk_create
+
+    def carregar(self, bloco):
+        self._verificar_sensores({leitura["sensor"] for leitura in bloco})
+        # sort é estável: leituras com a mesma data_hora mantêm a ordem do arquivo
+        bloco.sort(key=lambda leitura: (leitura["sensor"], leitura["data_hora"]))
+
+        novas = []
+        for leitura in bloco:
+            sensor_id, data_hora, valor = leitura["sensor"], leitura["data_hora"], leitura["valor"]
+            if sensor_id not in self.ultimas:
+                self.ultimas[sensor_id] = self._leitura_anterior(sensor_id, data_hora)
+                self.periodos[sensor_id] = [data_hora, data_hora]
+            ultima_data_hora, ultimo_valor = self.ultimas[sensor_id]
+            if ultima_data_hora and data_hora < ultima_data_hora and self.por_sensor[sensor_id]:
+                raise ErroImportacao(
+                    f"{leitura['origem']}: leitura do sensor {sensor_id} anterior a uma já importada "
+                    f"({ultima_data_hora.isoformat()}); ordene os arquivos por data_hora ou aumente --lote"
+                )
+            novas.append(
+                (sensor_id, data_hora, valor, calcular_valor_diferenca(valor, ultimo_valor))
+            )
+            self.ultimas[sensor_id] = (data_hora, valor)
+            self.periodos[sensor_id][1] = data_hora
+            self.por_sensor[sensor_id] += 1
+
+        self.carregar_leituras(novas, self.lote)
+
+    def _verificar_sensores(self, sensor_ids):
+        novos = sensor_ids - self.sensores
+        if not novos:
+            return
+        existentes = set(Sensor.objects.filter(id__in=novos).values_list("id", flat=True))
+        inexistentes = sorted(novos - existentes)
+        if inexistentes:
+            raise ErroImportacao(f"Sensores inexistentes: {', '.join(str(s) for s in inexistentes)}")
+        self.sensores |= novos
+
+    def _leitura_anterior(self, sensor_id, data_hora):
+        """(data_hora, valor) da leitura já existente imediatamente anterior, ou (None, None)"""
+        anterior = (
+            FluxoAgua.objects.filter(sensor_id=sensor_id, id__lte=self.maior_id_anterior, data_hora__lt=data_hora)
+            .order_by("-data_hora", "-id")
+            .values_list("data_hora", "valor")
+            .first()
+        )
+        return anterior or (None, None)
+
+    def concluir(self):
+        if not self.por_sensor:
+            return self._resumo(None, None)
+
+        existentes = FluxoAgua.objects.filter(id__lte=self.maior_id_anterior)
+        importadas = FluxoAgua.objects.filter(id__gt=self.maior_id_anterior)
+        for sensor_id, (primeira, ultima) in self.periodos.items():
+            sobreposta = (
+                existentes.filter(sensor_id=sensor_id, data_hora__gte=primeira, data_hora__lte=ultima)
+                .values_list("data_hora", flat=True)
+                .first()
+            )
+            if sobreposta:
+                raise ErroImportacao(
+                    f"O sensor {sensor_id} já tem leituras entre {primeira.isoformat()} e "
+                    f"{ultima.isoformat()} (ex.: {timezone.localtime(sobreposta).isoformat()})"
+                )
+
+        inicio = min(timezone.localdate(primeira) for primeira, _ in self.periodos.values())
+        fim = max(timezone.localdate(ultima) for _, ultima in self.periodos.values())
+        compactados = DiaCompactado.objects.filter(data__gte=inicio, data__lte=fim).values_list("data", flat=True)
+        dia_compactado = (
+            importadas.annotate(dia=TruncDate("data_hora")).filter(dia__in=compactados)
+            .values_list("dia", flat=True).first()
+        )
+        if dia_compactado:
+            raise ErroImportacao(f"O dia {dia_compactado} foi compactado e não pode receber leituras")
+
+        for sensor_id in self.periodos:
+            fim = max(fim, self._corrigir_leitura_seguinte(sensor_id) or fim)
+            self._manter_ultima_leitura(sensor_id)
+
+        reconstruir_consumos(inicio, fim)
+        transaction.on_commit(estado_sensores.invalidar)
+        transaction.on_commit(lambda: versoes.incrementar("consumo"))
+        return self._resumo(inicio, fim)
+
+    def _corrigir_leitura_seguinte(self, sensor_id):
+        """
+        Recalcula a diferença da primeira leitura já existente depois do período
+        importado, que passa a ter a última leitura importada como anterior.
+        Retorna o dia dela (a recalcular) ou None.
+        """
+        ultima = self.periodos[sensor_id][1]
+        seguinte = (
+            FluxoAgua.objects.filter(sensor_id=sensor_id, id__lte=self.maior_id_anterior, data_hora__gt=ultima)
+            .order_by("data_hora", "id")
+            .first()
+        )
+        if seguinte is None:
+            return None
+        diferenca = calcular_valor_diferenca(seguinte.valor, self.ultimas[sensor_id][1])
+        if diferenca == seguinte.valor_diferenca:
+            return None
+        FluxoAgua.objects.filter(id=seguinte.id).update(valor_diferenca=diferenca)
+        return timezone.localdate(seguinte.data_hora)
+
+    def _manter_ultima_leitura(self, sensor_id):
+        """
+        A ingestão toma a leitura de maior id como a última do sensor. Se a
+        leitura mais recente já existia (importação de um período anterior),
+        ela é regravada com um id novo, depois das importadas.
+        """
+        mais_recente = FluxoAgua.objects.filter(sensor_id=sensor_id).order_by("-data_hora", "-id").first()
+        if mais_recente.id > self.maior_id_anterior:
+            return
+        FluxoAgua.objects.filter(id=mais_recente.id).delete()
+        mais_recente.pk = None
+        FluxoAgua.objects.bulk_create([mais_recente])
+
+    def _resumo(self, inicio, fim):
+        return {
+            "importadas": sum(self.por_sensor.values()),
+            "por_sensor": dict(sorted(self.por_sensor.items())),
+            "invalidas": self.invalidas,
+            "inicio": inicio,
+            "fim": fim,
+        }
+
+
+def _carregar_copy(leituras, lote):
+    """COPY em fluxo_fluxoagua (PostgreSQL, psycopg 3)"""
+    with connection.cursor() as cursor:
+        with cursor.copy("COPY fluxo_fluxoagua (sensor_id, data_hora, valor, valor_diferenca) FROM STDIN") as copia:
+            for leitura in leituras:
+                copia.write_row(leitura)
+
+
+def _carregar_bulk_create(leituras, lote):
+    FluxoAgua.objects.bulk_create(
+        (
+            FluxoAgua(sensor_id=sensor_id, data_hora=data_hora, valor=valor, valor_diferenca=diferenca)
+            for sensor_id, data_hora, valor, diferenca in leituras
+        ),
+        batch_size=min(lote, 5000),
+    )
@@ -0,0 +1,151 @@
+"""
+Regras de ingestão de leituras compartilhadas pelos pontos de entrada da API.
+
+O sensor envia o valor acumulado do hidrômetro; o consumo de cada leitura
+(``valor_diferenca``) é a diferença para a leitura anterior do mesmo sensor.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.timezone import make_aware
+
+from . import estado_sensores, metricas
+from .models import FluxoAgua, Sensor
+from .rollups import acumular_leituras
+
+
+def calcular_valor_diferenca(valor_recebido, ultimo_valor):
+    """
+    Calcula o consumo de uma leitura a partir do último valor do sensor.
+
+    - Sem leitura anterior: a diferença é o próprio valor
+    - Valor menor que o anterior (contador reiniciado): a diferença é o próprio valor
+    """
+    if ultimo_valor is None or valor_recebido < ultimo_valor:
+        return valor_recebido
+    return valor_recebido - ultimo_valor
+
+
+def ultimas_leituras_por_sensor(sensor_ids):
+    """
+    Retorna {sensor_id: (valor, data_hora)} da última leitura (maior id) de cada sensor.
+
+    Usa o estado compartilhado entre workers quando disponível; os sensores
+    sem estado são resolvidos em uma única consulta ao banco.
+    """
+    ultimas = {}
+    pendentes = []
+    for sensor_id in sensor_ids:
+        estado = estado_sensores.obter(sensor_id)
+        if estado is None:
+            pendentes.append(sensor_id)
+        else:
+            ultimas[sensor_id] = (estado.ultimo_valor, estado.ultima_data_hora)
+
+    if pendentes:
+        ultimos_ids = (
+            FluxoAgua.objects.filter(sensor_id__in=pendentes)
+            .values("sensor_id")
+            .annotate(ultimo_id=Max("id"))
+            .values("ultimo_id")
+        )
+        for sensor_id, valor, data_hora in (
+            FluxoAgua.objects.filter(id__in=ultimos_ids).values_list("sensor_id", "valor", "data_hora")
+        ):
+            ultimas[sensor_id] = (valor, data_hora)
+    return ultimas
+
+
+def ultimo_valor_do_sensor(sensor_id):
+    """Último valor acumulado do sensor ou None se ele ainda não tem leituras"""
+    estado = estado_sensores.obter(sensor_id)
+    if estado is not None:
+        return estado.ultimo_valor
+    ultima_leitura = FluxoAgua.objects.filter(sensor_id=sensor_id).order_by("-id").first()
+    return ultima_leitura.valor if ultima_leitura else None
+
+
+def registrar_leituras(leituras, descartar_atrasadas=False):
+    """
+    Registra um lote de leituras de um ou mais sensores.
+
+    Cada item é um dict com ``sensor`` (id), ``valor`` (Decimal) e opcionalmente
+    ``data_hora``. As leituras de cada sensor são ordenadas por data_hora e a
+    diferença é calculada em uma única passada, partindo da última leitura já
+    gravada. A inserção é feita com bulk_create e a meta diária é verificada
+    uma única vez ao final do lote.
+
+    Com ``descartar_atrasadas``, as leituras anteriores à última já gravada do
+    sensor são descartadas em vez de comparadas com um valor mais novo (o que
+    as contaria como contador reiniciado). Como o valor é acumulado, o consumo
+    delas já está na leitura mais nova.
+
+    Retorna a lista de instâncias criadas.
+    """
+    from .signals import verificar_meta_consumo
+
+    agora = timezone.now()
+    por_sensor = defaultdict(list)
+    for leitura in leituras:
+        data_hora = leitura.get("data_hora") or agora
+        if timezone.is_naive(data_hora):
+            data_hora = make_aware(data_hora)
+        por_sensor[leitura["sensor"]].append((data_hora, Decimal(leitura["valor"])))
+
+    ultimas = ultimas_leituras_por_sensor(list(por_sensor))
+
+    novas = []
+    for sensor_id, itens in por_sensor.items():
+        # sort é estável: leituras com a mesma data_hora mantêm a ordem de chegada
+        itens.sort(key=lambda item: item[0])
+        ultimo_valor, ultima_data_hora = ultimas.get(sensor_id, (None, None))
+        if descartar_atrasadas and ultima_data_hora is not None:
+            itens = [item for item in itens if item[0] >= ultima_data_hora]
+        for data_hora, valor in itens:
+            novas.append(
+                FluxoAgua(
+                    sensor_id=sensor_id,
+                    data_hora=data_hora,
+                    valor=valor,
+                    valor_diferenca=calcular_valor_diferenca(valor, ultimo_valor),
+                )
+            )
+            ultimo_valor = valor
+
+    with transaction.atomic():
+        # Em lotes: com server_side_binding (settings.DATABASES) um comando aceita
+        # no máximo 65535 parâmetros, 4 por leitura
+        criadas = FluxoAgua.objects.bulk_create(novas, batch_size=1000)
+        acumular_leituras(criadas)
+        transaction.on_commit(lambda: _atualizar_estado(criadas))
+        transaction.on_commit(lambda: metricas.contar_leituras(leitura.sensor_id for leitura in criadas))
+
+    # bulk_create não dispara post_save: a meta é verificada uma vez por lote
+    if criadas:
+        verificar_meta_consumo()
+
+    return criadas
+
+
+def registrar_leituras_existentes(leituras):
+    """
+    Como registrar_leituras, mas descarta as leituras de sensores inexistentes
+    (verificados em uma única consulta) e as atrasadas. Usado por quem grava
+    leituras aceitas antes, quando o sensor pode ter sido removido ou ter
+    recebido leituras mais novas por outro caminho nesse meio-tempo.
+
+    Retorna (gravadas, descartadas).
+    """
+    sensor_ids = {leitura["sensor"] for leitura in leituras}
+    existentes = set(Sensor.objects.filter(id__in=sensor_ids).values_list("id", flat=True))
+    validas = [leitura for leitura in leituras if leitura["sensor"] in existentes]
+    gravadas = len(registrar_leituras(validas, descartar_atrasadas=True)) if validas else 0
+    return gravadas, len(leituras) - gravadas
+
+
+def _atualizar_estado(leituras):
+    for leitura in leituras:
+        estado_sensores.registrar_leitura(leitura.sensor_id, leitura.valor, leitura.data_hora)
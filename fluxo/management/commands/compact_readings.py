@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from fluxo.retencao import compactar_dia, dias_para_compactar, ultimas_leituras_ids
+
+
+class Command(BaseCommand):
+    help = (
+        'Consolida os consumos dos dias mais antigos que --older-than e remove as leituras '
+        'brutas de FluxoAgua em lotes. A última leitura de cada sensor é mantida. '
+        'O andamento é salvo por dia (DiaCompactado): se interrompido, basta rodar de novo.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            required=True,
+            help='Compacta os dias com mais de N dias (N >= 1; o dia corrente nunca é compactado)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Leituras removidas por transação (padrão: 5000)',
+        )
+        parser.add_argument(
+            '--pausa',
+            type=float,
+            default=0,
+            help='Segundos de espera entre lotes, para aliviar o banco (padrão: 0)',
+        )
+        parser.add_argument(
+            '--max-dias',
+            type=int,
+            help='Processa no máximo N dias nesta execução (os demais ficam para a próxima)',
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 1:
+            raise CommandError('--older-than deve ser pelo menos 1')
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser pelo menos 1')
+
+        limite = timezone.localdate() - timedelta(days=options['older_than'])
+        dias = dias_para_compactar(limite)
+        if options['max_dias'] is not None:
+            dias = dias[:options['max_dias']]
+        if not dias:
+            self.stdout.write(self.style.SUCCESS(f'✅ Nenhum dia anterior a {limite} para compactar'))
+            return
+
+        preservar = ultimas_leituras_ids()
+        total = 0
+        for dia in dias:
+            removidas = compactar_dia(dia, preservar, lote=options['lote'], pausa=options['pausa'])
+            total += removidas
+            self.stdout.write(f'   - {dia}: {removidas} leituras removidas')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Compactação concluída: {len(dias)} dias, {total} leituras removidas'
+        ))
@@ -0,0 +1,95 @@
+import gzip
+import io
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fluxo.importacao import ErroImportacao, importar, ler_csv, ler_ndjson
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa leituras históricas (sensor, valor acumulado e data_hora) de arquivos CSV ou '
+        'NDJSON, opcionalmente compactados com gzip ("-" lê da entrada padrão). A diferença é '
+        'calculada por sensor como no POST /fluxo/ e as leituras são carregadas com COPY '
+        '(PostgreSQL) ou bulk_create, sem o desligamento automático nem emails. Os consumos '
+        'consolidados dos dias importados são recalculados ao final; nada é gravado se houver erro.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'arquivos',
+            nargs='+',
+            help='Arquivos a importar, em ordem cronológica (.csv, .ndjson/.jsonl, com ou sem .gz)',
+        )
+        parser.add_argument(
+            '--formato',
+            choices=['csv', 'ndjson'],
+            help='Formato dos arquivos. Padrão: pela extensão (csv se não reconhecida)',
+        )
+        parser.add_argument(
+            '--delimitador',
+            default=',',
+            help='Delimitador do CSV (padrão: ",")',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=100000,
+            help='Leituras ordenadas e carregadas por vez (padrão: 100000)',
+        )
+        parser.add_argument(
+            '--ignorar-invalidas',
+            action='store_true',
+            help='Ignora linhas inválidas em vez de interromper a importação',
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser pelo menos 1')
+        if len(options['delimitador']) != 1:
+            raise CommandError('--delimitador deve ter um caractere')
+
+        inicio = time.perf_counter()
+        try:
+            resumo = importar(
+                self._registros(options),
+                lote=options['lote'],
+                ignorar_invalidas=options['ignorar_invalidas'],
+            )
+        except (ErroImportacao, OSError, UnicodeDecodeError) as e:
+            raise CommandError(f'Importação cancelada, nenhuma leitura gravada: {e}')
+        segundos = time.perf_counter() - inicio
+
+        for sensor_id, total in resumo['por_sensor'].items():
+            self.stdout.write(f'📥 Sensor {sensor_id}: {total} leituras')
+        if resumo['invalidas']:
+            self.stdout.write(self.style.WARNING(f'⚠️ {resumo["invalidas"]} linhas inválidas ignoradas'))
+        if resumo['importadas']:
+            self.stdout.write(f'🔄 Consumos recalculados de {resumo["inicio"]} a {resumo["fim"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {resumo["importadas"]} leituras importadas em {segundos:.1f}s'
+        ))
+
+    def _registros(self, options):
+        for nome in options['arquivos']:
+            formato = options['formato'] or self._formato(nome)
+            with self._abrir(nome) as arquivo:
+                if formato == 'ndjson':
+                    linhas = ler_ndjson(arquivo)
+                else:
+                    linhas = ler_csv(arquivo, options['delimitador'])
+                for numero, registro in linhas:
+                    yield f'{nome}:{numero}', registro
+
+    def _formato(self, nome):
+        nome = nome.removesuffix('.gz')
+        return 'ndjson' if nome.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+    def _abrir(self, nome):
+        if nome == '-':
+            return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+        if nome.endswith('.gz'):
+            return gzip.open(nome, 'rt', encoding='utf-8', newline='')
+        return open(nome, encoding='utf-8', newline='')
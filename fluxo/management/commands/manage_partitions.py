@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from fluxo.particoes import (
+    criar_particao,
+    desanexar_particao,
+    esta_particionada,
+    listar_particoes,
+    meses_entre,
+    proximo_mes,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mantém as partições mensais de FluxoAgua (somente PostgreSQL): cria as partições '
+        'dos próximos meses e desanexa (ou remove) as partições fora do período de retenção. '
+        'Os consumos consolidados não são alterados; não rode rebuild_consumo_diario sobre '
+        'meses desanexados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--meses-futuros',
+            type=int,
+            default=3,
+            help='Quantidade de meses à frente com partição pré-criada (padrão: 3)',
+        )
+        parser.add_argument(
+            '--reter-meses',
+            type=int,
+            help='Mantém anexadas apenas as partições dos últimos N meses (incluindo o atual). '
+                 'Sem esta opção nenhuma partição é desanexada',
+        )
+        parser.add_argument(
+            '--remover',
+            action='store_true',
+            help='Remove (DROP) as partições expiradas em vez de apenas desanexá-las',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Particionamento disponível apenas no PostgreSQL')
+        if options['meses_futuros'] < 0:
+            raise CommandError('--meses-futuros não pode ser negativo')
+        if options['reter_meses'] is not None and options['reter_meses'] < 1:
+            raise CommandError('--reter-meses deve ser pelo menos 1')
+
+        hoje = timezone.localdate()
+        atual = (hoje.year, hoje.month)
+        ultimo = atual
+        for _ in range(options['meses_futuros']):
+            ultimo = proximo_mes(*ultimo)
+
+        criadas = []
+        expiradas = []
+        with transaction.atomic(), connection.cursor() as cursor:
+            if not esta_particionada(cursor):
+                raise CommandError('A tabela fluxo_fluxoagua não está particionada (rode as migrações)')
+
+            for ano, mes in meses_entre(atual, ultimo):
+                if criar_particao(cursor, ano, mes):
+                    criadas.append(f'{ano:04d}-{mes:02d}')
+
+            if options['reter_meses']:
+                ano, mes = atual
+                for _ in range(options['reter_meses'] - 1):
+                    ano, mes = (ano - 1, 12) if mes == 1 else (ano, mes - 1)
+                for ano_particao, mes_particao, nome in listar_particoes(cursor):
+                    if (ano_particao, mes_particao) < (ano, mes):
+                        desanexar_particao(cursor, nome, remover=options['remover'])
+                        expiradas.append(nome)
+
+        acao = 'removidas' if options['remover'] else 'desanexadas'
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Partições criadas: {", ".join(criadas) or "nenhuma"}'
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Partições {acao}: {", ".join(expiradas) or "nenhuma"}'
+        ))
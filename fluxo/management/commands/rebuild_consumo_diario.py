@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from fluxo.rollups import reconstruir_consumos
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula os consumos consolidados (ConsumoDiario, ConsumoResidenciaDiario '
+        'e ConsumoHorario) a partir das leituras de FluxoAgua. Os totais do intervalo são apagados e '
+        'recriados; evite rodar sobre o dia corrente com a ingestão ativa.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            help='Primeiro dia a recalcular (AAAA-MM-DD). Padrão: início do histórico',
+        )
+        parser.add_argument(
+            '--ate',
+            help='Último dia a recalcular (AAAA-MM-DD). Padrão: fim do histórico',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            inicio = date.fromisoformat(options['desde']) if options['desde'] else None
+            fim = date.fromisoformat(options['ate']) if options['ate'] else None
+        except ValueError:
+            raise CommandError('Datas devem estar no formato AAAA-MM-DD')
+
+        total = reconstruir_consumos(inicio, fim)
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Consumos diários recalculados: {total} registros de ConsumoDiario')
+        )
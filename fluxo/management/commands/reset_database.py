@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from fluxo.models import FluxoAgua, Sensor, ConsumoDiario
+from fluxo import estado_sensores, historico
+from fluxo.models import FluxoAgua, Sensor, ConsumoDiario, ConsumoHorario, ConsumoResidenciaDiario, DiaCompactado
 
 
 class Command(BaseCommand):
@@ -30,17 +31,29 @@ class Command(BaseCommand):
                 # Deleta todos os registros na ordem correta (respeitando foreign keys)
                 deleted_fluxo = FluxoAgua.objects.all().count()
                 deleted_consumo = ConsumoDiario.objects.all().count()
+                deleted_consumo_residencia = ConsumoResidenciaDiario.objects.all().count()
+                deleted_consumo_horario = ConsumoHorario.objects.all().count()
+                deleted_dias_compactados = DiaCompactado.objects.all().count()
                 deleted_sensor = Sensor.objects.all().count()
 
                 FluxoAgua.objects.all().delete()
                 ConsumoDiario.objects.all().delete()
+                ConsumoResidenciaDiario.objects.all().delete()
+                ConsumoHorario.objects.all().delete()
+                DiaCompactado.objects.all().delete()
                 Sensor.objects.all().delete()
 
+                transaction.on_commit(estado_sensores.invalidar)
+                transaction.on_commit(historico.invalidar)
+
                 self.stdout.write(
                     self.style.SUCCESS(
                         f'✅ Banco resetado com sucesso!\n'
                         f'   - {deleted_fluxo} registros de FluxoAgua deletados\n'
                         f'   - {deleted_consumo} registros de ConsumoDiario deletados\n'
+                        f'   - {deleted_consumo_residencia} registros de ConsumoResidenciaDiario deletados\n'
+                        f'   - {deleted_consumo_horario} registros de ConsumoHorario deletados\n'
+                        f'   - {deleted_dias_compactados} registros de DiaCompactado deletados\n'
                         f'   - {deleted_sensor} registros de Sensor deletados'
                     )
                 )
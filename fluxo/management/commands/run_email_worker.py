@@ -0,0 +1,91 @@
+import signal
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from fluxo import metricas
+from fluxo.email_outbox import enviar_pendentes, existem_pendentes
+
+
+class Command(BaseCommand):
+    help = (
+        'Envia os emails da fila (EmailOutbox). Mantém uma única conexão SMTP aberta '
+        'enquanto houver mensagens e reagenda as falhas com espera exponencial. '
+        'Encerra com SIGINT/SIGTERM depois de terminar o lote atual.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=5,
+            help='Segundos de espera quando a fila está vazia (padrão: 5)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=50,
+            help='Emails enviados por transação (padrão: 50)',
+        )
+        parser.add_argument(
+            '--uma-vez',
+            action='store_true',
+            help='Envia os emails pendentes no momento e encerra',
+        )
+        parser.add_argument(
+            '--metricas-porta',
+            type=int,
+            default=0,
+            help='Porta HTTP das métricas Prometheus deste processo; 0 desativa (padrão: 0)',
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser pelo menos 1')
+
+        if options['metricas_porta']:
+            metricas.servir(options['metricas_porta'])
+            self.stdout.write(f'📊 Métricas na porta {options["metricas_porta"]} (/metrics)')
+
+        self.encerrar = False
+        signal.signal(signal.SIGTERM, self._pedir_encerramento)
+        signal.signal(signal.SIGINT, self._pedir_encerramento)
+
+        conexao = get_connection()
+        total_enviados = total_falhas = 0
+        try:
+            while not self.encerrar:
+                close_old_connections()
+                enviados = falhas = 0
+                # A conexão SMTP só é aberta quando há o que enviar
+                if existem_pendentes():
+                    try:
+                        # Reutilizada por todas as mensagens do lote (e dos seguintes)
+                        conexao.open()
+                    except Exception as e:
+                        # Nenhuma mensagem é tentada: as tentativas não são consumidas
+                        self.stderr.write(f'❌ Erro ao conectar ao servidor de email: {e}')
+                    else:
+                        enviados, falhas = enviar_pendentes(conexao, lote=options['lote'])
+                        total_enviados += enviados
+                        total_falhas += falhas
+                        if enviados or falhas:
+                            self.stdout.write(f'   - {enviados} emails enviados, {falhas} falhas')
+
+                if enviados + falhas < options['lote']:
+                    if options['uma_vez']:
+                        break
+                    # Fila vazia (ou servidor indisponível): não mantém a conexão SMTP aberta
+                    conexao.close()
+                    time.sleep(options['intervalo'])
+        finally:
+            conexao.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ Worker de email encerrado: {total_enviados} enviados, {total_falhas} falhas'
+        ))
+
+    def _pedir_encerramento(self, signum, frame):
+        self.encerrar = True
@@ -0,0 +1,202 @@
+import asyncio
+import signal
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from fluxo import metricas
+from fluxo.ingestao import registrar_leituras_existentes
+from fluxo.protocolo_linhas import interpretar_linha
+
+
+class Command(BaseCommand):
+    help = (
+        'Servidor de ingestão por protocolo de linhas ("sensor valor [timestamp]") via TCP '
+        'e/ou UDP, sem HTTP/JSON. As leituras são agrupadas e gravadas em lote a cada '
+        '--intervalo segundos ou --lote leituras, com as mesmas regras do POST /fluxo/. '
+        'Encerra com SIGINT/SIGTERM depois de gravar as leituras pendentes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            default='0.0.0.0',
+            help='Endereço de escuta (padrão: 0.0.0.0)',
+        )
+        parser.add_argument(
+            '--tcp',
+            type=int,
+            default=9100,
+            help='Porta TCP; 0 desativa (padrão: 9100)',
+        )
+        parser.add_argument(
+            '--udp',
+            type=int,
+            default=9100,
+            help='Porta UDP; 0 desativa (padrão: 9100)',
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=500,
+            help='Leituras por gravação (padrão: 500)',
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=1.0,
+            help='Segundos máximos que uma leitura aguarda para ser gravada (padrão: 1)',
+        )
+        parser.add_argument(
+            '--max-pendentes',
+            type=int,
+            default=50000,
+            help='Leituras UDP aguardando gravação antes de passar a descartar (padrão: 50000)',
+        )
+        parser.add_argument(
+            '--metricas-porta',
+            type=int,
+            default=0,
+            help='Porta HTTP das métricas Prometheus deste processo; 0 desativa (padrão: 0)',
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError('--lote deve ser pelo menos 1')
+        if options['intervalo'] <= 0:
+            raise CommandError('--intervalo deve ser maior que zero')
+        if not options['tcp'] and not options['udp']:
+            raise CommandError('Informe ao menos uma porta (--tcp ou --udp)')
+
+        if options['metricas_porta']:
+            metricas.servir(options['metricas_porta'], options['host'])
+            self.stdout.write(f'📊 Métricas em http://{options["host"]}:{options["metricas_porta"]}/metrics')
+
+        self.opcoes = options
+        self.pendentes = []
+        self.totais = {'gravadas': 0, 'descartadas': 0, 'invalidas': 0, 'perdidas': 0}
+        asyncio.run(self._executar())
+
+        self.stdout.write(self.style.SUCCESS(
+            '✅ Servidor de ingestão encerrado: {gravadas} leituras gravadas, '
+            '{descartadas} descartadas (sensores inexistentes ou leituras atrasadas), {invalidas} linhas inválidas, '
+            '{perdidas} perdidas'.format(**self.totais)
+        ))
+
+    async def _executar(self):
+        loop = asyncio.get_running_loop()
+        self.gravando = asyncio.Lock()
+        self.tarefas = set()
+        encerrar = asyncio.Event()
+        loop.add_signal_handler(signal.SIGTERM, encerrar.set)
+        loop.add_signal_handler(signal.SIGINT, encerrar.set)
+
+        host = self.opcoes['host']
+        servidor_tcp = transporte_udp = None
+        if self.opcoes['tcp']:
+            servidor_tcp = await asyncio.start_server(
+                self._atender_tcp, host, self.opcoes['tcp'], limit=1024
+            )
+            self.stdout.write(f'📡 TCP em {host}:{self.opcoes["tcp"]}')
+        if self.opcoes['udp']:
+            transporte_udp, _ = await loop.create_datagram_endpoint(
+                lambda: _ProtocoloUdp(self), local_addr=(host, self.opcoes['udp'])
+            )
+            self.stdout.write(f'📡 UDP em {host}:{self.opcoes["udp"]}')
+
+        # Grava periodicamente o que estiver pendente, mesmo sem completar o lote
+        while not encerrar.is_set():
+            try:
+                await asyncio.wait_for(encerrar.wait(), timeout=self.opcoes['intervalo'])
+            except asyncio.TimeoutError:
+                pass
+            await self._gravar_pendentes()
+
+        if servidor_tcp:
+            servidor_tcp.close()
+            await servidor_tcp.wait_closed()
+        if transporte_udp:
+            transporte_udp.close()
+        await self._gravar_pendentes()
+
+    def _receber(self, linha):
+        """Decodifica a linha e a adiciona ao lote; retorna a mensagem de erro ou None"""
+        try:
+            self.pendentes.append(interpretar_linha(linha))
+        except ValueError as e:
+            self.totais['invalidas'] += 1
+            return str(e)
+        return None
+
+    async def _atender_tcp(self, leitor, escritor):
+        """Uma leitura por linha; responde OK (leitura aceita no lote) ou ERRO <motivo>"""
+        try:
+            while True:
+                try:
+                    linha = await leitor.readline()
+                except ValueError:
+                    escritor.write(b'ERRO linha muito longa\n')
+                    break
+                if not linha:
+                    break
+                texto = linha.decode(errors='replace').strip()
+                if not texto:
+                    continue
+                erro = self._receber(texto)
+                escritor.write(b'OK\n' if erro is None else f'ERRO {erro}\n'.encode())
+                # Lote cheio: a própria conexão espera a gravação (contrapressão)
+                if len(self.pendentes) >= self.opcoes['lote']:
+                    await self._gravar_pendentes()
+                await escritor.drain()
+        except ConnectionError:
+            pass
+        finally:
+            escritor.close()
+
+    def _receber_udp(self, dados):
+        for linha in dados.decode(errors='replace').splitlines():
+            if not linha.strip():
+                continue
+            if len(self.pendentes) >= self.opcoes['max_pendentes']:
+                self.totais['perdidas'] += 1
+                continue
+            self._receber(linha)
+        if len(self.pendentes) >= self.opcoes['lote'] and not self.gravando.locked():
+            tarefa = asyncio.get_running_loop().create_task(self._gravar_pendentes())
+            # Mantém a referência até o fim da tarefa (o loop guarda só referências fracas)
+            self.tarefas.add(tarefa)
+            tarefa.add_done_callback(self.tarefas.discard)
+
+    async def _gravar_pendentes(self):
+        async with self.gravando:
+            lote, self.pendentes = self.pendentes, []
+            if not lote:
+                return
+            try:
+                # Thread única (thread_sensitive): a mesma conexão com o banco é reaproveitada
+                gravadas, descartadas = await sync_to_async(_gravar)(lote)
+            except Exception as e:
+                # O valor é acumulado: a próxima leitura de cada sensor recupera o consumo perdido
+                self.totais['perdidas'] += len(lote)
+                self.stderr.write(f'❌ Erro ao gravar {len(lote)} leituras: {e}')
+                return
+            self.totais['gravadas'] += gravadas
+            self.totais['descartadas'] += descartadas
+            if self.opcoes['verbosity'] > 1:
+                self.stdout.write(f'   - {gravadas} leituras gravadas, {descartadas} descartadas')
+
+
+def _gravar(lote):
+    close_old_connections()
+    return registrar_leituras_existentes(lote)
+
+
+class _ProtocoloUdp(asyncio.DatagramProtocol):
+    """Cada datagrama pode conter uma ou mais linhas; não há resposta"""
+
+    def __init__(self, comando):
+        self.comando = comando
+
+    def datagram_received(self, dados, endereco):
+        self.comando._receber_udp(dados)
@@ -0,0 +1,166 @@
+"""
+Métricas no formato do Prometheus, servidas por GET /metrics.
+
+As métricas são registradas no próprio processo, sem serviço externo. Com
+vários workers (gunicorn), a variável de ambiente PROMETHEUS_MULTIPROC_DIR
+aponta para um diretório exclusivo do servidor web (ex.: /dev/shm/fluxo-metricas):
+cada worker grava seus valores em arquivos mapeados em memória nesse diretório
+e o /metrics de qualquer worker soma os de todos. O gunicorn esvazia o
+diretório ao iniciar (gunicorn.conf.py). Sem a variável, o /metrics mostra
+apenas o processo que atendeu a requisição.
+
+Os processos dos comandos run_email_worker e run_ingest_server servem as
+próprias métricas com ``--metricas-porta``.
+"""
+import os
+import time
+from collections import Counter as Contagem
+from contextvars import ContextVar
+
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    # Precisa existir antes da criação do primeiro valor
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+    start_http_server,
+)
+
+CONSULTAS_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+REQUISICAO_SEGUNDOS = Histogram(
+    "fluxo_http_requisicao_segundos",
+    "Duração das requisições HTTP por view",
+    ["view", "metodo", "status"],
+)
+REQUISICAO_CONSULTAS = Histogram(
+    "fluxo_http_consultas_por_requisicao",
+    "Consultas ao banco feitas por requisição",
+    ["view"],
+    buckets=CONSULTAS_BUCKETS,
+)
+REQUISICAO_CONSULTAS_SEGUNDOS = Histogram(
+    "fluxo_http_consultas_segundos",
+    "Tempo total das consultas ao banco de uma requisição",
+    ["view"],
+)
+LEITURAS_REGISTRADAS = Counter(
+    "fluxo_leituras_registradas",
+    "Leituras gravadas pela ingestão (API, buffer de escrita e run_ingest_server)",
+    ["sensor"],
+)
+SIGNAL_LEITURA_SEGUNDOS = Histogram(
+    "fluxo_signal_leitura_segundos",
+    "Duração do signal post_save de FluxoAgua (consumos consolidados e meta)",
+)
+VERIFICACAO_META_SEGUNDOS = Histogram(
+    "fluxo_verificacao_meta_segundos",
+    "Duração da verificação da meta diária (desligamento automático e alerta)",
+)
+EMAIL_ENVIO_SEGUNDOS = Histogram(
+    "fluxo_email_envio_segundos",
+    "Duração do envio de cada email da fila (run_email_worker)",
+    ["resultado"],
+)
+TRANSICOES_CONTROLE = Counter(
+    "fluxo_controle_transicoes",
+    "Transições do ControleFluxo do dia",
+    ["transicao"],
+)
+
+# Consultas ao banco da requisição em andamento (ver MetricasMiddleware).
+# ContextVar: acompanha a requisição também nas threads de sync_to_async.
+_consultas = ContextVar("fluxo_consultas", default=None)
+
+
+class ConsultasDaRequisicao:
+    __slots__ = ("total", "segundos", "por_sql")
+
+    def __init__(self):
+        self.total = 0
+        self.segundos = 0.0
+        # {sql: [execuções, segundos]}, apenas quando detalhado (ServerTimingMiddleware)
+        self.por_sql = None
+
+    def detalhar(self):
+        if self.por_sql is None:
+            self.por_sql = {}
+
+    def mais_demoradas(self, quantidade):
+        """As ``quantidade`` consultas (pelo texto do SQL) com maior tempo somado"""
+        itens = sorted((self.por_sql or {}).items(), key=lambda item: item[1][1], reverse=True)
+        return [(sql, execucoes, segundos) for sql, (execucoes, segundos) in itens[:quantidade]]
+
+
+def iniciar_requisicao():
+    """Passa a contar as consultas do contexto atual; retorna o token para encerrar"""
+    return _consultas.set(ConsultasDaRequisicao())
+
+
+def consultas_da_requisicao():
+    """Consultas da requisição em andamento, ou None fora de uma requisição medida"""
+    return _consultas.get()
+
+
+def encerrar_requisicao(token):
+    consultas = _consultas.get()
+    _consultas.reset(token)
+    return consultas
+
+
+def medir_consulta(execute, sql, params, many, context):
+    """execute_wrapper instalado em todas as conexões (signal connection_created)"""
+    consultas = _consultas.get()
+    if consultas is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        segundos = time.perf_counter() - inicio
+        consultas.total += 1
+        consultas.segundos += segundos
+        if consultas.por_sql is not None:
+            item = consultas.por_sql.setdefault(sql, [0, 0.0])
+            item[0] += 1
+            item[1] += segundos
+
+
+def registrar_requisicao(view, metodo, status, segundos, consultas):
+    REQUISICAO_SEGUNDOS.labels(view, metodo, status).observe(segundos)
+    REQUISICAO_CONSULTAS.labels(view).observe(consultas.total)
+    REQUISICAO_CONSULTAS_SEGUNDOS.labels(view).observe(consultas.segundos)
+
+
+def contar_leituras(sensor_ids):
+    for sensor_id, total in Contagem(sensor_ids).items():
+        LEITURAS_REGISTRADAS.labels(str(sensor_id)).inc(total)
+
+
+def contar_transicao(transicao):
+    TRANSICOES_CONTROLE.labels(transicao).inc()
+
+
+def gerar():
+    """Métricas no formato de texto do Prometheus; retorna (conteúdo, content type)"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return generate_latest(registro), CONTENT_TYPE_LATEST
+
+
+def servir(porta, host="0.0.0.0"):
+    """Serve as métricas deste processo em uma thread (comandos fora do servidor web)"""
+    start_http_server(porta, addr=host)
+
+
+def limpar_diretorio():
+    """Remove os arquivos de execuções anteriores (chamada antes de criar os workers)"""
+    diretorio = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not diretorio:
+        return
+    for nome in os.listdir(diretorio):
+        if nome.endswith(".db"):
+            os.remove(os.path.join(diretorio, nome))
@@ -0,0 +1,180 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metricas
+
+logger = logging.getLogger(__name__)
+
+
+class MetricasMiddleware:
+    """
+    Mede a duração e as consultas ao banco de cada requisição por view
+    (fluxo.metricas). Deve ser o primeiro da lista MIDDLEWARE para incluir
+    o tempo dos demais. Funciona com views síncronas e assíncronas.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        inicio = time.perf_counter()
+        token = metricas.iniciar_requisicao()
+        try:
+            response = self.get_response(request)
+        finally:
+            consultas = metricas.encerrar_requisicao(token)
+        self._registrar(request, response, time.perf_counter() - inicio, consultas)
+        return response
+
+    async def __acall__(self, request):
+        inicio = time.perf_counter()
+        token = metricas.iniciar_requisicao()
+        try:
+            response = await self.get_response(request)
+        finally:
+            consultas = metricas.encerrar_requisicao(token)
+        self._registrar(request, response, time.perf_counter() - inicio, consultas)
+        return response
+
+    def _registrar(self, request, response, segundos, consultas):
+        # Nome da rota (ex.: "fluxo-list"), não o caminho: a cardinalidade fica limitada
+        rota = request.resolver_match.view_name if request.resolver_match else "nao_encontrada"
+        metricas.registrar_requisicao(rota, request.method, response.status_code, segundos, consultas)
+
+
+class ServerTimingMiddleware:
+    """
+    Cabeçalho Server-Timing com o tempo de SQL (e o número de consultas), de
+    serialização da resposta (renderização do DRF) e total de cada requisição.
+    Ativado por ``settings.FLUXO_SERVER_TIMING``.
+
+    As consultas são medidas pelo execute_wrapper de todas as conexões
+    (fluxo.metricas.medir_consulta), então incluem as das views, dos signals e
+    das threads de sync_to_async sem alterá-los. Requisições mais lentas que
+    ``FLUXO_REQUISICAO_LENTA_MS`` são registradas com as consultas mais demoradas.
+
+    Deve vir logo depois de MetricasMiddleware, cuja contagem de consultas é
+    reaproveitada.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.FLUXO_SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        inicio, consultas, token = self._iniciar()
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                metricas.encerrar_requisicao(token)
+        return self._concluir(request, response, time.perf_counter() - inicio, consultas)
+
+    async def __acall__(self, request):
+        inicio, consultas, token = self._iniciar()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                metricas.encerrar_requisicao(token)
+        return self._concluir(request, response, time.perf_counter() - inicio, consultas)
+
+    def process_template_response(self, request, response):
+        """Respostas do DRF são renderizadas logo após este método: mede a renderização"""
+        inicio = time.perf_counter()
+
+        def registrar(response):
+            request.tempo_serializacao = time.perf_counter() - inicio
+
+        response.add_post_render_callback(registrar)
+        return response
+
+    def _iniciar(self):
+        token = None
+        consultas = metricas.consultas_da_requisicao()
+        if consultas is None:
+            # Sem MetricasMiddleware: a contagem começa aqui
+            token = metricas.iniciar_requisicao()
+            consultas = metricas.consultas_da_requisicao()
+        if settings.FLUXO_REQUISICAO_LENTA_MS:
+            consultas.detalhar()
+        return time.perf_counter(), consultas, token
+
+    def _concluir(self, request, response, segundos, consultas):
+        serializacao = getattr(request, "tempo_serializacao", None)
+        metricas_timing = [f'sql;dur={consultas.segundos * 1000:.1f};desc="{consultas.total} consultas"']
+        if serializacao is not None:
+            metricas_timing.append(f"serializacao;dur={serializacao * 1000:.1f}")
+        metricas_timing.append(f"total;dur={segundos * 1000:.1f}")
+        response["Server-Timing"] = ", ".join(metricas_timing)
+
+        limite = settings.FLUXO_REQUISICAO_LENTA_MS
+        if limite and segundos * 1000 >= limite:
+            self._registrar_lenta(request, response, segundos, serializacao, consultas)
+        return response
+
+    def _registrar_lenta(self, request, response, segundos, serializacao, consultas):
+        detalhes = f"SQL {consultas.segundos * 1000:.0f} ms em {consultas.total} consultas"
+        if serializacao is not None:
+            detalhes += f", serialização {serializacao * 1000:.0f} ms"
+        linhas = [
+            f"Requisição lenta: {request.method} {request.get_full_path()} -> {response.status_code} "
+            f"em {segundos * 1000:.0f} ms ({detalhes})"
+        ]
+        for sql, execucoes, tempo in consultas.mais_demoradas(settings.FLUXO_REQUISICAO_LENTA_CONSULTAS):
+            linhas.append(f"   - {tempo * 1000:.1f} ms em {execucoes}x: {sql[:300]}")
+        logger.warning("\n".join(linhas))
+
+
+class ArquivosEstaticosMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware que também funciona em modo assíncrono.
+
+    O WhiteNoiseMiddleware só é síncrono, e um único middleware síncrono faz o
+    Django (ASGI) executar toda a cadeia, inclusive as views assíncronas, em
+    async_to_sync na thread única da requisição. Aqui os arquivos estáticos são
+    servidos em sync_to_async (leitura do disco) e as demais requisições seguem
+    pela cadeia assíncrona.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
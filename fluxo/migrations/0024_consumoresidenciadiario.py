@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:35
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def preencher_consumo_residencia(apps, schema_editor):
+    """Calcula os totais diários a partir das leituras já gravadas"""
+    FluxoAgua = apps.get_model('fluxo', 'FluxoAgua')
+    ConsumoResidenciaDiario = apps.get_model('fluxo', 'ConsumoResidenciaDiario')
+
+    totais = (
+        FluxoAgua.objects.values('data_hora__date')
+        .annotate(total=Sum('valor_diferenca'))
+        .order_by('data_hora__date')
+    )
+    ConsumoResidenciaDiario.objects.bulk_create(
+        [
+            ConsumoResidenciaDiario(data=t['data_hora__date'], consumo_total=t['total'] or Decimal('0.00'))
+            for t in totais
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0023_emailnotification_controlefluxo_email_enviado_hoje'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumoResidenciaDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(unique=True)),
+                ('consumo_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+            ],
+            options={
+                'verbose_name': 'Consumo Diário da Residência',
+                'verbose_name_plural': 'Consumos Diários da Residência',
+            },
+        ),
+        migrations.RunPython(preencher_consumo_residencia, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def preencher_consumo_diario(apps, schema_editor):
+    """Recalcula ConsumoDiario (consumo por sensor e dia) a partir das leituras já gravadas"""
+    FluxoAgua = apps.get_model('fluxo', 'FluxoAgua')
+    ConsumoDiario = apps.get_model('fluxo', 'ConsumoDiario')
+
+    totais = (
+        FluxoAgua.objects.annotate(dia=TruncDate('data_hora'))
+        .values('sensor_id', 'dia')
+        .annotate(total=Sum('valor_diferenca'), ultima=Max('data_hora'))
+        .order_by('dia', 'sensor_id')
+    )
+    ConsumoDiario.objects.all().delete()
+    ConsumoDiario.objects.bulk_create(
+        [
+            ConsumoDiario(
+                sensor_id=t['sensor_id'],
+                data=t['dia'],
+                consumo_total=t['total'] or Decimal('0.00'),
+                hora=timezone.localtime(t['ultima']).time(),
+            )
+            for t in totais
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0024_consumoresidenciadiario'),
+    ]
+
+    operations = [
+        migrations.RunPython(preencher_consumo_diario, migrations.RunPython.noop),
+    ]
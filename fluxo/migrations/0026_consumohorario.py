@@ -0,0 +1,74 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:38
+
+import django.db.models.deletion
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+
+
+def inicio_intervalo(local, minutos):
+    """
+    Início do intervalo de ``minutos`` (contado da meia-noite local) que contém
+    a hora local, como fluxo.rollups.inicio_intervalo (copiado: a migração
+    não depende do módulo)
+    """
+    minuto_dia = local.hour * 60 + local.minute
+    minuto_dia -= minuto_dia % minutos
+    return local.replace(hour=minuto_dia // 60, minute=minuto_dia % 60, second=0, microsecond=0)
+
+
+def preencher_consumo_horario(apps, schema_editor):
+    """Calcula ConsumoHorario a partir das leituras já gravadas"""
+    FluxoAgua = apps.get_model('fluxo', 'FluxoAgua')
+    ConsumoHorario = apps.get_model('fluxo', 'ConsumoHorario')
+    minutos = settings.FLUXO_INTERVALO_MINUTOS
+
+    por_intervalo = defaultdict(Decimal)
+    por_minuto = (
+        FluxoAgua.objects.annotate(minuto=TruncMinute('data_hora'))
+        .values('sensor_id', 'minuto')
+        .annotate(total=Sum('valor_diferenca'))
+        .order_by()
+    )
+    for t in por_minuto.iterator():
+        inicio = inicio_intervalo(timezone.localtime(t['minuto']), minutos)
+        por_intervalo[(t['sensor_id'], inicio)] += t['total'] or Decimal('0.00')
+
+    ConsumoHorario.objects.bulk_create(
+        [
+            ConsumoHorario(sensor_id=sensor_id, inicio=inicio, consumo_total=total)
+            for (sensor_id, inicio), total in por_intervalo.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0025_preencher_consumodiario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumoHorario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('consumo_total', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consumos_horarios', to='fluxo.sensor')),
+            ],
+            options={
+                'verbose_name': 'Consumo Horário',
+                'verbose_name_plural': 'Consumos Horários',
+                'indexes': [models.Index(fields=['inicio'], name='consumohorario_inicio_idx')],
+                'constraints': [models.UniqueConstraint(fields=('sensor', 'inicio'), name='unique_sensor_inicio')],
+            },
+        ),
+        migrations.RunPython(preencher_consumo_horario, migrations.RunPython.noop),
+    ]
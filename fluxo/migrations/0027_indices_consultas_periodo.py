@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0026_consumohorario'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consumodiario',
+            index=models.Index(fields=['data'], name='consumodiario_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fluxoagua',
+            index=models.Index(fields=['sensor', 'data_hora'], name='fluxoagua_sensor_data_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='fluxoagua',
+            index=models.Index(fields=['sensor', '-id'], name='fluxoagua_sensor_id_desc_idx'),
+        ),
+        # Remove o índice simples de sensor_id só depois de criar os compostos
+        migrations.AlterField(
+            model_name='fluxoagua',
+            name='sensor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='leituras', to='fluxo.sensor'),
+        ),
+    ]
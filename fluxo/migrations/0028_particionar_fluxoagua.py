@@ -0,0 +1,131 @@
+from datetime import date, datetime, time
+
+from django.db import migrations
+from django.utils import timezone
+
+# O SQL fica copiado aqui, e não importado de fluxo.particoes: a migração precisa
+# continuar fazendo o mesmo que fez quando foi aplicada, mesmo que o módulo mude.
+TABELA = 'fluxo_fluxoagua'
+PARTICAO_PADRAO = f'{TABELA}_padrao'
+COLUNAS = 'id, sensor_id, data_hora, valor, valor_diferenca'
+MESES_FUTUROS = 3
+
+
+def proximo_mes(ano, mes):
+    return (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+
+def limites_sql(ano, mes):
+    """Cláusula FOR VALUES do mês local, com os limites como literais"""
+    inicio = timezone.make_aware(datetime.combine(date(ano, mes, 1), time.min))
+    fim = timezone.make_aware(datetime.combine(date(*proximo_mes(ano, mes), 1), time.min))
+    return f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fim.isoformat()}')"
+
+
+def particionar(apps, schema_editor):
+    """
+    Converte fluxo_fluxoagua em tabela particionada por mês (apenas PostgreSQL),
+    copiando os dados. O id deixa de ser IDENTITY (não suportado em tabelas
+    particionadas antes do PostgreSQL 17) e passa a usar uma sequência própria;
+    a chave primária passa a ser (id, data_hora).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    hoje = timezone.localdate()
+    nova = f'{TABELA}_nova'
+    sequencia = f'{TABELA}_nova_id_seq'
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {TABELA} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'SELECT MIN(data_hora), COALESCE(MAX(id), 0) FROM {TABELA}')
+        mais_antiga, maior_id = cursor.fetchone()
+
+        cursor.execute(f'CREATE SEQUENCE {sequencia}')
+        cursor.execute(
+            f"""
+            CREATE TABLE {nova} (
+                id bigint NOT NULL DEFAULT nextval('{sequencia}'),
+                sensor_id bigint NOT NULL
+                    REFERENCES fluxo_sensor (id) DEFERRABLE INITIALLY DEFERRED,
+                data_hora timestamp with time zone NOT NULL,
+                valor numeric(10, 2) NOT NULL,
+                valor_diferenca numeric(10, 2) NULL,
+                PRIMARY KEY (id, data_hora)
+            ) PARTITION BY RANGE (data_hora)
+            """
+        )
+        cursor.execute(f'ALTER SEQUENCE {sequencia} OWNED BY {nova}.id')
+        cursor.execute(f'CREATE TABLE {PARTICAO_PADRAO} PARTITION OF {nova} DEFAULT')
+
+        # Uma partição por mês, da leitura mais antiga até MESES_FUTUROS meses à frente
+        ultimo = (hoje.year, hoje.month)
+        for _ in range(MESES_FUTUROS):
+            ultimo = proximo_mes(*ultimo)
+        ano, mes = (hoje.year, hoje.month)
+        if mais_antiga:
+            local = timezone.localtime(mais_antiga)
+            ano, mes = min((ano, mes), (local.year, local.month))
+        while (ano, mes) <= ultimo:
+            cursor.execute(
+                f'CREATE TABLE {TABELA}_p{ano:04d}_{mes:02d} PARTITION OF {nova} {limites_sql(ano, mes)}'
+            )
+            ano, mes = proximo_mes(ano, mes)
+
+        cursor.execute(f'INSERT INTO {nova} ({COLUNAS}) SELECT {COLUNAS} FROM {TABELA}')
+        # Valida a FK agora: CREATE INDEX falha com verificações adiadas pendentes
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute('SELECT setval(%s, %s, %s)', [sequencia, max(maior_id, 1), maior_id > 0])
+
+        cursor.execute(f'DROP TABLE {TABELA}')
+        cursor.execute(f'ALTER TABLE {nova} RENAME TO {TABELA}')
+        cursor.execute(f'ALTER SEQUENCE {sequencia} RENAME TO {TABELA}_id_seq')
+        cursor.execute(f'ALTER INDEX {nova}_pkey RENAME TO {TABELA}_pkey')
+        # Índices de FluxoAgua.Meta (criados no pai e propagados às partições)
+        cursor.execute(f'CREATE INDEX fluxoagua_sensor_data_idx ON {TABELA} (sensor_id, data_hora)')
+        cursor.execute(f'CREATE INDEX fluxoagua_sensor_id_desc_idx ON {TABELA} (sensor_id, id DESC)')
+
+
+def desfazer(apps, schema_editor):
+    """Converte fluxo_fluxoagua de volta para uma tabela comum"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    antiga = f'{TABELA}_particionada'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {TABELA} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'ALTER TABLE {TABELA} RENAME TO {antiga}')
+        cursor.execute(f'ALTER INDEX {TABELA}_pkey RENAME TO {antiga}_pkey')
+        cursor.execute('ALTER INDEX fluxoagua_sensor_data_idx RENAME TO fluxoagua_sensor_data_idx_antigo')
+        cursor.execute('ALTER INDEX fluxoagua_sensor_id_desc_idx RENAME TO fluxoagua_sensor_id_desc_idx_antigo')
+        cursor.execute(
+            f"""
+            CREATE TABLE {TABELA} (
+                id bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+                sensor_id bigint NOT NULL
+                    REFERENCES fluxo_sensor (id) DEFERRABLE INITIALLY DEFERRED,
+                data_hora timestamp with time zone NOT NULL,
+                valor numeric(10, 2) NOT NULL,
+                valor_diferenca numeric(10, 2) NULL
+            )
+            """
+        )
+        cursor.execute(f'INSERT INTO {TABELA} ({COLUNAS}) SELECT {COLUNAS} FROM {antiga}')
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABELA}', 'id'), COALESCE(MAX(id), 1), MAX(id) IS NOT NULL) "
+            f'FROM {TABELA}'
+        )
+        cursor.execute(f'DROP TABLE {antiga}')
+        cursor.execute(f'CREATE INDEX fluxoagua_sensor_data_idx ON {TABELA} (sensor_id, data_hora)')
+        cursor.execute(f'CREATE INDEX fluxoagua_sensor_id_desc_idx ON {TABELA} (sensor_id, id DESC)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0027_indices_consultas_periodo'),
+    ]
+
+    operations = [
+        # O estado dos modelos não muda: a tabela continua sendo FluxoAgua para o ORM
+        migrations.RunPython(particionar, desfazer),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fluxo', '0028_particionar_fluxoagua'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiaCompactado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(unique=True)),
+                ('concluido', models.BooleanField(default=False)),
+                ('leituras_removidas', models.PositiveIntegerField(default=0)),
+                ('data_hora_atualizacao', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Dia Compactado',
+                'verbose_name_plural': 'Dias Compactados',
+            },
+        ),
+    ]
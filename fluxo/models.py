@@ -1,6 +1,25 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
 
+
+def _atualizar_ou_criar(model, chave, atualizacao, criacao):
+    """
+    Aplica um UPDATE atômico (expressões F()) na linha identificada por ``chave``.
+    Se a linha ainda não existe ela é criada; se outra transação criá-la ao
+    mesmo tempo (violação da constraint única), o UPDATE é refeito.
+    """
+    if model.objects.filter(**chave).update(**atualizacao):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**chave, **criacao)
+    except IntegrityError:
+        model.objects.filter(**chave).update(**atualizacao)
+
 class Sensor(models.Model):
     nome = models.CharField(max_length=50, unique=True)
 
@@ -8,15 +27,25 @@ class Sensor(models.Model):
         return self.nome
 
 class FluxoAgua(models.Model):
-    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name="leituras")
+    # Sem índice próprio: os índices compostos abaixo começam por sensor
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name="leituras", db_index=False)
     data_hora = models.DateTimeField(default=timezone.now)
     valor = models.DecimalField(max_digits=10, decimal_places=2)  # litros instantâneos
     valor_diferenca = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)  # diferença entre valor atual e anterior
 
+    class Meta:
+        indexes = [
+            # Consultas por sensor e período (filtros com intervalos de data_hora)
+            models.Index(fields=["sensor", "data_hora"], name="fluxoagua_sensor_data_idx"),
+            # Última leitura do sensor: ORDER BY id DESC LIMIT 1
+            models.Index(fields=["sensor", "-id"], name="fluxoagua_sensor_id_desc_idx"),
+        ]
+
     def __str__(self):
         return f"{self.sensor.nome} - {self.data_hora} - {self.valor} L"
 
 class ConsumoDiario(models.Model):
+    """Consumo de cada sensor por dia, acumulado a cada leitura (ver fluxo.rollups)"""
     sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name="consumos_diarios")
     data = models.DateField()
     consumo_total = models.DecimalField(max_digits=10, decimal_places=2)
@@ -26,10 +55,110 @@ class ConsumoDiario(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["sensor", "data"], name="unique_sensor_data")
         ]
+        indexes = [
+            # Consultas de todos os sensores em um dia ou mês
+            models.Index(fields=["data"], name="consumodiario_data_idx"),
+        ]
 
     def __str__(self):
         return f"{self.sensor.nome} - {self.data} - {self.consumo_total} L"
 
+    @classmethod
+    def acumular(cls, sensor_id, data, quantidade, hora=None):
+        """Soma a quantidade ao consumo do sensor no dia; ``hora`` guarda a hora da última leitura"""
+        atualizacao = {"consumo_total": F("consumo_total") + quantidade}
+        if hora is not None:
+            atualizacao["hora"] = Coalesce(Greatest(F("hora"), Value(hora)), Value(hora))
+        _atualizar_ou_criar(
+            cls,
+            {"sensor_id": sensor_id, "data": data},
+            atualizacao,
+            {"consumo_total": quantidade, "hora": hora},
+        )
+
+
+class ConsumoHorario(models.Model):
+    """
+    Consumo de cada sensor por intervalo do dia (settings.FLUXO_INTERVALO_MINUTOS),
+    acumulado a cada leitura. ``inicio`` é o início do intervalo.
+    """
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name="consumos_horarios")
+    inicio = models.DateTimeField()
+    consumo_total = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        verbose_name = "Consumo Horário"
+        verbose_name_plural = "Consumos Horários"
+        constraints = [
+            models.UniqueConstraint(fields=["sensor", "inicio"], name="unique_sensor_inicio")
+        ]
+        indexes = [
+            models.Index(fields=["inicio"], name="consumohorario_inicio_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.sensor.nome} - {self.inicio} - {self.consumo_total} L"
+
+    @classmethod
+    def acumular(cls, sensor_id, inicio, quantidade):
+        """Soma a quantidade ao consumo do sensor no intervalo iniciado em ``inicio``"""
+        _atualizar_ou_criar(
+            cls,
+            {"sensor_id": sensor_id, "inicio": inicio},
+            {"consumo_total": F("consumo_total") + quantidade},
+            {"consumo_total": quantidade},
+        )
+
+
+class ConsumoResidenciaDiario(models.Model):
+    """Consumo total da residência (todos os sensores) por dia, acumulado a cada leitura"""
+    data = models.DateField(unique=True)
+    consumo_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+
+    class Meta:
+        verbose_name = "Consumo Diário da Residência"
+        verbose_name_plural = "Consumos Diários da Residência"
+
+    def __str__(self):
+        return f"{self.data} - {self.consumo_total} L"
+
+    @classmethod
+    def acumular(cls, data, quantidade):
+        """Soma a quantidade ao total do dia com um UPDATE atômico (F())"""
+        _atualizar_ou_criar(
+            cls,
+            {"data": data},
+            {"consumo_total": F("consumo_total") + quantidade},
+            {"consumo_total": quantidade},
+        )
+
+    @classmethod
+    def consumo_do_dia(cls, data):
+        """Retorna o consumo acumulado do dia (0 se ainda não houve leituras)"""
+        total = cls.objects.filter(data=data).values_list("consumo_total", flat=True).first()
+        return total if total is not None else Decimal("0.00")
+
+
+class DiaCompactado(models.Model):
+    """
+    Dia cujas leituras brutas foram removidas pelo comando compact_readings.
+    Os consumos consolidados desses dias passam a ser a única fonte e não são
+    recalculados por rebuild_consumo_diario. ``concluido`` fica falso enquanto
+    a remoção em lotes não termina (permite retomar o comando).
+    """
+    data = models.DateField(unique=True)
+    concluido = models.BooleanField(default=False)
+    leituras_removidas = models.PositiveIntegerField(default=0)
+    data_hora_atualizacao = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Dia Compactado"
+        verbose_name_plural = "Dias Compactados"
+
+    def __str__(self):
+        status = "Concluído" if self.concluido else "Em andamento"
+        return f"{self.data} - {self.leituras_removidas} leituras removidas - {status}"
+
 
 class MetaConsumo(models.Model):
     meta_diaria_litros = models.DecimalField(max_digits=10, decimal_places=2)
@@ -87,3 +216,36 @@ class EmailNotification(models.Model):
         status = "Ativo" if self.ativo else "Inativo"
         return f"{self.email} - {status}"
 
+
+class EmailOutbox(models.Model):
+    """
+    Email aguardando envio pelo comando run_email_worker. A mensagem é gravada
+    na mesma transação que decide a notificação, então a requisição que
+    ultrapassa a meta não espera pelo SMTP e nenhum alerta se perde.
+    """
+    STATUS_CHOICES = [
+        ('pendente', 'Pendente'),
+        ('enviado', 'Enviado'),
+        ('falhou', 'Falhou'),
+    ]
+
+    assunto = models.CharField(max_length=255)
+    corpo = models.TextField()
+    destinatarios = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pendente')
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    ultimo_erro = models.TextField(blank=True, default='')
+    data_criacao = models.DateTimeField(auto_now_add=True)
+    data_envio = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Email na Fila"
+        verbose_name_plural = "Emails na Fila"
+        indexes = [
+            # Próximos emails a enviar: status = 'pendente' AND proxima_tentativa <= agora
+            models.Index(fields=["status", "proxima_tentativa"], name="emailoutbox_fila_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.assunto} - {self.status} ({self.tentativas} tentativas)"
@@ -0,0 +1,17 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class LeituraCursorPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset) das leituras, da mais recente para a mais antiga.
+
+    A posição da página é o id da última leitura retornada (WHERE id < cursor),
+    então o custo de cada página não depende de quantas páginas vieram antes.
+    O id é único e cresce com a chegada das leituras, servindo de desempate
+    natural para leituras com a mesma data_hora.
+    """
+    ordering = "-id"
+    page_size = settings.FLUXO_PAGINA_LEITURAS
+    page_size_query_param = "tamanho"
+    max_page_size = settings.FLUXO_PAGINA_LEITURAS_MAX
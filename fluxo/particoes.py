@@ -0,0 +1,135 @@
+"""
+Particionamento mensal de fluxo_fluxoagua no PostgreSQL (PARTITION BY RANGE data_hora).
+
+Cada partição cobre um mês no fuso local (TIME_ZONE), de forma que os
+intervalos calculados em fluxo.periodos descartem as partições fora do
+período. Uma partição padrão recebe leituras de meses ainda não criados.
+
+A conversão da tabela é feita pela migração 0028_particionar_fluxoagua, que
+tem o próprio SQL; este módulo é usado pelo comando manage_partitions. Nos
+demais bancos a tabela continua comum e estas funções não se aplicam.
+"""
+import re
+
+from .periodos import datas_do_mes, inicio_do_dia
+
+TABELA = "fluxo_fluxoagua"
+PARTICAO_PADRAO = f"{TABELA}_padrao"
+PADRAO_NOME = re.compile(rf"^{TABELA}_p(\d{{4}})_(\d{{2}})$")
+
+COLUNAS = "id, sensor_id, data_hora, valor, valor_diferenca"
+
+
+def nome_particao(ano, mes):
+    return f"{TABELA}_p{ano:04d}_{mes:02d}"
+
+
+def proximo_mes(ano, mes):
+    return (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+
+
+def meses_entre(inicio, fim):
+    """Gera (ano, mes) de inicio a fim, inclusive"""
+    ano, mes = inicio
+    while (ano, mes) <= fim:
+        yield ano, mes
+        ano, mes = proximo_mes(ano, mes)
+
+
+def limites_particao(ano, mes):
+    """Início e fim (exclusivo) do mês local como datas/horas aware"""
+    primeiro_dia, proximo = datas_do_mes(ano, mes)
+    return inicio_do_dia(primeiro_dia), inicio_do_dia(proximo)
+
+
+def limites_sql(inicio, fim):
+    """
+    Cláusula FOR VALUES da partição. Os limites entram como literais: comandos
+    DDL não aceitam parâmetros com server_side_binding (settings.DATABASES)
+    """
+    return f"FOR VALUES FROM ('{inicio.isoformat()}') TO ('{fim.isoformat()}')"
+
+
+def esta_particionada(cursor):
+    cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [TABELA])
+    linha = cursor.fetchone()
+    return bool(linha) and linha[0] == "p"
+
+
+def listar_particoes(cursor):
+    """Retorna [(ano, mes, nome)] das partições mensais anexadas, em ordem"""
+    cursor.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+        """,
+        [TABELA],
+    )
+    particoes = []
+    for (nome,) in cursor.fetchall():
+        encontrado = PADRAO_NOME.match(nome)
+        if encontrado:
+            particoes.append((int(encontrado.group(1)), int(encontrado.group(2)), nome))
+    return sorted(particoes)
+
+
+def criar_particao(cursor, ano, mes):
+    """
+    Cria a partição do mês se ainda não existir. Leituras do mês que estejam
+    na partição padrão são movidas para a nova partição.
+    Retorna True se a partição foi criada.
+    """
+    nome = nome_particao(ano, mes)
+    cursor.execute("SELECT to_regclass(%s)", [nome])
+    if cursor.fetchone()[0]:
+        return False
+
+    inicio, fim = limites_particao(ano, mes)
+    cursor.execute(
+        f"SELECT EXISTS (SELECT 1 FROM {PARTICAO_PADRAO} WHERE data_hora >= %s AND data_hora < %s)",
+        [inicio, fim],
+    )
+    if cursor.fetchone()[0]:
+        # O PostgreSQL não cria uma partição cujo intervalo já tem linhas na partição padrão
+        cursor.execute(f"ALTER TABLE {TABELA} DETACH PARTITION {PARTICAO_PADRAO}")
+        cursor.execute(f"CREATE TABLE {nome} (LIKE {TABELA} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"INSERT INTO {nome} ({COLUNAS}) SELECT {COLUNAS} FROM {PARTICAO_PADRAO} "
+            "WHERE data_hora >= %s AND data_hora < %s",
+            [inicio, fim],
+        )
+        cursor.execute(
+            f"DELETE FROM {PARTICAO_PADRAO} WHERE data_hora >= %s AND data_hora < %s", [inicio, fim]
+        )
+        cursor.execute(f"ALTER TABLE {TABELA} ATTACH PARTITION {nome} {limites_sql(inicio, fim)}")
+        cursor.execute(f"ALTER TABLE {TABELA} ATTACH PARTITION {PARTICAO_PADRAO} DEFAULT")
+    else:
+        cursor.execute(f"CREATE TABLE {nome} PARTITION OF {TABELA} {limites_sql(inicio, fim)}")
+    return True
+
+
+def desanexar_particao(cursor, nome, remover=False):
+    """
+    Desanexa (e opcionalmente remove) uma partição mensal.
+
+    A última leitura de cada sensor é preservada: se ela estiver na partição,
+    é copiada de volta para a tabela (cai na partição padrão, já que o mês
+    deixou de ter partição), para que a próxima diferença continue correta.
+    """
+    cursor.execute(f"ALTER TABLE {TABELA} DETACH PARTITION {nome}")
+    cursor.execute(
+        f"""
+        INSERT INTO {TABELA} ({COLUNAS})
+        SELECT {COLUNAS} FROM {nome}
+        WHERE id IN (SELECT MAX(id) FROM {nome} GROUP BY sensor_id)
+          AND NOT EXISTS (
+              SELECT 1 FROM {TABELA} t
+              WHERE t.sensor_id = {nome}.sensor_id AND t.id > {nome}.id
+          )
+        """
+    )
+    if remover:
+        cursor.execute(f"DROP TABLE {nome}")
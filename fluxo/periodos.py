@@ -0,0 +1,62 @@
+"""
+Limites de períodos no fuso local (TIME_ZONE) como datas/horas aware.
+
+Filtrar por ``data_hora__date``, ``__year`` ou ``__month`` converte o fuso de
+cada linha no banco e impede o uso de índices em data_hora. Os limites são
+calculados uma vez aqui e as consultas usam intervalos semiabertos
+``data_hora >= inicio AND data_hora < fim``.
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def inicio_do_dia(dia):
+    """Meia-noite local do dia, aware"""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def intervalo_do_dia(dia):
+    """(inicio, fim) do dia local: [00:00 do dia, 00:00 do dia seguinte)"""
+    return inicio_do_dia(dia), inicio_do_dia(dia + timedelta(days=1))
+
+
+def intervalo_de_datas(primeiro_dia, ultimo_dia):
+    """(inicio, fim) cobrindo os dias de primeiro_dia a ultimo_dia, inclusive"""
+    return inicio_do_dia(primeiro_dia), inicio_do_dia(ultimo_dia + timedelta(days=1))
+
+
+def datas_do_mes(ano, mes):
+    """(primeiro dia do mês, primeiro dia do mês seguinte), para filtros em DateField"""
+    proximo = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+    return date(ano, mes, 1), proximo
+
+
+def datas_do_ano(ano):
+    """(1º de janeiro do ano, 1º de janeiro do ano seguinte), para filtros em DateField"""
+    return date(ano, 1, 1), date(ano + 1, 1, 1)
+
+
+GRANULARIDADES = ("dia", "semana", "mes", "ano")
+
+
+def inicio_do_periodo(dia, granularidade):
+    """Primeiro dia do período (dia, semana iniciada na segunda, mês ou ano) que contém o dia"""
+    if granularidade == "semana":
+        return dia - timedelta(days=dia.weekday())
+    if granularidade == "mes":
+        return dia.replace(day=1)
+    if granularidade == "ano":
+        return dia.replace(month=1, day=1)
+    return dia
+
+
+def numero_de_periodos(primeiro_dia, ultimo_dia, granularidade):
+    """Quantidade de períodos da granularidade que cobrem os dias de primeiro_dia a ultimo_dia"""
+    if granularidade == "ano":
+        return ultimo_dia.year - primeiro_dia.year + 1
+    if granularidade == "mes":
+        return (ultimo_dia.year - primeiro_dia.year) * 12 + ultimo_dia.month - primeiro_dia.month + 1
+    inicio = inicio_do_periodo(primeiro_dia, granularidade)
+    dias = (inicio_do_periodo(ultimo_dia, granularidade) - inicio).days
+    return dias // 7 + 1 if granularidade == "semana" else dias + 1
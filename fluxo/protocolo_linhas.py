@@ -0,0 +1,73 @@
+"""
+Protocolo de linhas do comando run_ingest_server.
+
+Cada leitura é uma linha de texto ``sensor valor [timestamp]``, separada por
+espaços, por exemplo ``3 1523.75 1735689600``:
+
+- sensor: id do sensor
+- valor: valor acumulado do hidrômetro (aceita vírgula como separador decimal)
+- timestamp (opcional): segundos desde a época (UTC) ou data/hora ISO 8601;
+  sem ele vale a hora de chegada
+
+As leituras decodificadas são gravadas em lotes por
+``ingestao.registrar_leituras_existentes``, com as mesmas regras do POST
+/fluxo/ (diferença, totais e meta). Leituras anteriores à última já gravada
+do sensor são descartadas.
+"""
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def interpretar_linha(linha):
+    """Converte uma linha em um dict de leitura; levanta ValueError se for inválida"""
+    partes = linha.split()
+    if len(partes) not in (2, 3):
+        raise ValueError("formato esperado: sensor valor [timestamp]")
+    return interpretar_leitura(*partes)
+
+
+def interpretar_leitura(sensor, valor, data_hora=None):
+    """
+    Valida e converte os campos de uma leitura (textos ou números) em um dict
+    com sensor, valor e data_hora; sem data_hora vale a hora atual.
+    Levanta ValueError se algum campo for inválido.
+    """
+    try:
+        sensor = int(str(sensor))
+    except ValueError:
+        raise ValueError("sensor deve ser um número inteiro")
+    if sensor < 1:
+        raise ValueError("sensor deve ser um número inteiro")
+
+    try:
+        valor = Decimal(str(valor).strip().replace(",", "."))
+    except InvalidOperation:
+        raise ValueError("valor deve ser um número válido")
+    if not valor.is_finite() or abs(valor) >= Decimal("1e8"):
+        raise ValueError("valor fora do intervalo permitido")
+
+    if data_hora is None:
+        data_hora = timezone.now()
+    else:
+        data_hora = _interpretar_timestamp(str(data_hora).strip())
+        if timezone.is_naive(data_hora):
+            data_hora = timezone.make_aware(data_hora)
+    return {"sensor": sensor, "valor": valor.quantize(Decimal("0.01")), "data_hora": data_hora}
+
+
+def _interpretar_timestamp(texto):
+    try:
+        return datetime.fromtimestamp(float(texto), tz=dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+    try:
+        data_hora = parse_datetime(texto)
+    except ValueError:
+        data_hora = None
+    if data_hora is None:
+        raise ValueError("timestamp deve ser epoch em segundos ou data/hora ISO 8601")
+    return data_hora
@@ -0,0 +1,76 @@
+"""
+Retenção das leituras brutas de FluxoAgua.
+
+Dias antigos são consolidados em ConsumoDiario, ConsumoResidenciaDiario e
+ConsumoHorario e depois têm suas leituras removidas em lotes pequenos, cada
+um em sua própria transação, para não segurar locks longos. O andamento fica
+em DiaCompactado, o que permite interromper e retomar o comando.
+
+A última leitura de cada sensor nunca é removida: ela é a base da diferença
+da próxima leitura (ver fluxo.ingestao).
+"""
+import time
+
+from django.db import transaction
+from django.db.models import F, Max
+from django.db.models.functions import TruncDate
+
+from .models import DiaCompactado, FluxoAgua
+from .periodos import intervalo_do_dia
+from .rollups import reconstruir_consumos
+
+
+def ultimas_leituras_ids():
+    """Ids da última leitura (maior id) de cada sensor"""
+    return set(
+        FluxoAgua.objects.values("sensor_id").annotate(ultimo_id=Max("id")).values_list("ultimo_id", flat=True)
+    )
+
+
+def dias_para_compactar(limite):
+    """Dias locais anteriores a ``limite`` que ainda têm leituras e não foram concluídos"""
+    inicio_limite, _ = intervalo_do_dia(limite)
+    concluidos = DiaCompactado.objects.filter(concluido=True, data__lt=limite).values_list("data", flat=True)
+    return list(
+        FluxoAgua.objects.filter(data_hora__lt=inicio_limite)
+        .annotate(dia=TruncDate("data_hora"))
+        .exclude(dia__in=list(concluidos))
+        .values_list("dia", flat=True)
+        .distinct()
+        .order_by("dia")
+    )
+
+
+def compactar_dia(dia, preservar, lote=5000, pausa=0):
+    """
+    Consolida os totais do dia e remove suas leituras brutas em lotes de ``lote``
+    linhas, exceto as de id em ``preservar``. Retorna o número de leituras removidas.
+
+    Na primeira passada os consumos do dia são recalculados e o dia é marcado em
+    DiaCompactado na mesma transação; ao retomar um dia já marcado, apenas a
+    remoção continua (os totais não podem mais ser recalculados).
+    """
+    with transaction.atomic():
+        if not DiaCompactado.objects.filter(data=dia).exists():
+            reconstruir_consumos(dia, dia)
+            DiaCompactado.objects.create(data=dia)
+
+    inicio, fim = intervalo_do_dia(dia)
+    leituras = FluxoAgua.objects.filter(data_hora__gte=inicio, data_hora__lt=fim).exclude(id__in=preservar)
+    total = 0
+    while True:
+        with transaction.atomic():
+            ids = list(leituras.values_list("id", flat=True)[:lote])
+            if not ids:
+                DiaCompactado.objects.filter(data=dia).update(concluido=True)
+                return total
+            # data_hora no filtro permite descartar as demais partições no PostgreSQL
+            removidas, _ = FluxoAgua.objects.filter(
+                id__in=ids, data_hora__gte=inicio, data_hora__lt=fim
+            ).delete()
+            DiaCompactado.objects.filter(data=dia).update(
+                leituras_removidas=F("leituras_removidas") + removidas
+            )
+        total += removidas
+        if pausa:
+            time.sleep(pausa)
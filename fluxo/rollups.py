@@ -0,0 +1,176 @@
+"""
+Totais de consumo mantidos de forma incremental a cada leitura gravada.
+
+- ConsumoHorario: consumo de cada sensor por intervalo (FLUXO_INTERVALO_MINUTOS)
+- ConsumoDiario: consumo de cada sensor por dia
+- ConsumoResidenciaDiario: consumo da residência (todos os sensores) por dia
+
+As funções de acumulação devem ser chamadas na mesma transação que grava
+(ou remove) as leituras, para que os totais nunca divirjam de FluxoAgua.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.db.models.functions import TruncDate, TruncMinute
+from django.utils import timezone
+
+from . import historico, versoes
+from .models import ConsumoDiario, ConsumoHorario, ConsumoResidenciaDiario, DiaCompactado, FluxoAgua
+from .periodos import inicio_do_dia
+
+MINUTOS_DIA = 24 * 60
+
+
+def hora_local(data_hora):
+    """Data/hora convertida para o fuso local (TIME_ZONE)"""
+    if timezone.is_naive(data_hora):
+        data_hora = timezone.make_aware(data_hora)
+    return timezone.localtime(data_hora)
+
+
+def dia_local(data_hora):
+    """Data local (TIME_ZONE) de uma data/hora"""
+    return hora_local(data_hora).date()
+
+
+def inicio_intervalo(data_hora, minutos=None):
+    """
+    Início (hora local) do intervalo de ``minutos`` que contém a data/hora.
+    Os intervalos começam à meia-noite local: ``minutos`` deve dividir MINUTOS_DIA.
+    """
+    minutos = minutos or settings.FLUXO_INTERVALO_MINUTOS
+    local = hora_local(data_hora)
+    minuto_dia = local.hour * 60 + local.minute
+    minuto_dia -= minuto_dia % minutos
+    return local.replace(hour=minuto_dia // 60, minute=minuto_dia % 60, second=0, microsecond=0)
+
+
+def acumular_leituras(leituras, sinal=1):
+    """
+    Soma o valor_diferenca das leituras aos totais diários.
+    Use sinal=-1 para descontar leituras removidas ou antes de uma edição.
+    """
+    por_sensor_dia = defaultdict(Decimal)
+    por_sensor_intervalo = defaultdict(Decimal)
+    ultima_hora = {}
+    for leitura in leituras:
+        local = hora_local(leitura.data_hora)
+        diferenca = leitura.valor_diferenca or Decimal("0.00")
+        chave = (leitura.sensor_id, local.date())
+        por_sensor_dia[chave] += diferenca
+        por_sensor_intervalo[(leitura.sensor_id, inicio_intervalo(local))] += diferenca
+        ultima_hora[chave] = max(ultima_hora.get(chave, local.time()), local.time())
+
+    for (sensor_id, inicio), total in por_sensor_intervalo.items():
+        if total or sinal > 0:
+            ConsumoHorario.acumular(sensor_id, inicio, sinal * total)
+
+    por_dia = defaultdict(Decimal)
+    for (sensor_id, dia), total in por_sensor_dia.items():
+        por_dia[dia] += total
+        if not total and sinal < 0:
+            continue
+        ConsumoDiario.acumular(
+            sensor_id, dia, sinal * total, hora=ultima_hora[(sensor_id, dia)] if sinal > 0 else None
+        )
+
+    for dia, total in por_dia.items():
+        if total:
+            ConsumoResidenciaDiario.acumular(dia, sinal * total)
+
+    # Leitura de um dia já encerrado (atrasada, editada ou removida) altera o histórico
+    if any(dia < timezone.localdate() for dia in por_dia):
+        transaction.on_commit(historico.invalidar)
+    # Novas leituras mudam o maior id de FluxoAgua (ETag das consultas de consumo);
+    # edições e remoções não, então mudam a versão "consumo"
+    if sinal < 0:
+        transaction.on_commit(lambda: versoes.incrementar("consumo"))
+
+
+def reconstruir_consumos(inicio=None, fim=None):
+    """
+    Recalcula ConsumoDiario, ConsumoResidenciaDiario e ConsumoHorario a partir
+    de FluxoAgua para os dias de ``inicio`` a ``fim`` (inclusive; None = sem limite).
+
+    Dias compactados (DiaCompactado) são preservados: suas leituras brutas já
+    foram removidas e os totais consolidados são a única fonte.
+
+    Retorna o número de linhas de ConsumoDiario geradas.
+    """
+    leituras = FluxoAgua.objects.annotate(dia=TruncDate("data_hora"))
+    consumos = ConsumoDiario.objects.all()
+    consumos_residencia = ConsumoResidenciaDiario.objects.all()
+    consumos_horarios = ConsumoHorario.objects.annotate(dia=TruncDate("inicio"))
+    compactados = DiaCompactado.objects.all()
+    if inicio:
+        leituras = leituras.filter(data_hora__gte=inicio_do_dia(inicio))
+        consumos = consumos.filter(data__gte=inicio)
+        consumos_residencia = consumos_residencia.filter(data__gte=inicio)
+        consumos_horarios = consumos_horarios.filter(inicio__gte=inicio_do_dia(inicio))
+        compactados = compactados.filter(data__gte=inicio)
+    if fim:
+        fim_exclusivo = inicio_do_dia(fim + timedelta(days=1))
+        leituras = leituras.filter(data_hora__lt=fim_exclusivo)
+        consumos = consumos.filter(data__lte=fim)
+        consumos_residencia = consumos_residencia.filter(data__lte=fim)
+        consumos_horarios = consumos_horarios.filter(inicio__lt=fim_exclusivo)
+        compactados = compactados.filter(data__lte=fim)
+
+    dias_compactados = list(compactados.values_list("data", flat=True))
+    if dias_compactados:
+        leituras = leituras.exclude(dia__in=dias_compactados)
+        consumos = consumos.exclude(data__in=dias_compactados)
+        consumos_residencia = consumos_residencia.exclude(data__in=dias_compactados)
+        consumos_horarios = consumos_horarios.exclude(dia__in=dias_compactados)
+
+    totais = (
+        leituras.values("sensor_id", "dia")
+        .annotate(total=Sum("valor_diferenca"), ultima=Max("data_hora"))
+        .order_by("dia", "sensor_id")
+    )
+
+    novos = []
+    por_dia = defaultdict(Decimal)
+    for t in totais:
+        total = t["total"] or Decimal("0.00")
+        por_dia[t["dia"]] += total
+        novos.append(
+            ConsumoDiario(
+                sensor_id=t["sensor_id"], data=t["dia"], consumo_total=total,
+                hora=hora_local(t["ultima"]).time(),
+            )
+        )
+
+    # Agrupa por minuto no banco e soma os minutos de cada intervalo aqui
+    por_intervalo = defaultdict(Decimal)
+    por_minuto = (
+        leituras.annotate(minuto=TruncMinute("data_hora"))
+        .values("sensor_id", "minuto")
+        .annotate(total=Sum("valor_diferenca"))
+        .order_by()
+    )
+    for t in por_minuto.iterator():
+        por_intervalo[(t["sensor_id"], inicio_intervalo(t["minuto"]))] += t["total"] or Decimal("0.00")
+
+    with transaction.atomic():
+        consumos.delete()
+        consumos_residencia.delete()
+        consumos_horarios.delete()
+        ConsumoDiario.objects.bulk_create(novos, batch_size=1000)
+        ConsumoResidenciaDiario.objects.bulk_create(
+            [ConsumoResidenciaDiario(data=dia, consumo_total=total) for dia, total in por_dia.items()],
+            batch_size=1000,
+        )
+        ConsumoHorario.objects.bulk_create(
+            [
+                ConsumoHorario(sensor_id=sensor_id, inicio=inicio_local, consumo_total=total)
+                for (sensor_id, inicio_local), total in por_intervalo.items()
+            ],
+            batch_size=1000,
+        )
+        transaction.on_commit(historico.invalidar)
+    return len(novos)
@@ -25,6 +25,38 @@ class FluxoAguaSerializer(serializers.ModelSerializer):
                 )
         return value
 
+class ValorLeituraField(serializers.DecimalField):
+    """DecimalField que aceita vírgula como separador decimal"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = data.strip().replace(',', '.')
+        return super().to_internal_value(data)
+
+
+class LeituraLoteListSerializer(serializers.ListSerializer):
+    def validate(self, attrs):
+        """Verifica a existência de todos os sensores do lote em uma única consulta"""
+        sensor_ids = {leitura["sensor"] for leitura in attrs}
+        existentes = set(Sensor.objects.filter(id__in=sensor_ids).values_list("id", flat=True))
+        inexistentes = sorted(sensor_ids - existentes)
+        if inexistentes:
+            raise serializers.ValidationError(
+                f"Sensores inexistentes: {', '.join(str(s) for s in inexistentes)}"
+            )
+        return attrs
+
+
+class LeituraLoteSerializer(serializers.Serializer):
+    """Leitura individual da ingestão em lote (POST /fluxo/bulk/)"""
+    sensor = serializers.IntegerField(min_value=1)
+    valor = ValorLeituraField(max_digits=10, decimal_places=2)
+    data_hora = serializers.DateTimeField(required=False)
+
+    class Meta:
+        list_serializer_class = LeituraLoteListSerializer
+
+
 class ConsumoDiarioSerializer(serializers.ModelSerializer):
     class Meta:
         model = ConsumoDiario
@@ -1,14 +1,20 @@
-from decimal import Decimal
-from django.db.models.signals import post_save
+import logging
+
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.db import transaction
 from django.dispatch import receiver
 from django.utils import timezone
-from django.db.models import Sum
-from django.core.mail import send_mail
-from django.conf import settings
-from .models import FluxoAgua, ControleFluxo, MetaConsumo, EmailNotification
+from . import configuracao, controle_fluxo, estado_sensores, historico, metricas, versoes
+from .email_outbox import enfileirar_email
+from .models import FluxoAgua, ConsumoResidenciaDiario, ControleFluxo, MetaConsumo, EmailNotification, Sensor
+from .rollups import acumular_leituras
+
+logger = logging.getLogger(__name__)
 
 
 @receiver(post_save, sender=FluxoAgua)
+@metricas.SIGNAL_LEITURA_SEGUNDOS.time()
 def verificar_consumo_e_controlar_fluxo(sender, instance, created, **kwargs):
     """
     Signal que verifica o consumo diário após cada registro de FluxoAgua.
@@ -16,60 +22,151 @@ def verificar_consumo_e_controlar_fluxo(sender, instance, created, **kwargs):
     desliga o fluxo automaticamente.
     """
     if not created:
+        # Leitura editada: o valor guardado no estado compartilhado pode estar desatualizado
+        transaction.on_commit(estado_sensores.invalidar)
         return
 
+    # Atualiza o total do dia na mesma transação do INSERT
+    acumular_leituras([instance])
+
+    transaction.on_commit(
+        lambda: estado_sensores.registrar_leitura(instance.sensor_id, instance.valor, instance.data_hora)
+    )
+    transaction.on_commit(lambda: metricas.contar_leituras([instance.sensor_id]))
+
+    verificar_meta_consumo()
+
+
+@receiver(post_save, sender=MetaConsumo)
+@receiver(post_delete, sender=MetaConsumo)
+@receiver(post_save, sender=EmailNotification)
+@receiver(post_delete, sender=EmailNotification)
+def invalidar_configuracao(sender, **kwargs):
+    """Descarta a meta e os emails em cache em todos os processos após o commit"""
+    transaction.on_commit(configuracao.invalidar)
+
+
+@receiver(post_save, sender=Sensor)
+@receiver(post_delete, sender=Sensor)
+def invalidar_historico(sender, **kwargs):
+    """O nome do sensor faz parte dos consumos diários em cache"""
+    transaction.on_commit(historico.invalidar)
+
+
+@receiver(post_save, sender=ControleFluxo)
+@receiver(post_delete, sender=ControleFluxo)
+def invalidar_controle(sender, **kwargs):
+    """
+    Descarta o status em cache (GET /controle-fluxo/) em todos os processos.
+    Após um reset, as transições do dia também voltam a ser verificadas.
+    """
+    transaction.on_commit(controle_fluxo.invalidar)
+
+
+@receiver(connection_created)
+def instrumentar_conexao(sender, connection, **kwargs):
+    """Conta as consultas de cada requisição (fluxo.metricas, GET /metrics)"""
+    if metricas.medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metricas.medir_consulta)
+
+
+@metricas.VERIFICACAO_META_SEGUNDOS.time()
+def verificar_meta_consumo():
+    """
+    Compara o consumo do dia com a meta e aplica o desligamento automático
+    e a notificação por email. Chamada pelo signal a cada leitura criada e
+    uma vez por lote na ingestão em lote (bulk_create não dispara post_save).
+    """
     hoje = timezone.localdate()
 
-    # Busca a meta atual (usando o método singleton)
-    meta = MetaConsumo.get_meta_atual()
+    # Meta atual (cache em memória, sem consulta ao banco)
+    meta = configuracao.meta_atual()
     if not meta:
         return  # Se não há meta configurada, não faz nada
 
-    # Calcula o consumo total do dia
-    consumo_hoje = FluxoAgua.objects.filter(
-        data_hora__date=hoje
-    ).aggregate(total=Sum('valor_diferenca'))['total'] or Decimal('0.00')
-
-    # Busca ou cria o controle de fluxo do dia
-    # IMPORTANTE: Cada dia é independente. Defaults reseta todas as flags para um novo dia.
-    controle, created_controle = ControleFluxo.objects.get_or_create(
-        data=hoje,
-        defaults={
-            'status': 'on',
-            'desligamento_automatico_ocorreu': False,
-            'usuario_alterou_manualmente': False,
-            'email_enviado_hoje': False
-        }
-    )
-
-    # Se foi criado agora (novo dia), todas as flags começam zeradas
-    # O controle de ontem (se existir) não afeta o de hoje
+    # Consumo total do dia, acumulado a cada leitura (uma linha por dia)
+    consumo_hoje = ConsumoResidenciaDiario.consumo_do_dia(hoje)
 
-    # Verifica se deve desligar automaticamente
-    if consumo_hoje >= meta.meta_diaria_litros:
-        # Só desliga se ainda não desligou automaticamente hoje
-        # E se o usuário não alterou manualmente HOJE
-        if not controle.desligamento_automatico_ocorreu and not controle.usuario_alterou_manualmente:
-            controle.status = 'off'
-            controle.desligamento_automatico_ocorreu = True
-            controle.save()
+    if consumo_hoje < meta.meta_diaria_litros:
+        return
 
-        # Envia email de notificação se ainda não enviou HOJE
-        # Esta verificação garante que mesmo com várias leituras ultrapassando a meta,
-        # o email será enviado apenas uma vez por dia
-        if not controle.email_enviado_hoje:
-            enviar_notificacao_email(consumo_hoje, meta.meta_diaria_litros, hoje)
-            controle.email_enviado_hoje = True
-            controle.save()
+    # Cada transição abaixo é um único UPDATE condicional: com leituras simultâneas
+    # apenas uma transação encontra a flag ainda falsa, e as demais não alteram nada
+    # (nem sobrescrevem a alteração manual do usuário). Depois de aplicada, a
+    # transição não se repete no dia, e o processo deixa de executar o UPDATE.
+    agora = timezone.now()
+    if not _transicao_feita(hoje, "desligamento") or not _transicao_feita(hoje, "email"):
+        _garantir_controle(hoje)
+
+    # Só desliga se ainda não desligou automaticamente hoje
+    # E se o usuário não alterou manualmente HOJE
+    if not _transicao_feita(hoje, "desligamento"):
+        if ControleFluxo.objects.filter(
+            data=hoje, desligamento_automatico_ocorreu=False, usuario_alterou_manualmente=False
+        ).update(status='off', desligamento_automatico_ocorreu=True, data_hora_atualizacao=agora):
+            transaction.on_commit(controle_fluxo.invalidar)
+            transaction.on_commit(lambda: metricas.contar_transicao("desligamento_automatico"))
+        _marcar_transicao(hoje, "desligamento")
+
+    # Envia email de notificação se ainda não enviou HOJE
+    # O email entra na fila na mesma transação que marca o envio do dia
+    if not _transicao_feita(hoje, "email"):
+        with transaction.atomic():
+            if ControleFluxo.objects.filter(data=hoje, email_enviado_hoje=False).update(
+                email_enviado_hoje=True, data_hora_atualizacao=agora
+            ):
+                enviar_notificacao_email(consumo_hoje, meta.meta_diaria_litros, hoje)
+                transaction.on_commit(controle_fluxo.invalidar)
+                transaction.on_commit(lambda: metricas.contar_transicao("alerta_email"))
+        _marcar_transicao(hoje, "email")
+
+
+# Transições do ControleFluxo já aplicadas (ou impossíveis) hoje, vistas por este
+# processo: {(data, transição): versão do contador "controle"}. A versão muda
+# a cada gravação em ControleFluxo (inclusive remoção, no reset), o que obriga
+# a verificar de novo.
+_transicoes = {}
+
+
+def _transicao_feita(data, transicao):
+    return _transicoes.get((data, transicao)) == versoes.versao("controle")
+
+
+def _marcar_transicao(data, transicao):
+    versao = versoes.versao("controle")
+
+    def marcar():
+        for chave in [c for c in _transicoes if c[0] != data]:
+            del _transicoes[chave]
+        _transicoes[(data, transicao)] = versao
+
+    # Só após o commit: se a transação da leitura for desfeita, a transição também é
+    transaction.on_commit(marcar)
+
+
+def _garantir_controle(data):
+    """
+    Cria o controle do dia, se ainda não existir, com as flags zeradas (defaults
+    do modelo). IMPORTANTE: Cada dia é independente; o controle de ontem não afeta o de hoje.
+
+    O INSERT não dispara post_save, então não incrementa a versão "controle".
+    Não é preciso: a linha criada tem o mesmo conteúdo que GET /controle-fluxo/
+    já devolve quando o dia não tem controle, e a mudança visível (desligar,
+    marcar o email) vem dos UPDATEs condicionais seguintes, que invalidam o
+    cache após o commit. A linha não nasce já desligada porque o INSERT com
+    ignore_conflicts não informa se ela foi criada, e só quem aplicou a
+    transição pode enfileirar o email e contar a métrica.
+    """
+    ControleFluxo.objects.bulk_create([ControleFluxo(data=data)], ignore_conflicts=True)
 
 
 def enviar_notificacao_email(consumo_atual, meta_diaria, data):
     """
-    Envia email de notificação quando o consumo ultrapassa a meta.
-    Envia apenas uma vez por dia.
+    Coloca na fila (EmailOutbox) o email de notificação quando o consumo
+    ultrapassa a meta. O envio é feito pelo comando run_email_worker.
     """
-    # Busca todos os emails ativos
-    emails_ativos = EmailNotification.objects.filter(ativo=True).values_list('email', flat=True)
+    # Emails ativos (cache em memória, sem consulta ao banco)
+    emails_ativos = configuracao.emails_ativos()
 
     if not emails_ativos:
         return  # Não há emails cadastrados
@@ -107,14 +204,5 @@ def enviar_notificacao_email(consumo_atual, meta_diaria, data):
     Sistema de Controle de Fluxo de Água
     """
 
-    try:
-        send_mail(
-            subject=assunto,
-            message=corpo,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=list(emails_ativos),
-            fail_silently=False,
-        )
-        print(f"✅ Email de alerta enviado para {len(emails_ativos)} destinatário(s)")
-    except Exception as e:
-        print(f"❌ Erro ao enviar email: {str(e)}")
+    enfileirar_email(assunto, corpo, emails_ativos)
+    logger.info("Email de alerta enfileirado para %d destinatário(s)", len(emails_ativos))
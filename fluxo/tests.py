@@ -0,0 +1,1667 @@
+import asyncio
+import gzip
+import importlib
+import itertools
+import json
+import os
+import runpy
+import tempfile
+import time
+import unittest
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY
+from rest_framework.test import APIClient
+
+from . import buffer_escrita, configuracao, controle_fluxo, estado_sensores, exportacao, historico, particoes, signals, versoes
+from .email_outbox import enfileirar_email, enviar_pendentes, espera_nova_tentativa
+from .importacao import ErroImportacao, importar
+from .ingestao import registrar_leituras
+from .management.commands import run_ingest_server
+from .pagination import LeituraCursorPagination
+from .protocolo_linhas import interpretar_linha
+from .models import (
+    ConsumoDiario, ConsumoHorario, ConsumoResidenciaDiario, ControleFluxo, DiaCompactado, EmailNotification,
+    EmailOutbox, FluxoAgua, MetaConsumo, Sensor,
+)
+from .periodos import datas_do_mes, inicio_do_dia, intervalo_de_datas, intervalo_do_dia
+
+
+def _diferencas(sensor):
+    return list(FluxoAgua.objects.filter(sensor=sensor).order_by("id").values_list("valor_diferenca", flat=True))
+
+
+class FluxoTestCase(TestCase):
+    """
+    Base dos testes: os callbacks de on_commit (estado, caches e transições do
+    dia) são executados dentro de cada requisição, e os caches em memória do
+    processo são descartados antes de cada teste.
+    """
+
+    def setUp(self):
+        configuracao.invalidar()
+        controle_fluxo.invalidar()
+        historico.invalidar()
+        cache.clear()
+        self.client = APIClient()
+        self.sensor = Sensor.objects.create(nome="cozinha")
+
+    def post(self, caminho, dados):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(caminho, dados, format="json")
+
+    def patch(self, caminho, dados):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch(caminho, dados, format="json")
+
+
+class EstadoCompartilhadoMixin:
+    """
+    Ativa FLUXO_ESTADO_DIR em um diretório temporário. Os arquivos mapeados e
+    os caches do processo começam vazios: as versões recomeçam do zero.
+    """
+
+    def setUp(self):
+        self.diretorio = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(FLUXO_ESTADO_DIR=self.diretorio))
+        for modulo in (estado_sensores, versoes):
+            self.enterContext(mock.patch.multiple(modulo, _mapa=None, _arquivo=None))
+            self.addCleanup(self._fechar, modulo)
+        self.enterContext(mock.patch.object(configuracao, "_cache", None))
+        self.enterContext(mock.patch.dict(controle_fluxo._cache, clear=True))
+        self.enterContext(mock.patch.dict(signals._transicoes, clear=True))
+        super().setUp()
+
+    def _fechar(self, modulo):
+        if modulo._mapa is not None:
+            modulo._mapa.close()
+            modulo._arquivo.close()
+
+    def reabrir(self):
+        """Mapeia os arquivos de novo, como um outro worker"""
+        for modulo in (estado_sensores, versoes):
+            self._fechar(modulo)
+            modulo._mapa = modulo._arquivo = None
+
+
+class IngestaoTests(FluxoTestCase):
+    def test_diferenca_com_contador_reiniciado(self):
+        for valor in ("100.00", "130.50", "20.00"):
+            resposta = self.post("/fluxo/", {"sensor": self.sensor.id, "valor": valor})
+            self.assertEqual(resposta.status_code, 201)
+
+        # A primeira leitura e a que reinicia o contador contam o próprio valor
+        self.assertEqual(_diferencas(self.sensor), [Decimal("100.00"), Decimal("30.50"), Decimal("20.00")])
+        self.assertEqual(
+            ConsumoDiario.objects.get(sensor=self.sensor, data=timezone.localdate()).consumo_total,
+            Decimal("150.50"),
+        )
+
+    def test_valor_com_virgula(self):
+        resposta = self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "12,5"})
+
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(FluxoAgua.objects.get().valor, Decimal("12.50"))
+
+    def test_bulk_ordena_por_data_hora(self):
+        inicio = inicio_do_dia(timezone.localdate())
+        leituras = [
+            {"sensor": self.sensor.id, "valor": "40", "data_hora": (inicio + timedelta(hours=3)).isoformat()},
+            {"sensor": self.sensor.id, "valor": "10", "data_hora": (inicio + timedelta(hours=1)).isoformat()},
+            {"sensor": self.sensor.id, "valor": "25", "data_hora": (inicio + timedelta(hours=2)).isoformat()},
+        ]
+
+        resposta = self.post("/fluxo/bulk/", leituras)
+
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(resposta.data, {"registradas": 3})
+        diferencas = FluxoAgua.objects.order_by("data_hora").values_list("valor_diferenca", flat=True)
+        self.assertEqual(list(diferencas), [Decimal("10.00"), Decimal("15.00"), Decimal("15.00")])
+
+    def test_bulk_continua_da_ultima_leitura(self):
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "500"})
+
+        self.post("/fluxo/bulk/", [{"sensor": self.sensor.id, "valor": "520,5"}])
+
+        self.assertEqual(_diferencas(self.sensor), [Decimal("500.00"), Decimal("20.50")])
+
+    def test_bulk_varios_sensores(self):
+        outro = Sensor.objects.create(nome="banheiro")
+
+        self.post("/fluxo/bulk/", [
+            {"sensor": self.sensor.id, "valor": "10"},
+            {"sensor": outro.id, "valor": "7"},
+            {"sensor": self.sensor.id, "valor": "12"},
+        ])
+
+        self.assertEqual(_diferencas(self.sensor), [Decimal("10.00"), Decimal("2.00")])
+        self.assertEqual(_diferencas(outro), [Decimal("7.00")])
+
+    def test_bulk_sensor_inexistente(self):
+        resposta = self.post("/fluxo/bulk/", [
+            {"sensor": self.sensor.id, "valor": "10"},
+            {"sensor": self.sensor.id + 1000, "valor": "10"},
+        ])
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(FluxoAgua.objects.exists())
+
+    def test_bulk_leitura_invalida(self):
+        resposta = self.post("/fluxo/bulk/", [{"sensor": self.sensor.id, "valor": "abc"}])
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(FluxoAgua.objects.exists())
+
+    @override_settings(FLUXO_LOTE_MAX_LEITURAS=2)
+    def test_bulk_limite_de_leituras(self):
+        resposta = self.post("/fluxo/bulk/", [{"sensor": self.sensor.id, "valor": str(v)} for v in range(3)])
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertFalse(FluxoAgua.objects.exists())
+
+
+class EstadoSensoresTests(EstadoCompartilhadoMixin, FluxoTestCase):
+    def test_leitura_registrada_no_estado(self):
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "100"})
+        leitura = FluxoAgua.objects.get()
+
+        self.reabrir()
+        estado = estado_sensores.obter(self.sensor.id)
+
+        self.assertEqual(estado.ultimo_valor, Decimal("100.00"))
+        self.assertEqual(estado.ultima_data_hora, leitura.data_hora)
+
+    def test_diferenca_calculada_pelo_estado(self):
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "100"})
+        # Alteração fora da API: o estado não é invalidado e a última linha não é consultada
+        FluxoAgua.objects.update(valor=Decimal("90"))
+
+        self.post("/fluxo/bulk/", [{"sensor": self.sensor.id, "valor": "130"}])
+
+        self.assertEqual(_diferencas(self.sensor), [Decimal("100.00"), Decimal("30.00")])
+
+    def test_edicao_invalida_o_estado(self):
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "100"})
+        leitura = FluxoAgua.objects.get()
+
+        self.patch(f"/fluxo/{leitura.id}/", {"valor": "90"})
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "130"})
+
+        self.assertEqual(_diferencas(self.sensor)[-1], Decimal("40.00"))
+
+    def test_estado_reconstruido_do_banco(self):
+        registrar = FluxoAgua.objects.create
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar(sensor=self.sensor, valor=Decimal("10"), valor_diferenca=Decimal("10"))
+            registrar(sensor=self.sensor, valor=Decimal("25"), valor_diferenca=Decimal("15"))
+
+        estado_sensores.reconstruir()
+
+        self.assertEqual(estado_sensores.obter(self.sensor.id).ultimo_valor, Decimal("25.00"))
+        self.assertIsNone(estado_sensores.obter(self.sensor.id + 1000))
+
+    @override_settings(FLUXO_ESTADO_SLOTS=1)
+    def test_tabela_cheia_usa_o_banco(self):
+        outro = Sensor.objects.create(nome="banheiro")
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "10"})
+        self.post("/fluxo/", {"sensor": outro.id, "valor": "7"})
+
+        self.post("/fluxo/bulk/", [{"sensor": outro.id, "valor": "9"}])
+
+        self.assertIsNone(estado_sensores.obter(outro.id))
+        self.assertEqual(_diferencas(outro), [Decimal("7.00"), Decimal("2.00")])
+
+
+class VersoesTests(EstadoCompartilhadoMixin, FluxoTestCase):
+    def test_contador_compartilhado_pelo_arquivo(self):
+        inicial = versoes.versao("controle")
+
+        versoes.incrementar("controle")
+        self.reabrir()
+
+        self.assertEqual(versoes.versao("controle"), inicial + 1)
+        self.assertEqual(versoes.marca("controle", "historico"), f"{inicial + 1}.{versoes.versao('historico')}")
+
+    @override_settings(FLUXO_ESTADO_DIR="", FLUXO_CONFIG_TTL=30)
+    def test_marca_sem_estado_inclui_periodo_do_ttl(self):
+        with mock.patch("time.time", return_value=95):
+            self.assertEqual(versoes.marca("consumo"), f"{versoes.versao('consumo')}.3")
+
+
+class ConsumoResidenciaDiarioTests(FluxoTestCase):
+    def test_total_do_dia_acumulado(self):
+        outro = Sensor.objects.create(nome="banheiro")
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "100"})
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "120"})
+        self.post("/fluxo/bulk/", [{"sensor": outro.id, "valor": "30"}, {"sensor": self.sensor.id, "valor": "125"}])
+
+        self.assertEqual(ConsumoResidenciaDiario.objects.count(), 1)
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(timezone.localdate()), Decimal("155.00"))
+
+    def test_leitura_de_outro_dia(self):
+        ontem = timezone.localdate() - timedelta(days=1)
+        self.post("/fluxo/bulk/", [
+            {"sensor": self.sensor.id, "valor": "10", "data_hora": (inicio_do_dia(ontem) + timedelta(hours=23)).isoformat()},
+            {"sensor": self.sensor.id, "valor": "14"},
+        ])
+
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(ontem), Decimal("10.00"))
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(timezone.localdate()), Decimal("4.00"))
+
+    def test_edicao_e_remocao_ajustam_total(self):
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "100"})
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "150"})
+        leitura = FluxoAgua.objects.order_by("id").last()
+
+        self.patch(f"/fluxo/{leitura.id}/", {"valor_diferenca": "30"})
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(timezone.localdate()), Decimal("130.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f"/fluxo/{leitura.id}/")
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(timezone.localdate()), Decimal("100.00"))
+
+    def test_linha_criada_por_outra_transacao(self):
+        hoje = timezone.localdate()
+        ConsumoResidenciaDiario.objects.create(data=hoje, consumo_total=Decimal("5"))
+        update = QuerySet.update
+        chamadas = []
+
+        def update_concorrente(queryset, **campos):
+            # O primeiro UPDATE não encontra a linha, que "outra transação" já criou
+            chamadas.append(campos)
+            return 0 if len(chamadas) == 1 else update(queryset, **campos)
+
+        with mock.patch.object(QuerySet, "update", update_concorrente):
+            ConsumoResidenciaDiario.acumular(hoje, Decimal("3"))
+
+        self.assertEqual(len(chamadas), 2)
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(hoje), Decimal("8.00"))
+
+    def test_dia_sem_leituras(self):
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(timezone.localdate()), Decimal("0.00"))
+
+
+class ConsumoDiarioTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.outro = Sensor.objects.create(nome="banheiro")
+        self.hoje = timezone.localdate()
+        inicio = inicio_do_dia(self.hoje)
+        self.post("/fluxo/bulk/", [
+            {"sensor": self.sensor.id, "valor": "100", "data_hora": (inicio + timedelta(hours=8)).isoformat()},
+            {"sensor": self.sensor.id, "valor": "125", "data_hora": (inicio + timedelta(hours=9, minutes=15)).isoformat()},
+            {"sensor": self.outro.id, "valor": "50", "data_hora": (inicio + timedelta(hours=7)).isoformat()},
+        ])
+
+    def test_consumo_por_sensor(self):
+        consumo = ConsumoDiario.objects.get(sensor=self.sensor, data=self.hoje)
+
+        self.assertEqual(consumo.consumo_total, Decimal("125.00"))
+        self.assertEqual(consumo.hora.isoformat(), "09:15:00")
+        self.assertEqual(ConsumoDiario.objects.get(sensor=self.outro, data=self.hoje).consumo_total, Decimal("50.00"))
+
+    def test_consumo_residencia(self):
+        resposta = self.client.get("/consumo-residencia/")
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["data"], self.hoje.strftime("%d/%m/%Y"))
+        self.assertEqual(resposta.data["total_residencia"], "175.00")
+        self.assertEqual(
+            resposta.data["sensores"],
+            [{"sensor": "banheiro", "consumo": "50.00"}, {"sensor": "cozinha", "consumo": "125.00"}],
+        )
+
+    def test_consumo_mensal_do_ano(self):
+        resposta = self.client.get("/consumo-mensal/")
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(len(resposta.data["meses"]), 12)
+        self.assertEqual(resposta.data["meses"][self.hoje.month - 1]["consumo_total"], "175.00")
+        self.assertEqual(resposta.data["total_ano"], "175.00")
+
+    def test_consumo_mensal_do_mes(self):
+        resposta = self.client.get("/consumo-mensal/", {"mes": self.hoje.month})
+
+        self.assertEqual(resposta.status_code, 200)
+        data = self.hoje.strftime("%d/%m/%Y")
+        self.assertEqual(
+            resposta.data["consumo_por_dia"],
+            [
+                {"data": data, "sensor": "banheiro", "consumo_total": "50.00"},
+                {"data": data, "sensor": "cozinha", "consumo_total": "125.00"},
+            ],
+        )
+        self.assertEqual(resposta.data["total_mes"], "175.00")
+
+    def test_consumo_mensal_mes_invalido(self):
+        for mes in ("13", "0", "abc"):
+            self.assertEqual(self.client.get("/consumo-mensal/", {"mes": mes}).status_code, 400, mes)
+
+    def test_rebuild_consumo_diario(self):
+        ConsumoDiario.objects.update(consumo_total=Decimal("0"))
+        ConsumoResidenciaDiario.objects.all().delete()
+
+        call_command("rebuild_consumo_diario", desde=self.hoje.isoformat(), stdout=StringIO())
+
+        self.assertEqual(ConsumoDiario.objects.get(sensor=self.sensor, data=self.hoje).consumo_total, Decimal("125.00"))
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(self.hoje), Decimal("175.00"))
+
+    def test_rebuild_data_invalida(self):
+        with self.assertRaises(CommandError):
+            call_command("rebuild_consumo_diario", desde="ontem", stdout=StringIO())
+
+
+class ConsumoHorarioTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.outro = Sensor.objects.create(nome="banheiro")
+        self.inicio = inicio_do_dia(timezone.localdate())
+        self.post("/fluxo/bulk/", [
+            {"sensor": self.sensor.id, "valor": "100", "data_hora": (self.inicio + timedelta(hours=8, minutes=10)).isoformat()},
+            {"sensor": self.sensor.id, "valor": "110", "data_hora": (self.inicio + timedelta(hours=8, minutes=40)).isoformat()},
+            {"sensor": self.sensor.id, "valor": "125", "data_hora": (self.inicio + timedelta(hours=9, minutes=15)).isoformat()},
+            {"sensor": self.outro.id, "valor": "50", "data_hora": (self.inicio + timedelta(hours=9, minutes=30)).isoformat()},
+        ])
+
+    def _horarios(self, sensor):
+        return [
+            (c.inicio, c.consumo_total)
+            for c in ConsumoHorario.objects.filter(sensor=sensor).order_by("inicio")
+        ]
+
+    def test_consumo_por_intervalo(self):
+        self.assertEqual(
+            self._horarios(self.sensor),
+            [
+                (self.inicio + timedelta(hours=8), Decimal("110.00")),
+                (self.inicio + timedelta(hours=9), Decimal("15.00")),
+            ],
+        )
+
+    def test_serie_da_residencia_agrupada(self):
+        resposta = self.client.get("/consumo-horario/", {"intervalo": 120})
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(
+            resposta.data["serie"],
+            [{"inicio": (self.inicio + timedelta(hours=8)).isoformat(), "consumo_total": "175.00"}],
+        )
+        self.assertEqual(resposta.data["total"], "175.00")
+
+    def test_serie_do_sensor(self):
+        resposta = self.client.get("/consumo-horario/", {"sensor": self.outro.id})
+
+        self.assertEqual(
+            resposta.data["serie"],
+            [{"inicio": (self.inicio + timedelta(hours=9)).isoformat(), "consumo_total": "50.00"}],
+        )
+
+    def test_parametros_invalidos(self):
+        for parametros in (
+            {"intervalo": 0},
+            {"intervalo": 90},
+            {"intervalo": 420},
+            {"intervalo": 2880},
+            {"intervalo": "x"},
+            {"inicio": "ontem"},
+            {"inicio": "2025-02-30"},
+            {"fim": "2025-01-01T25:00"},
+            {"inicio": "2025-01-02", "fim": "2025-01-01"},
+        ):
+            self.assertEqual(self.client.get("/consumo-horario/", parametros).status_code, 400, parametros)
+
+    @override_settings(FLUXO_CONSUMO_MAX_PONTOS=24)
+    def test_maximo_de_pontos(self):
+        hoje = timezone.localdate()
+
+        self.assertEqual(self.client.get("/consumo-horario/").status_code, 200)
+        resposta = self.client.get("/consumo-horario/", {"inicio": (hoje - timedelta(days=1)).isoformat()})
+        self.assertEqual(resposta.status_code, 400)
+
+    @override_settings(FLUXO_INTERVALO_MINUTOS=120)
+    def test_migracao_usa_os_intervalos_da_ingestao(self):
+        migracao = importlib.import_module("fluxo.migrations.0026_consumohorario")
+        call_command("rebuild_consumo_diario", stdout=StringIO())
+        ao_vivo = {sensor: self._horarios(sensor) for sensor in (self.sensor, self.outro)}
+        ConsumoHorario.objects.all().delete()
+
+        migracao.preencher_consumo_horario(apps, None)
+
+        self.assertEqual(ao_vivo[self.sensor], [(self.inicio + timedelta(hours=8), Decimal("125.00"))])
+        self.assertEqual({sensor: self._horarios(sensor) for sensor in ao_vivo}, ao_vivo)
+
+    def test_intervalo_base_deve_dividir_o_dia(self):
+        caminho = os.path.join(settings.BASE_DIR, "setup", "settings.py")
+        with mock.patch.dict(os.environ, {"FLUXO_INTERVALO_MINUTOS": "90"}):
+            self.assertEqual(runpy.run_path(caminho)["FLUXO_INTERVALO_MINUTOS"], 90)
+        with mock.patch.dict(os.environ, {"FLUXO_INTERVALO_MINUTOS": "420"}):
+            with self.assertRaises(ImproperlyConfigured):
+                runpy.run_path(caminho)
+
+
+class PeriodosTests(FluxoTestCase):
+    def test_limites_no_fuso_local(self):
+        inicio, fim = intervalo_do_dia(date(2025, 3, 10))
+
+        self.assertEqual(inicio, timezone.make_aware(datetime(2025, 3, 10)))
+        self.assertEqual(fim - inicio, timedelta(days=1))
+        self.assertEqual(intervalo_de_datas(date(2025, 3, 10), date(2025, 3, 11))[1], fim + timedelta(days=1))
+        self.assertEqual(datas_do_mes(2025, 12), (date(2025, 12, 1), date(2026, 1, 1)))
+
+    def test_leitura_no_fim_do_dia_local(self):
+        dia = timezone.localdate() - timedelta(days=5)
+        # 23:30 local já é o dia seguinte em UTC
+        self.post("/fluxo/bulk/", [
+            {"sensor": self.sensor.id, "valor": "10", "data_hora": (inicio_do_dia(dia) + timedelta(hours=23, minutes=30)).isoformat()},
+        ])
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(dia), Decimal("10.00"))
+
+        call_command("rebuild_consumo_diario", stdout=StringIO())
+
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(dia), Decimal("10.00"))
+        self.assertEqual(ConsumoDiario.objects.get().data, dia)
+
+    def test_indices_compostos(self):
+        with connection.cursor() as cursor:
+            restricoes = connection.introspection.get_constraints(cursor, FluxoAgua._meta.db_table)
+
+        colunas = {nome: r["columns"] for nome, r in restricoes.items() if r["index"]}
+        self.assertEqual(colunas["fluxoagua_sensor_data_idx"], ["sensor_id", "data_hora"])
+        self.assertEqual(colunas["fluxoagua_sensor_id_desc_idx"], ["sensor_id", "id"])
+        # O índice simples de sensor_id é redundante com os compostos
+        self.assertNotIn(["sensor_id"], list(colunas.values()))
+
+
+@unittest.skipIf(connection.vendor == "postgresql", "apenas bancos sem particionamento")
+class ParticoesSemPostgresTests(FluxoTestCase):
+    def test_comando_recusado(self):
+        with self.assertRaises(CommandError):
+            call_command("manage_partitions", stdout=StringIO())
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "particionamento apenas no PostgreSQL")
+class ParticoesTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        hoje = timezone.localdate()
+        self.atual = (hoje.year, hoje.month)
+
+    def _mes(self, deslocamento):
+        ano, mes = self.atual
+        indice = ano * 12 + mes - 1 + deslocamento
+        return indice // 12, indice % 12 + 1
+
+    def _particoes(self):
+        with connection.cursor() as cursor:
+            return [(ano, mes) for ano, mes, _ in particoes.listar_particoes(cursor)]
+
+    def _particao_da_leitura(self, leitura):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT tableoid::regclass::text FROM {particoes.TABELA} WHERE id = %s", [leitura.id]
+            )
+            return cursor.fetchone()[0]
+
+    def _leitura(self, sensor, ano, mes, valor):
+        data_hora = particoes.limites_particao(ano, mes)[0] + timedelta(days=1)
+        return FluxoAgua.objects.create(sensor=sensor, data_hora=data_hora, valor=valor, valor_diferenca=valor)
+
+    def test_tabela_particionada_por_mes(self):
+        with connection.cursor() as cursor:
+            self.assertTrue(particoes.esta_particionada(cursor))
+        self.assertIn(self.atual, self._particoes())
+
+        leitura = self._leitura(self.sensor, *self.atual, Decimal("10"))
+        self.assertEqual(self._particao_da_leitura(leitura), particoes.nome_particao(*self.atual))
+
+    def test_cria_particoes_futuras(self):
+        saida = StringIO()
+
+        call_command("manage_partitions", meses_futuros=6, stdout=saida)
+
+        self.assertTrue({self._mes(i) for i in range(7)} <= set(self._particoes()))
+        self.assertIn(f"{self._mes(6)[0]:04d}-{self._mes(6)[1]:02d}", saida.getvalue())
+
+    def test_leituras_da_particao_padrao_movidas(self):
+        ano, mes = self._mes(12)
+        leitura = self._leitura(self.sensor, ano, mes, Decimal("10"))
+        self.assertEqual(self._particao_da_leitura(leitura), particoes.PARTICAO_PADRAO)
+
+        with connection.cursor() as cursor:
+            self.assertTrue(particoes.criar_particao(cursor, ano, mes))
+            self.assertFalse(particoes.criar_particao(cursor, ano, mes))
+
+        self.assertEqual(self._particao_da_leitura(leitura), particoes.nome_particao(ano, mes))
+
+    def test_remove_particoes_antigas_preservando_a_ultima_leitura(self):
+        ano, mes = self._mes(-14)
+        with connection.cursor() as cursor:
+            particoes.criar_particao(cursor, ano, mes)
+        outro = Sensor.objects.create(nome="banheiro")
+        self._leitura(self.sensor, ano, mes, Decimal("10"))
+        self._leitura(self.sensor, ano, mes, Decimal("20"))
+        self._leitura(outro, ano, mes, Decimal("5"))
+        self._leitura(outro, *self.atual, Decimal("8"))
+        with connection.cursor() as cursor:
+            # Como se as leituras já estivessem gravadas: sem verificações de FK adiadas
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+
+        call_command("manage_partitions", reter_meses=1, remover=True, stdout=StringIO())
+
+        self.assertNotIn((ano, mes), self._particoes())
+        # A última leitura do sensor volta para a tabela (partição padrão); a do outro sensor não
+        self.assertEqual(list(FluxoAgua.objects.filter(sensor=self.sensor).values_list("valor", flat=True)), [Decimal("20.00")])
+        self.assertEqual(list(FluxoAgua.objects.filter(sensor=outro).values_list("valor", flat=True)), [Decimal("8.00")])
+
+    def test_opcoes_invalidas(self):
+        for opcoes in ({"meses_futuros": -1}, {"reter_meses": 0}):
+            with self.assertRaises(CommandError):
+                call_command("manage_partitions", stdout=StringIO(), **opcoes)
+
+
+class CompactacaoTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dia = timezone.localdate() - timedelta(days=10)
+        inicio = inicio_do_dia(self.dia)
+        registrar_leituras([
+            {"sensor": self.sensor.id, "valor": Decimal(valor), "data_hora": inicio + timedelta(hours=hora)}
+            for valor, hora in [("10", 8), ("25", 9), ("40", 10)]
+        ])
+
+    def test_compacta_dia_antigo(self):
+        registrar_leituras([{"sensor": self.sensor.id, "valor": Decimal("45")}])
+        saida = StringIO()
+
+        call_command("compact_readings", older_than=1, lote=2, stdout=saida)
+
+        # Restou apenas a leitura de hoje; os totais do dia compactado são mantidos
+        self.assertEqual(list(FluxoAgua.objects.values_list("valor", flat=True)), [Decimal("45.00")])
+        compactado = DiaCompactado.objects.get(data=self.dia)
+        self.assertTrue(compactado.concluido)
+        self.assertEqual(compactado.leituras_removidas, 3)
+        self.assertEqual(ConsumoDiario.objects.get(sensor=self.sensor, data=self.dia).consumo_total, Decimal("40.00"))
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(self.dia), Decimal("40.00"))
+        self.assertIn("3 leituras removidas", saida.getvalue())
+
+    def test_ultima_leitura_do_sensor_preservada(self):
+        call_command("compact_readings", older_than=1, stdout=StringIO())
+
+        self.assertEqual(list(FluxoAgua.objects.values_list("valor", flat=True)), [Decimal("40.00")])
+
+        # A próxima leitura continua a partir dela
+        registrar_leituras([{"sensor": self.sensor.id, "valor": Decimal("46")}])
+        self.assertEqual(_diferencas(self.sensor)[-1], Decimal("6.00"))
+
+    def test_retoma_dia_interrompido(self):
+        # Interrompido depois de marcar o dia: os totais já consolidados não são recalculados
+        DiaCompactado.objects.create(data=self.dia)
+        ConsumoDiario.objects.filter(data=self.dia).update(consumo_total=Decimal("99"))
+        registrar_leituras([{"sensor": self.sensor.id, "valor": Decimal("45")}])
+
+        call_command("compact_readings", older_than=1, stdout=StringIO())
+
+        self.assertTrue(DiaCompactado.objects.get(data=self.dia).concluido)
+        self.assertEqual(ConsumoDiario.objects.get(data=self.dia).consumo_total, Decimal("99.00"))
+        self.assertEqual(FluxoAgua.objects.count(), 1)
+
+    def test_rebuild_preserva_dia_compactado(self):
+        registrar_leituras([{"sensor": self.sensor.id, "valor": Decimal("45")}])
+        call_command("compact_readings", older_than=1, stdout=StringIO())
+
+        call_command("rebuild_consumo_diario", stdout=StringIO())
+
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(self.dia), Decimal("40.00"))
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(timezone.localdate()), Decimal("5.00"))
+
+    def test_dias_recentes_mantidos(self):
+        saida = StringIO()
+
+        call_command("compact_readings", older_than=30, stdout=saida)
+
+        self.assertEqual(FluxoAgua.objects.count(), 3)
+        self.assertIn("Nenhum dia", saida.getvalue())
+
+    def test_opcoes_invalidas(self):
+        for opcoes in ({"older_than": 0}, {"older_than": 1, "lote": 0}):
+            with self.assertRaises(CommandError):
+                call_command("compact_readings", stdout=StringIO(), **opcoes)
+
+
+class ListagemLeiturasTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.outro = Sensor.objects.create(nome="banheiro")
+        self.ontem = timezone.localdate() - timedelta(days=1)
+        inicio = inicio_do_dia(self.ontem)
+        registrar_leituras(
+            [
+                {"sensor": self.sensor.id, "valor": Decimal(v), "data_hora": inicio + timedelta(hours=h)}
+                for v, h in [("1", 1), ("2", 2), ("3", 23)]
+            ]
+            + [{"sensor": self.outro.id, "valor": Decimal("7"), "data_hora": inicio + timedelta(hours=5)}]
+        )
+        registrar_leituras([{"sensor": self.sensor.id, "valor": Decimal("4")}])
+
+    def _valores(self, resposta):
+        return [item["valor"] for item in resposta.data["results"]]
+
+    def test_paginas_por_cursor(self):
+        resposta = self.client.get("/fluxo/", {"tamanho": 2})
+        self.assertEqual(self._valores(resposta), ["4.00", "7.00"])
+
+        # Uma leitura nova não desloca as páginas seguintes
+        registrar_leituras([{"sensor": self.sensor.id, "valor": Decimal("5")}])
+        resposta = self.client.get(resposta.data["next"])
+        self.assertEqual(self._valores(resposta), ["3.00", "2.00"])
+
+        resposta = self.client.get(resposta.data["next"])
+        self.assertEqual(self._valores(resposta), ["1.00"])
+        self.assertIsNone(resposta.data["next"])
+
+    def test_tamanho_maximo_da_pagina(self):
+        with mock.patch.object(LeituraCursorPagination, "max_page_size", 3):
+            resposta = self.client.get("/fluxo/", {"tamanho": 100})
+
+        self.assertEqual(len(resposta.data["results"]), 3)
+
+    def test_filtros(self):
+        resposta = self.client.get("/fluxo/", {"sensor": self.sensor.id, "ate": self.ontem.isoformat()})
+        # ate com uma data inclui o dia inteiro
+        self.assertEqual(self._valores(resposta), ["3.00", "2.00", "1.00"])
+
+        desde = (inicio_do_dia(self.ontem) + timedelta(hours=2)).isoformat()
+        resposta = self.client.get("/fluxo/", {"desde": desde, "ate": self.ontem.isoformat()})
+        self.assertEqual(self._valores(resposta), ["7.00", "3.00", "2.00"])
+
+        resposta = self.client.get("/fluxo/", {"desde": timezone.localdate().isoformat()})
+        self.assertEqual(self._valores(resposta), ["4.00"])
+
+    def test_filtros_invalidos(self):
+        for parametros in ({"sensor": "x"}, {"desde": "ontem"}, {"ate": "2025-13-01"}):
+            self.assertEqual(self.client.get("/fluxo/", parametros).status_code, 400, parametros)
+
+
+class ExportacaoTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.outro = Sensor.objects.create(nome="banheiro")
+        self.ontem = timezone.localdate() - timedelta(days=1)
+        registrar_leituras([
+            {"sensor": self.sensor.id, "valor": Decimal("10"), "data_hora": inicio_do_dia(self.ontem) + timedelta(hours=8)},
+            {"sensor": self.sensor.id, "valor": Decimal("12.5"), "data_hora": inicio_do_dia(self.ontem) + timedelta(hours=9)},
+            {"sensor": self.outro.id, "valor": Decimal("3")},
+        ])
+
+    def _conteudo(self, resposta):
+        self.assertTrue(resposta.streaming)
+        return b"".join(resposta.streaming_content).decode()
+
+    def test_leituras_em_csv(self):
+        resposta = self.client.get("/fluxo/export/")
+
+        self.assertEqual(resposta["Content-Type"], "text/csv; charset=utf-8")
+        self.assertEqual(resposta["Content-Disposition"], 'attachment; filename="leituras.csv"')
+        linhas = self._conteudo(resposta).splitlines()
+        self.assertEqual(linhas[0], "id,sensor,data_hora,valor,valor_diferenca")
+        primeira = FluxoAgua.objects.order_by("id").first()
+        self.assertEqual(
+            linhas[1],
+            f"{primeira.id},{self.sensor.id},{timezone.localtime(primeira.data_hora).isoformat()},10.00,10.00",
+        )
+        self.assertEqual(len(linhas), 4)
+
+    def test_leituras_em_ndjson_com_filtros(self):
+        resposta = self.client.get("/fluxo/export/", {"formato": "ndjson", "sensor": self.sensor.id})
+
+        registros = [json.loads(linha) for linha in self._conteudo(resposta).splitlines()]
+        self.assertEqual([r["valor_diferenca"] for r in registros], ["10.00", "2.50"])
+        self.assertEqual({r["sensor"] for r in registros}, {self.sensor.id})
+
+    def test_enviado_em_blocos(self):
+        with mock.patch.object(exportacao, "TAMANHO_BLOCO", 10):
+            blocos = list(self.client.get("/fluxo/export/", {"formato": "ndjson"}).streaming_content)
+
+        self.assertGreaterEqual(len(blocos), 3)
+
+    def test_parametros_invalidos(self):
+        for caminho, parametros in (
+            ("/fluxo/export/", {"formato": "xml"}),
+            ("/fluxo/export/", {"desde": "ontem"}),
+            ("/consumo-diario/export/", {"formato": "xml"}),
+            ("/consumo-diario/export/", {"desde": "2025-02-30"}),
+            ("/consumo-diario/export/", {"sensor": "x"}),
+        ):
+            self.assertEqual(self.client.get(caminho, parametros).status_code, 400, (caminho, parametros))
+
+    def test_consumo_diario_em_csv(self):
+        resposta = self.client.get("/consumo-diario/export/", {"ate": self.ontem.isoformat()})
+
+        linhas = self._conteudo(resposta).splitlines()
+        self.assertEqual(linhas[0], "data,sensor,sensor_nome,consumo_total,hora_ultima_leitura")
+        self.assertEqual(linhas[1:], [f"{self.ontem.isoformat()},{self.sensor.id},cozinha,12.50,09:00:00"])
+
+
+class ConexaoEmailTeste(BaseEmailBackend):
+    """Backend de email que registra as aberturas da conexão e as mensagens enviadas"""
+    aberturas = 0
+    enviadas = []
+    falhar_abertura = False
+    falhar_envio = False
+
+    def open(self):
+        if ConexaoEmailTeste.falhar_abertura:
+            raise OSError("servidor indisponível")
+        ConexaoEmailTeste.aberturas += 1
+        return True
+
+    def send_messages(self, mensagens):
+        if ConexaoEmailTeste.falhar_envio:
+            raise OSError("recusado")
+        ConexaoEmailTeste.enviadas.extend(mensagens)
+        return len(mensagens)
+
+
+class _Parar(Exception):
+    pass
+
+
+@override_settings(
+    EMAIL_BACKEND="fluxo.tests.ConexaoEmailTeste",
+    FLUXO_EMAIL_MAX_TENTATIVAS=3,
+    FLUXO_EMAIL_ESPERA_INICIAL=30,
+    FLUXO_EMAIL_ESPERA_MAXIMA=100,
+)
+class EmailOutboxTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        for atributo, valor in (("aberturas", 0), ("enviadas", []), ("falhar_abertura", False), ("falhar_envio", False)):
+            patcher = mock.patch.object(ConexaoEmailTeste, atributo, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # O worker descarta as conexões antigas a cada volta; aqui a conexão é a da transação do teste
+        self.enterContext(mock.patch("fluxo.management.commands.run_email_worker.close_old_connections"))
+
+    def _worker(self):
+        erros = StringIO()
+        call_command("run_email_worker", uma_vez=True, stdout=StringIO(), stderr=erros)
+        return erros.getvalue()
+
+    def test_espera_dobra_ate_o_maximo(self):
+        self.assertEqual(
+            [espera_nova_tentativa(t).total_seconds() for t in (1, 2, 3, 4)],
+            [30, 60, 100, 100],
+        )
+
+    def test_lote_enviado_com_uma_unica_conexao(self):
+        for i in range(3):
+            enfileirar_email(f"Alerta {i}", "corpo", ["a@example.com"])
+
+        self._worker()
+
+        self.assertEqual(ConexaoEmailTeste.aberturas, 1)
+        self.assertEqual([m.subject for m in ConexaoEmailTeste.enviadas], ["Alerta 0", "Alerta 1", "Alerta 2"])
+        self.assertFalse(EmailOutbox.objects.exclude(status="enviado").exists())
+        self.assertFalse(EmailOutbox.objects.filter(data_envio__isnull=True).exists())
+
+    def test_falha_reagenda_com_espera_e_desiste_no_maximo(self):
+        email = enfileirar_email("Alerta", "corpo", ["a@example.com"])
+        ConexaoEmailTeste.falhar_envio = True
+
+        antes = timezone.now()
+        self.assertEqual(enviar_pendentes(get_connection()), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.tentativas, email.ultimo_erro), ("pendente", 1, "recusado"))
+        self.assertGreaterEqual(email.proxima_tentativa, antes + timedelta(seconds=30))
+
+        # Ainda não é hora da próxima tentativa
+        self.assertEqual(enviar_pendentes(get_connection()), (0, 0))
+
+        EmailOutbox.objects.filter(pk=email.pk).update(proxima_tentativa=timezone.now())
+        enviar_pendentes(get_connection())
+        EmailOutbox.objects.filter(pk=email.pk).update(proxima_tentativa=timezone.now())
+        enviar_pendentes(get_connection())
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.tentativas), ("falhou", 3))
+
+    def test_fila_vazia_nao_abre_conexao(self):
+        EmailOutbox.objects.create(
+            assunto="Depois", corpo="corpo", destinatarios=["a@example.com"],
+            proxima_tentativa=timezone.now() + timedelta(hours=1),
+        )
+
+        with mock.patch("fluxo.management.commands.run_email_worker.time.sleep", side_effect=[None, None, _Parar]):
+            with self.assertRaises(_Parar):
+                call_command("run_email_worker", stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(ConexaoEmailTeste.aberturas, 0)
+
+    def test_servidor_indisponivel_nao_consome_tentativas(self):
+        email = enfileirar_email("Alerta", "corpo", ["a@example.com"])
+        ConexaoEmailTeste.falhar_abertura = True
+
+        self.assertIn("servidor indisponível", self._worker())
+
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.tentativas), ("pendente", 0))
+
+        ConexaoEmailTeste.falhar_abertura = False
+        self._worker()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.tentativas), ("enviado", 1))
+
+
+@override_settings(FLUXO_CONFIG_TTL=30)
+class ConfiguracaoTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.meta = MetaConsumo.objects.create(meta_diaria_litros=Decimal("100"))
+            EmailNotification.objects.create(email="a@example.com")
+
+    def _meta_em(self, segundos):
+        with mock.patch("fluxo.configuracao.time.monotonic", return_value=segundos):
+            return configuracao.meta_atual().meta_diaria_litros
+
+    def test_reaproveitada_sem_consultas(self):
+        configuracao.meta_atual()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(configuracao.meta_atual().meta_diaria_litros, Decimal("100"))
+            self.assertEqual(configuracao.emails_ativos(), ["a@example.com"])
+
+    def test_recarregada_depois_do_ttl(self):
+        self.assertEqual(self._meta_em(1000), Decimal("100"))
+        # Alteração sem signal: só é vista quando o cache expira
+        MetaConsumo.objects.filter(pk=self.meta.pk).update(meta_diaria_litros=Decimal("50"))
+
+        self.assertEqual(self._meta_em(1029), Decimal("100"))
+        self.assertEqual(self._meta_em(1031), Decimal("50"))
+
+    def test_invalidada_ao_salvar(self):
+        self.assertEqual(self._meta_em(1000), Decimal("100"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.meta.meta_diaria_litros = Decimal("70")
+            self.meta.save()
+            EmailNotification.objects.create(email="b@example.com")
+
+        self.assertEqual(self._meta_em(1001), Decimal("70"))
+        self.assertEqual(sorted(configuracao.emails_ativos()), ["a@example.com", "b@example.com"])
+
+
+class ConfiguracaoCompartilhadaTests(EstadoCompartilhadoMixin, ConfiguracaoTests):
+    def test_recarregada_depois_do_ttl(self):
+        # Com estado compartilhado a versão basta: o TTL não se aplica
+        self.assertEqual(self._meta_em(1000), Decimal("100"))
+        MetaConsumo.objects.filter(pk=self.meta.pk).update(meta_diaria_litros=Decimal("50"))
+
+        self.assertEqual(self._meta_em(5000), Decimal("100"))
+        # Outro worker salvou a meta
+        versoes.incrementar("configuracao")
+        self.assertEqual(self._meta_em(5001), Decimal("50"))
+
+
+class ControleFluxoTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            MetaConsumo.objects.create(meta_diaria_litros=Decimal("100"))
+            EmailNotification.objects.create(email="morador@example.com")
+
+    def test_desligamento_automatico_uma_vez_por_dia(self):
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "60"})
+        self.assertFalse(ControleFluxo.objects.exists())
+
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "120"})
+        controle = ControleFluxo.objects.get(data=timezone.localdate())
+        self.assertEqual(controle.status, "off")
+        self.assertTrue(controle.desligamento_automatico_ocorreu)
+        self.assertTrue(controle.email_enviado_hoje)
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.destinatarios, ["morador@example.com"])
+        self.assertEqual(email.status, "pendente")
+
+        # Religado pelo usuário: novas leituras acima da meta não desligam nem enviam de novo
+        resposta = self.patch("/controle-fluxo/alterar_status/", {"status": "on"})
+        self.assertEqual(resposta.status_code, 200)
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "150"})
+
+        controle.refresh_from_db()
+        self.assertEqual(controle.status, "on")
+        self.assertTrue(controle.usuario_alterou_manualmente)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+        self.assertEqual(self.client.get("/controle-fluxo/").data["status"], "on")
+
+    def test_transicoes_aplicadas_nao_sao_repetidas(self):
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "120"})
+        # A própria transição incrementa a versão "controle": a leitura seguinte
+        # ainda verifica (sem alterar nada) e só então a marca passa a valer
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "125"})
+        hoje = timezone.localdate()
+        self.assertTrue(signals._transicao_feita(hoje, "desligamento"))
+        self.assertTrue(signals._transicao_feita(hoje, "email"))
+
+        with mock.patch.object(signals, "_garantir_controle") as garantir:
+            self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "130"})
+        garantir.assert_not_called()
+
+    def test_reset_volta_a_verificar(self):
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "120"})
+        with self.captureOnCommitCallbacks(execute=True):
+            ControleFluxo.objects.all().delete()
+
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "130"})
+
+        self.assertEqual(ControleFluxo.objects.get().status, "off")
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+    def test_alteracao_manual_impede_desligamento(self):
+        self.patch("/controle-fluxo/alterar_status/", {"status": "on"})
+
+        self.post("/fluxo/bulk/", [{"sensor": self.sensor.id, "valor": "150"}])
+
+        controle = ControleFluxo.objects.get(data=timezone.localdate())
+        self.assertEqual(controle.status, "on")
+        self.assertFalse(controle.desligamento_automatico_ocorreu)
+        # O alerta é enviado mesmo assim
+        self.assertTrue(controle.email_enviado_hoje)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def test_status_invalido(self):
+        resposta = self.patch("/controle-fluxo/alterar_status/", {"status": "talvez"})
+
+        self.assertEqual(resposta.status_code, 400)
+
+
+class StatusControleTests(FluxoTestCase):
+    def test_status_padrao_sem_gravar(self):
+        resposta = self.client.get("/controle-fluxo/")
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["status"], "on")
+        self.assertFalse(resposta.data["desligamento_automatico_ocorreu"])
+        self.assertFalse(ControleFluxo.objects.exists())
+
+    def test_status_em_cache_ate_a_proxima_gravacao(self):
+        hoje = timezone.localdate()
+        controle_fluxo.status_do_dia(hoje)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(controle_fluxo.status_do_dia(hoje)["status"], "on")
+
+        self.patch("/controle-fluxo/alterar_status/", {"status": "off"})
+        self.assertEqual(controle_fluxo.status_do_dia(hoje)["status"], "off")
+
+    def test_email_enfileirado_registrado_no_log(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            MetaConsumo.objects.create(meta_diaria_litros=Decimal("10"))
+            EmailNotification.objects.create(email="morador@example.com")
+
+        with self.assertLogs("fluxo.signals", "INFO") as logs:
+            self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "20"})
+
+        self.assertEqual(logs.output, ["INFO:fluxo.signals:Email de alerta enfileirado para 1 destinatário(s)"])
+
+
+class ConsumoMensalCacheTests(FluxoTestCase):
+    """Os totais dos meses e dias encerrados vêm do cache até o histórico ser reescrito"""
+
+    hoje = date(2025, 6, 15)
+
+    def setUp(self):
+        super().setUp()
+        localdate = timezone.localdate
+        self.enterContext(mock.patch(
+            "django.utils.timezone.localdate",
+            side_effect=lambda valor=None, tz=None: self.hoje if valor is None else localdate(valor, tz),
+        ))
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_leituras([
+                {"sensor": self.sensor.id, "valor": Decimal("10"), "data_hora": inicio_do_dia(date(2025, 3, 10))},
+                {"sensor": self.sensor.id, "valor": Decimal("13"), "data_hora": inicio_do_dia(date(2025, 6, 2))},
+                {"sensor": self.sensor.id, "valor": Decimal("18"), "data_hora": inicio_do_dia(self.hoje)},
+            ])
+        historico.invalidar()
+
+    def _meses(self):
+        resposta = self.client.get("/consumo-mensal/")
+        return {m["mes"]: m["consumo_total"] for m in resposta.data["meses"] if m["consumo_total"] != "0.00"}
+
+    def _dias(self):
+        resposta = self.client.get("/consumo-mensal/", {"mes": 6})
+        return [(d["data"], d["consumo_total"]) for d in resposta.data["consumo_por_dia"]]
+
+    def test_meses_fechados_em_cache(self):
+        self.assertEqual(self._meses(), {3: "10.00", 6: "8.00"})
+        ConsumoResidenciaDiario.objects.filter(data=date(2025, 3, 10)).update(consumo_total=Decimal("99"))
+        ConsumoResidenciaDiario.objects.filter(data=self.hoje).update(consumo_total=Decimal("1"))
+
+        # O mês atual é sempre consultado; março vem do cache
+        self.assertEqual(self._meses(), {3: "10.00", 6: "4.00"})
+
+        historico.invalidar()
+        self.assertEqual(self._meses(), {3: "99.00", 6: "4.00"})
+
+    def test_dias_fechados_em_cache(self):
+        self.assertEqual(self._dias(), [("02/06/2025", "3.00"), ("15/06/2025", "5.00")])
+        ConsumoDiario.objects.filter(data=date(2025, 6, 2)).update(consumo_total=Decimal("7"))
+        ConsumoDiario.objects.filter(data=self.hoje).update(consumo_total=Decimal("6"))
+
+        self.assertEqual(self._dias(), [("02/06/2025", "3.00"), ("15/06/2025", "6.00")])
+
+    def test_leitura_de_dia_encerrado_invalida(self):
+        self.assertEqual(self._meses(), {3: "10.00", 6: "8.00"})
+        outro = Sensor.objects.create(nome="jardim")
+
+        self.post("/fluxo/bulk/", [{"sensor": outro.id, "valor": "4", "data_hora": "2025-03-20T08:00:00"}])
+
+        self.assertEqual(self._meses(), {3: "14.00", 6: "8.00"})
+
+
+class RespostaCondicionalTests(FluxoTestCase):
+    def test_consumo_residencia_responde_304(self):
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "120"})
+        etag = self.client.get("/consumo-residencia/")["ETag"]
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get("/consumo-residencia/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Uma leitura nova muda o ETag
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "130"})
+        resposta = self.client.get("/consumo-residencia/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["total_residencia"], "130.00")
+
+    def test_edicao_de_leitura_muda_o_etag(self):
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "120"})
+        etag = self.client.get("/consumo-residencia/")["ETag"]
+
+        self.patch(f"/fluxo/{FluxoAgua.objects.get().id}/", {"valor": "100"})
+
+        self.assertEqual(self.client.get("/consumo-residencia/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_consumo_mensal_responde_304_por_parametros(self):
+        etag = self.client.get("/consumo-mensal/", {"mes": 1})["ETag"]
+
+        self.assertEqual(self.client.get("/consumo-mensal/", {"mes": 1}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get("/consumo-mensal/", {"mes": 2}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # Mês inválido: sem ETag, responde o erro
+        self.assertNotIn("ETag", self.client.get("/consumo-mensal/", {"mes": 13}))
+
+    def test_controle_fluxo_responde_304(self):
+        resposta = self.client.get("/controle-fluxo/")
+        etag = resposta["ETag"]
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/controle-fluxo/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.patch("/controle-fluxo/alterar_status/", {"status": "off"})
+        resposta = self.client.get("/controle-fluxo/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.data["status"], "off")
+        self.assertIn("Last-Modified", resposta)
+
+        ultima = resposta["Last-Modified"]
+        self.assertEqual(self.client.get("/controle-fluxo/", HTTP_IF_MODIFIED_SINCE=ultima).status_code, 304)
+
+
+class ConsumoPeriodoTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.outro = Sensor.objects.create(nome="banheiro")
+        registrar_leituras([
+            {"sensor": self.sensor.id, "valor": Decimal("10"), "data_hora": inicio_do_dia(date(2024, 12, 30))},
+            {"sensor": self.sensor.id, "valor": Decimal("15"), "data_hora": inicio_do_dia(date(2025, 1, 2))},
+            {"sensor": self.sensor.id, "valor": Decimal("17"), "data_hora": inicio_do_dia(date(2025, 1, 6))},
+            {"sensor": self.sensor.id, "valor": Decimal("20"), "data_hora": inicio_do_dia(date(2025, 2, 10))},
+            {"sensor": self.outro.id, "valor": Decimal("4"), "data_hora": inicio_do_dia(date(2025, 1, 2))},
+        ])
+
+    def _serie(self, **parametros):
+        resposta = self.client.get("/consumo/", {"inicio": "2024-12-01", "fim": "2025-12-31", **parametros})
+        self.assertEqual(resposta.status_code, 200)
+        return [(p["inicio"], p["consumo_total"]) for p in resposta.data["serie"]], resposta.data["total"]
+
+    def test_granularidades(self):
+        self.assertEqual(self._serie(granularidade="ano"), ([("2024-01-01", "10.00"), ("2025-01-01", "14.00")], "24.00"))
+        self.assertEqual(
+            self._serie(granularidade="mes"),
+            ([("2024-12-01", "10.00"), ("2025-01-01", "11.00"), ("2025-02-01", "3.00")], "24.00"),
+        )
+        # Semanas começam na segunda-feira
+        self.assertEqual(
+            self._serie(granularidade="semana"),
+            ([("2024-12-30", "19.00"), ("2025-01-06", "2.00"), ("2025-02-10", "3.00")], "24.00"),
+        )
+
+    def test_por_sensor_e_dia(self):
+        self.assertEqual(
+            self._serie(granularidade="dia", sensor=self.sensor.id, fim="2025-01-31"),
+            ([("2024-12-30", "10.00"), ("2025-01-02", "5.00"), ("2025-01-06", "2.00")], "17.00"),
+        )
+
+    @override_settings(FLUXO_CONSUMO_MAX_PONTOS=31)
+    def test_limite_de_pontos(self):
+        parametros = {"inicio": "2025-01-01", "fim": "2025-02-01"}
+
+        resposta = self.client.get("/consumo/", {**parametros, "granularidade": "dia"})
+        self.assertEqual(resposta.status_code, 400)
+        self.assertIn("31 pontos", resposta.data["error"])
+        self.assertEqual(self.client.get("/consumo/", {**parametros, "granularidade": "semana"}).status_code, 200)
+
+    def test_parametros_invalidos(self):
+        for parametros in (
+            {"inicio": "01/01/2025"},
+            {"inicio": "2025-02-30"},
+            {"fim": "2025-13-01"},
+            {"inicio": "2025-02-01", "fim": "2025-01-01"},
+            {"granularidade": "hora"},
+            {"sensor": "x"},
+        ):
+            self.assertEqual(self.client.get("/consumo/", parametros).status_code, 400, parametros)
+
+
+class IngestaoAssincronaTests(FluxoTestCase):
+    async def _post(self, dados):
+        corpo = dados if isinstance(dados, str) else json.dumps(dados)
+        return await AsyncClient().post("/fluxo/async/", corpo, content_type="application/json")
+
+    async def test_uma_leitura(self):
+        resposta = await self._post({"sensor": self.sensor.id, "valor": "12,5"})
+
+        self.assertEqual(resposta.status_code, 201)
+        self.assertEqual(json.loads(resposta.content), {"registradas": 1})
+        leitura = await FluxoAgua.objects.aget()
+        self.assertEqual(leitura.valor_diferenca, Decimal("12.50"))
+
+    async def test_lista_usa_a_regra_do_bulk(self):
+        resposta = await self._post([
+            {"sensor": self.sensor.id, "valor": "20", "data_hora": "2025-01-01T10:00:00"},
+            {"sensor": self.sensor.id, "valor": "15", "data_hora": "2025-01-01T09:00:00"},
+        ])
+
+        self.assertEqual(resposta.status_code, 201)
+        diferencas = [
+            d async for d in FluxoAgua.objects.order_by("data_hora").values_list("valor_diferenca", flat=True)
+        ]
+        self.assertEqual(diferencas, [Decimal("15.00"), Decimal("5.00")])
+        self.assertEqual((await ConsumoDiario.objects.aget(sensor=self.sensor)).consumo_total, Decimal("20.00"))
+
+    async def test_corpo_invalido(self):
+        for corpo in ("{", json.dumps({"sensor": self.sensor.id}), json.dumps({"sensor": 999, "valor": "1"})):
+            resposta = await self._post(corpo)
+            self.assertEqual(resposta.status_code, 400, corpo)
+            self.assertIn("error", json.loads(resposta.content))
+        self.assertFalse(await FluxoAgua.objects.aexists())
+
+    async def test_apenas_post(self):
+        self.assertEqual((await AsyncClient().get("/fluxo/async/")).status_code, 405)
+
+    async def test_exportacao_em_streaming_no_asgi(self):
+        await sync_to_async(registrar_leituras)([
+            {"sensor": self.sensor.id, "valor": Decimal(valor)} for valor in ("1", "2", "3")
+        ])
+
+        resposta = await AsyncClient().get("/fluxo/export/", {"formato": "ndjson"})
+
+        self.assertTrue(resposta.is_async)
+        conteudo = b"".join([bloco async for bloco in resposta.streaming_content]).decode()
+        self.assertEqual(len(conteudo.splitlines()), 3)
+
+    def test_middlewares_assincronos(self):
+        # Um único middleware só síncrono faria o ASGI executar a cadeia inteira em async_to_sync
+        for caminho in settings.MIDDLEWARE:
+            self.assertTrue(getattr(import_string(caminho), "async_capable", False), caminho)
+
+
+class ProtocoloLinhasTests(unittest.TestCase):
+    def test_linha_completa(self):
+        leitura = interpretar_linha("3 1523,75 1735689600")
+
+        self.assertEqual(leitura["sensor"], 3)
+        self.assertEqual(leitura["valor"], Decimal("1523.75"))
+        self.assertEqual(leitura["data_hora"], datetime(2025, 1, 1, tzinfo=dt_timezone.utc))
+
+    def test_timestamp_iso_e_hora_de_chegada(self):
+        self.assertTrue(timezone.is_aware(interpretar_linha("3 10 2025-01-01T08:00:00")["data_hora"]))
+        antes = timezone.now()
+        self.assertGreaterEqual(interpretar_linha("3 10")["data_hora"], antes)
+
+    def test_linhas_invalidas(self):
+        for linha in ("3", "3 1 2 4", "x 1", "0 1", "3 abc", "3 1e9", "3 NaN", "3 1 amanhã"):
+            with self.assertRaises(ValueError, msg=linha):
+                interpretar_linha(linha)
+
+
+class ServidorIngestaoTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        # _gravar descarta as conexões antigas; aqui a conexão é a da transação do teste
+        self.enterContext(mock.patch("fluxo.management.commands.run_ingest_server.close_old_connections"))
+
+    def _comando(self, lote=2, max_pendentes=100):
+        comando = run_ingest_server.Command(stdout=StringIO(), stderr=StringIO())
+        comando.opcoes = {"lote": lote, "max_pendentes": max_pendentes, "verbosity": 1}
+        comando.pendentes = []
+        comando.totais = {"gravadas": 0, "descartadas": 0, "invalidas": 0, "perdidas": 0}
+        comando.gravando = asyncio.Lock()
+        comando.tarefas = set()
+        return comando
+
+    async def _valores(self):
+        return [v async for v in FluxoAgua.objects.order_by("data_hora").values_list("valor", flat=True)]
+
+    async def test_tcp_responde_e_grava_ao_completar_o_lote(self):
+        comando = self._comando(lote=2)
+        servidor = await asyncio.start_server(comando._atender_tcp, "127.0.0.1", 0)
+        porta = servidor.sockets[0].getsockname()[1]
+        leitor, escritor = await asyncio.open_connection("127.0.0.1", porta)
+
+        escritor.write(f"{self.sensor.id} 10 1735689600\nlixo\n\n".encode())
+        self.assertEqual(await leitor.readline(), b"OK\n")
+        self.assertTrue((await leitor.readline()).startswith(b"ERRO "))
+        self.assertEqual(await self._valores(), [])
+
+        escritor.write(f"{self.sensor.id} 15 1735693200\n".encode())
+        self.assertEqual(await leitor.readline(), b"OK\n")
+        escritor.close()
+        servidor.close()
+        await servidor.wait_closed()
+
+        self.assertEqual(await self._valores(), [Decimal("10.00"), Decimal("15.00")])
+        self.assertEqual(comando.totais, {"gravadas": 2, "descartadas": 0, "invalidas": 1, "perdidas": 0})
+
+    async def test_udp_grava_em_lote_e_limita_pendentes(self):
+        comando = self._comando(lote=3, max_pendentes=4)
+
+        comando._receber_udp(f"{self.sensor.id} 1 1735689600\n{self.sensor.id} 2 1735693200\n".encode())
+        self.assertEqual(comando.tarefas, set())
+        comando._receber_udp(f"999 1\n{self.sensor.id} 3\n{self.sensor.id} 4\n".encode())
+        await asyncio.gather(*comando.tarefas)
+
+        # O sensor 999 não existe; a última linha excedeu --max-pendentes
+        self.assertEqual(await self._valores(), [Decimal("1.00"), Decimal("2.00"), Decimal("3.00")])
+        self.assertEqual(comando.totais, {"gravadas": 3, "descartadas": 1, "invalidas": 0, "perdidas": 1})
+
+    async def test_leituras_atrasadas_descartadas(self):
+        comando = self._comando(lote=10)
+        comando._receber(f"{self.sensor.id} 20 1735693200")
+        await comando._gravar_pendentes()
+        comando._receber(f"{self.sensor.id} 10 1735689600")
+        await comando._gravar_pendentes()
+
+        self.assertEqual(await self._valores(), [Decimal("20.00")])
+        self.assertEqual((comando.totais["gravadas"], comando.totais["descartadas"]), (1, 1))
+
+    def test_opcoes_invalidas(self):
+        for opcoes in ({"lote": 0}, {"intervalo": 0}, {"tcp": 0, "udp": 0}):
+            with self.assertRaises(CommandError, msg=opcoes):
+                call_command("run_ingest_server", **opcoes)
+
+
+@override_settings(
+    FLUXO_BUFFER_ESCRITA=True,
+    FLUXO_BUFFER_MAX=2,
+    FLUXO_BUFFER_LOTE=100,
+    # A thread não grava durante o teste: só a requisição com o buffer cheio e descarregar()
+    FLUXO_BUFFER_INTERVALO_MS=60000,
+)
+class BufferEscritaTests(TransactionTestCase):
+    """O buffer é gravado por outras conexões, fora da transação do teste"""
+
+    def setUp(self):
+        configuracao.invalidar()
+        controle_fluxo.invalidar()
+        historico.invalidar()
+        self.client = APIClient()
+        self.sensor = Sensor.objects.create(nome="jardim")
+        # Ao final: grava o que restou e faz o próximo teste iniciar uma thread nova
+        self.addCleanup(setattr, buffer_escrita, "_thread", None)
+        self.addCleanup(buffer_escrita.descarregar)
+
+    def _post(self, valor):
+        return self.client.post("/fluxo/", {"sensor": self.sensor.id, "valor": valor}, format="json")
+
+    def test_buffer_cheio_grava_em_ordem(self):
+        registrar_leituras([{"sensor": self.sensor.id, "valor": Decimal("1000")}])
+
+        for valor in ("1001", "1002"):
+            self.assertEqual(self._post(valor).status_code, 202)
+        self.assertEqual(FluxoAgua.objects.count(), 1)
+
+        # A terceira leitura enche o buffer: a fila inteira é gravada antes da resposta
+        self.assertEqual(self._post("1003").status_code, 202)
+
+        self.assertEqual(
+            _diferencas(self.sensor),
+            [Decimal("1000.00"), Decimal("1.00"), Decimal("1.00"), Decimal("1.00")],
+        )
+        self.assertEqual(
+            ConsumoDiario.objects.get(sensor=self.sensor, data=timezone.localdate()).consumo_total,
+            Decimal("1003.00"),
+        )
+        self.assertGreater(buffer_escrita.metricas()["gravacoes_na_requisicao"], 0)
+
+    def test_descarregar_grava_pendentes(self):
+        self._post("10")
+        self._post("15")
+        self.assertFalse(FluxoAgua.objects.exists())
+        self.assertEqual(buffer_escrita.metricas()["pendentes"], 2)
+
+        buffer_escrita.descarregar()
+
+        self.assertEqual(_diferencas(self.sensor), [Decimal("10.00"), Decimal("5.00")])
+
+    @override_settings(FLUXO_BUFFER_MAX=10, FLUXO_BUFFER_LOTE=2)
+    def test_thread_grava_ao_completar_o_lote(self):
+        lotes = buffer_escrita.metricas()["lotes"]
+        self._post("10")
+        self._post("15")
+
+        # Espera pelos contadores do buffer: consultar a tabela durante a gravação
+        # falharia no SQLite (banco de teste em memória compartilhada)
+        limite = time.monotonic() + 5
+        while buffer_escrita.metricas()["lotes"] == lotes and time.monotonic() < limite:
+            time.sleep(0.01)
+        self.assertEqual(_diferencas(self.sensor), [Decimal("10.00"), Decimal("5.00")])
+
+    def test_leitura_invalida_recusada(self):
+        resposta = self._post("abc")
+
+        self.assertEqual(resposta.status_code, 400)
+        self.assertEqual(buffer_escrita.metricas()["pendentes"], 0)
+
+
+class DadosBenchmarkTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dados = importlib.import_module("benchmarks.dados")
+
+    def _consolidados(self):
+        return (
+            sorted(ConsumoDiario.objects.values_list("sensor_id", "data", "consumo_total", "hora")),
+            sorted(ConsumoHorario.objects.values_list("sensor_id", "inicio", "consumo_total")),
+            sorted(ConsumoResidenciaDiario.objects.values_list("data", "consumo_total")),
+        )
+
+    def test_mesma_semente_mesmos_valores(self):
+        agora = timezone.now()
+
+        def gerar(semente):
+            return list(self.dados.gerar_leituras(50, [1, 2], 1, semente, agora))
+
+        self.assertEqual(gerar(7), gerar(7))
+        self.assertNotEqual(gerar(7), gerar(8))
+        self.assertEqual(len(gerar(7)), 50)
+
+    def test_consolidados_iguais_ao_rebuild(self):
+        self.dados.gerar(400, sensores=2, anos=1, semente=7, saida=StringIO())
+
+        self.assertEqual(FluxoAgua.objects.count(), 400)
+        gerados = self._consolidados()
+        call_command("rebuild_consumo_diario", stdout=StringIO())
+        self.assertEqual(self._consolidados(), gerados)
+
+    def test_nao_apaga_sem_substituir(self):
+        registrar_leituras([{"sensor": self.sensor.id, "valor": Decimal("1")}])
+
+        with self.assertRaises(SystemExit):
+            self.dados.gerar(10, saida=StringIO())
+        self.assertEqual(FluxoAgua.objects.count(), 1)
+
+
+class ImportacaoTests(FluxoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.dia = timezone.localdate() - timedelta(days=3)
+        self.inicio = inicio_do_dia(self.dia)
+        self.diretorio = self.enterContext(tempfile.TemporaryDirectory())
+
+    def _registros(self, valores_e_horas):
+        return [
+            (numero, {"sensor": str(self.sensor.id), "valor": valor, "data_hora": (self.inicio + timedelta(hours=hora)).isoformat()})
+            for numero, (valor, hora) in enumerate(valores_e_horas, start=1)
+        ]
+
+    def _importar(self, *arquivos, **opcoes):
+        saida = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("import_leituras", *arquivos, stdout=saida, **opcoes)
+        return saida.getvalue()
+
+    def _arquivo(self, nome, conteudo):
+        caminho = os.path.join(self.diretorio, nome)
+        abrir = gzip.open if nome.endswith(".gz") else open
+        with abrir(caminho, "wt", encoding="utf-8") as arquivo:
+            arquivo.write(conteudo)
+        return caminho
+
+    def test_importa_com_contador_reiniciado(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resumo = importar(self._registros([("10", 1), ("15", 2), ("3", 3)]), lote=2)
+
+        self.assertEqual(resumo["importadas"], 3)
+        self.assertEqual(_diferencas(self.sensor), [Decimal("10.00"), Decimal("5.00"), Decimal("3.00")])
+        self.assertEqual(ConsumoDiario.objects.get(sensor=self.sensor, data=self.dia).consumo_total, Decimal("18.00"))
+        self.assertEqual(ConsumoResidenciaDiario.consumo_do_dia(self.dia), Decimal("18.00"))
+
+    def test_leitura_fora_de_ordem_entre_blocos(self):
+        with self.assertRaises(ErroImportacao):
+            importar(self._registros([("10", 1), ("30", 3), ("20", 2)]), lote=2)
+        self.assertFalse(FluxoAgua.objects.exists())
+
+    def test_comando_com_csv_e_ndjson_compactado(self):
+        hora = (self.inicio + timedelta(hours=1)).isoformat()
+        csv_ = self._arquivo("a.csv", f"sensor;valor;data_hora\n{self.sensor.id};10,5;{hora}\n")
+        ndjson = self._arquivo("b.ndjson.gz", json.dumps({
+            "sensor": self.sensor.id, "valor": "12", "data_hora": (self.inicio + timedelta(hours=2)).isoformat(),
+        }) + "\n")
+
+        saida = self._importar(csv_, ndjson, delimitador=";")
+
+        self.assertIn("2 leituras importadas", saida)
+        self.assertEqual(_diferencas(self.sensor), [Decimal("10.50"), Decimal("1.50")])
+        # A ingestão continua a partir da última leitura importada
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "20"})
+        self.assertEqual(_diferencas(self.sensor)[-1], Decimal("8.00"))
+
+    def test_periodo_anterior_corrige_a_leitura_seguinte(self):
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "50"})
+        caminho = self._arquivo("antes.csv", "sensor,valor,data_hora\n" + "".join(
+            f"{self.sensor.id},{valor},{(self.inicio + timedelta(hours=hora)).isoformat()}\n"
+            for valor, hora in (("10", 1), ("20", 2))
+        ))
+
+        self._importar(caminho)
+
+        self.assertEqual(
+            list(FluxoAgua.objects.order_by("data_hora").values_list("valor_diferenca", flat=True)),
+            [Decimal("10.00"), Decimal("10.00"), Decimal("30.00")],
+        )
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "55"})
+        self.assertEqual(_diferencas(self.sensor)[-1], Decimal("5.00"))
+
+    def test_erros_cancelam_a_importacao(self):
+        registrar_leituras([{"sensor": self.sensor.id, "valor": Decimal("1"), "data_hora": self.inicio + timedelta(hours=2)}])
+        sobreposto = self._arquivo("sobreposto.csv", "sensor,valor,data_hora\n" + "".join(
+            f"{self.sensor.id},{valor},{(self.inicio + timedelta(hours=hora)).isoformat()}\n"
+            for valor, hora in (("10", 1), ("20", 3))
+        ))
+        invalido = self._arquivo("invalido.csv", f"sensor,valor,data_hora\n{self.sensor.id},abc,{self.inicio.isoformat()}\n")
+        sem_coluna = self._arquivo("sem_coluna.csv", f"sensor,valor\n{self.sensor.id},1\n")
+
+        for caminho in (sobreposto, invalido, sem_coluna):
+            with self.assertRaises(CommandError, msg=caminho):
+                self._importar(caminho)
+        self.assertEqual(FluxoAgua.objects.count(), 1)
+
+        self.assertIn("1 linhas inválidas ignoradas", self._importar(invalido, ignorar_invalidas=True))
+
+
+class MetricasTests(FluxoTestCase):
+    def _valor(self, nome, **rotulos):
+        return REGISTRY.get_sample_value(nome, rotulos) or 0.0
+
+    def test_formato_do_prometheus(self):
+        resposta = self.client.get("/metrics")
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta["Content-Type"], CONTENT_TYPE_LATEST)
+        self.assertIn(b"# TYPE fluxo_http_requisicao_segundos histogram", resposta.content)
+
+    def test_leituras_por_sensor(self):
+        sensor = str(self.sensor.id)
+        antes = self._valor("fluxo_leituras_registradas_total", sensor=sensor)
+
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "10"})
+        self.post("/fluxo/bulk/", [{"sensor": self.sensor.id, "valor": v} for v in ("11", "12")])
+
+        self.assertEqual(self._valor("fluxo_leituras_registradas_total", sensor=sensor), antes + 3)
+        self.assertIn(
+            f'fluxo_leituras_registradas_total{{sensor="{sensor}"}} {antes + 3}'.encode(),
+            self.client.get("/metrics").content,
+        )
+
+    def test_requisicoes_e_consultas_por_view(self):
+        view = resolve("/fluxo/").view_name
+        requisicoes = self._valor("fluxo_http_requisicao_segundos_count", view=view, metodo="POST", status="201")
+        consultas = self._valor("fluxo_http_consultas_por_requisicao_sum", view=view)
+
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "10"})
+
+        self.assertEqual(
+            self._valor("fluxo_http_requisicao_segundos_count", view=view, metodo="POST", status="201"),
+            requisicoes + 1,
+        )
+        self.assertGreater(self._valor("fluxo_http_consultas_por_requisicao_sum", view=view), consultas)
+
+    def test_transicoes_do_controle(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            MetaConsumo.objects.create(meta_diaria_litros=Decimal("10"))
+        antes = self._valor("fluxo_controle_transicoes_total", transicao="desligamento_automatico")
+
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "20"})
+        self.post("/fluxo/", {"sensor": self.sensor.id, "valor": "30"})
+
+        self.assertEqual(
+            self._valor("fluxo_controle_transicoes_total", transicao="desligamento_automatico"), antes + 1
+        )
+
+
+class ServerTimingTests(FluxoTestCase):
+    def _metricas(self, resposta):
+        return {item.split(";")[0]: item for item in resposta["Server-Timing"].split(", ")}
+
+    def test_desativado_por_padrao(self):
+        self.assertNotIn("Server-Timing", self.client.get("/consumo-residencia/"))
+
+    @override_settings(FLUXO_SERVER_TIMING=True, FLUXO_REQUISICAO_LENTA_MS=0)
+    def test_sql_serializacao_e_total(self):
+        registrar_leituras([{"sensor": self.sensor.id, "valor": Decimal("10")}])
+
+        metricas_timing = self._metricas(self.client.get("/consumo-residencia/"))
+
+        self.assertEqual(list(metricas_timing), ["sql", "serializacao", "total"])
+        self.assertRegex(metricas_timing["sql"], r'^sql;dur=[\d.]+;desc="[1-9]\d* consultas"$')
+
+    @override_settings(FLUXO_SERVER_TIMING=True, FLUXO_REQUISICAO_LENTA_MS=0)
+    def test_view_assincrona(self):
+        resposta = async_to_sync(AsyncClient().post)(
+            "/fluxo/async/", {"sensor": self.sensor.id, "valor": "1"}, content_type="application/json"
+        )
+
+        self.assertEqual(resposta.status_code, 201)
+        self.assertIn("total", self._metricas(resposta))
+
+    @override_settings(FLUXO_SERVER_TIMING=True, FLUXO_REQUISICAO_LENTA_MS=1, FLUXO_REQUISICAO_LENTA_CONSULTAS=1)
+    def test_requisicao_lenta_registrada_no_log(self):
+        with mock.patch("fluxo.middleware.time.perf_counter", side_effect=itertools.count(step=1)):
+            with self.assertLogs("fluxo.middleware", "WARNING") as logs:
+                self.client.get("/consumo-residencia/")
+
+        self.assertEqual(len(logs.records), 1)
+        linhas = logs.records[0].getMessage().splitlines()
+        self.assertTrue(linhas[0].startswith("Requisição lenta: GET /consumo-residencia/ -> 200 em "))
+        self.assertEqual(len(linhas), 2)
+        self.assertTrue(linhas[1].startswith("   - "))
+
+
+class ConfiguracaoBancoTests(unittest.TestCase):
+    """Opções de banco e cache montadas em setup/settings.py a partir das variáveis de ambiente"""
+
+    def _settings(self, **ambiente):
+        caminho = os.path.join(settings.BASE_DIR, "setup", "settings.py")
+        ambiente = {"DATABASE_URL": "postgresql://u:s@db:5432/fluxo", **ambiente}
+        with mock.patch.dict(os.environ, ambiente):
+            for nome in ("FLUXO_DB_POOL", "FLUXO_DB_PREPARE_THRESHOLD", "FLUXO_CACHE_DIR"):
+                if nome not in ambiente:
+                    os.environ.pop(nome, None)
+            return runpy.run_path(caminho)
+
+    def test_pool_e_prepared_statements_por_padrao(self):
+        banco = self._settings(FLUXO_DB_POOL_MAX="20", FLUXO_DB_CONN_MAX_AGE="60")["DATABASES"]["default"]
+
+        self.assertEqual(banco["CONN_MAX_AGE"], 0)
+        self.assertTrue(banco["CONN_HEALTH_CHECKS"])
+        self.assertEqual(banco["OPTIONS"]["pool"], {"min_size": 2, "max_size": 20, "timeout": 10.0})
+        self.assertTrue(banco["OPTIONS"]["server_side_binding"])
+        self.assertEqual(banco["OPTIONS"]["prepare_threshold"], 5)
+
+    def test_sem_pool_e_sem_prepared_statements(self):
+        banco = self._settings(
+            FLUXO_DB_POOL="False", FLUXO_DB_CONN_MAX_AGE="60", FLUXO_DB_PREPARE_THRESHOLD=""
+        )["DATABASES"]["default"]
+
+        self.assertEqual(banco["CONN_MAX_AGE"], 60)
+        self.assertEqual(banco.get("OPTIONS", {}), {})
+
+    def test_sqlite_sem_opcoes_do_postgresql(self):
+        banco = self._settings(DATABASE_URL="sqlite:////tmp/fluxo.db")["DATABASES"]["default"]
+
+        self.assertNotIn("pool", banco.get("OPTIONS", {}))
+        self.assertNotIn("server_side_binding", banco.get("OPTIONS", {}))
+
+    def test_cache_em_arquivos(self):
+        self.assertEqual(
+            self._settings()["CACHES"]["default"]["BACKEND"], "django.core.cache.backends.locmem.LocMemCache"
+        )
+        cache_ = self._settings(FLUXO_CACHE_DIR="/tmp/fluxo-cache")["CACHES"]["default"]
+        self.assertEqual(cache_["BACKEND"], "django.core.cache.backends.filebased.FileBasedCache")
+        self.assertEqual(cache_["LOCATION"], "/tmp/fluxo-cache")
+
+
+class IngestaoEmLotesTests(FluxoTestCase):
+    def test_lote_acima_do_limite_de_parametros(self):
+        # 4 parâmetros por leitura: em um único INSERT, passaria de 65535 com server_side_binding
+        inicio = timezone.now() - timedelta(days=1)
+        leituras = [
+            {"sensor": self.sensor.id, "valor": Decimal(i), "data_hora": inicio + timedelta(seconds=i)}
+            for i in range(1, 16501)
+        ]
+
+        with CaptureQueriesContext(connection) as consultas:
+            registrar_leituras(leituras)
+
+        self.assertEqual(FluxoAgua.objects.count(), 16500)
+        inserts = [c for c in consultas if c["sql"].startswith('INSERT INTO "fluxo_fluxoagua"')]
+        self.assertGreaterEqual(len(inserts), 17)
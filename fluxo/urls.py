@@ -1,9 +1,14 @@
 from django.urls import path, include
 from rest_framework import routers
 from .views import (
+    registrar_leituras_async,
+    metricas_prometheus,
     FluxoViewSet,
     ConsumoResidenciaView,
     ConsumoMensalView,
+    ConsumoHorarioView,
+    ConsumoDiarioView,
+    ConsumoView,
     SensorViewSet,
     MetaConsumoViewSet,
     ControleFluxoViewSet,
@@ -15,10 +20,16 @@ router.register("sensores", SensorViewSet, basename="sensor")
 router.register("fluxo", FluxoViewSet, basename="fluxo")
 router.register("consumo-residencia", ConsumoResidenciaView, basename="consumo_residencia")
 router.register("consumo-mensal", ConsumoMensalView, basename="consumo_mensal")
+router.register("consumo-horario", ConsumoHorarioView, basename="consumo_horario")
+router.register("consumo-diario", ConsumoDiarioView, basename="consumo_diario")
+router.register("consumo", ConsumoView, basename="consumo")
 router.register("meta-consumo", MetaConsumoViewSet, basename="meta_consumo")
 router.register("controle-fluxo", ControleFluxoViewSet, basename="controle_fluxo")
 router.register("emails-notificacao", EmailNotificationViewSet, basename="email_notificacao")
 
 urlpatterns = [
+    # Antes do router: "async" seria interpretado como o id de uma leitura em /fluxo/<pk>/
+    path("fluxo/async/", registrar_leituras_async, name="fluxo_async"),
+    path("metrics", metricas_prometheus, name="metricas"),
     path("", include(router.urls)),
 ]
@@ -0,0 +1,96 @@
+"""
+Contadores de versão compartilhados entre os workers do mesmo host.
+
+Cada cache em memória guarda a versão com que foi carregado e se descarta
+quando o contador muda. O contador é incrementado (após o commit) por quem
+altera os dados de origem, então todos os processos percebem a mudança sem
+consultar o banco.
+
+Os contadores ficam em um arquivo mapeado em memória dentro de
+``settings.FLUXO_ESTADO_DIR`` (o mesmo diretório de fluxo.estado_sensores).
+Sem o diretório configurado, os contadores valem apenas para o processo e
+os caches usam também um tempo de expiração (FLUXO_CONFIG_TTL).
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+NOME_ARQUIVO = "versoes.bin"
+
+# Posição de cada contador no arquivo
+CONTADORES = {
+    "configuracao": 0,
+    "controle": 1,
+    "historico": 2,
+    "consumo": 3,
+}
+CONTADOR = struct.Struct("<Q")
+TAMANHO = 16 * CONTADOR.size
+
+_lock_thread = threading.Lock()
+_mapa = None
+_arquivo = None
+_locais = defaultdict(int)
+
+
+def ativo():
+    return bool(settings.FLUXO_ESTADO_DIR)
+
+
+def _abrir():
+    global _mapa, _arquivo
+    if _mapa is not None:
+        return _mapa
+    with _lock_thread:
+        if _mapa is None:
+            os.makedirs(settings.FLUXO_ESTADO_DIR, exist_ok=True)
+            _arquivo = open(os.path.join(settings.FLUXO_ESTADO_DIR, NOME_ARQUIVO), "a+b")
+            fcntl.lockf(_arquivo, fcntl.LOCK_EX)
+            try:
+                if os.fstat(_arquivo.fileno()).st_size < TAMANHO:
+                    os.ftruncate(_arquivo.fileno(), TAMANHO)
+            finally:
+                fcntl.lockf(_arquivo, fcntl.LOCK_UN)
+            _mapa = mmap.mmap(_arquivo.fileno(), TAMANHO)
+    return _mapa
+
+
+def versao(nome):
+    """Versão atual do contador ``nome``"""
+    if not ativo():
+        return _locais[nome]
+    return CONTADOR.unpack_from(_abrir(), CONTADORES[nome] * CONTADOR.size)[0]
+
+
+def incrementar(nome):
+    """Invalida os caches que dependem de ``nome`` em todos os processos do host"""
+    with _lock_thread:
+        _locais[nome] += 1
+    if not ativo():
+        return
+    mapa = _abrir()
+    offset = CONTADORES[nome] * CONTADOR.size
+    fcntl.lockf(_arquivo, fcntl.LOCK_EX, CONTADOR.size, offset, os.SEEK_SET)
+    try:
+        CONTADOR.pack_into(mapa, offset, CONTADOR.unpack_from(mapa, offset)[0] + 1)
+    finally:
+        fcntl.lockf(_arquivo, fcntl.LOCK_UN, CONTADOR.size, offset, os.SEEK_SET)
+
+
+def marca(*nomes):
+    """
+    Texto com as versões dos contadores ``nomes``, usado para compor ETags.
+    Sem estado compartilhado inclui também o período atual de FLUXO_CONFIG_TTL
+    segundos, para que alterações feitas em outros processos apareçam depois
+    desse tempo.
+    """
+    partes = [str(versao(nome)) for nome in nomes]
+    if not ativo():
+        partes.append(str(int(time.time() // settings.FLUXO_CONFIG_TTL)))
+    return ".".join(partes)
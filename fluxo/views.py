@@ -1,18 +1,50 @@
+import json
+from collections import defaultdict
+from datetime import timedelta
 from decimal import Decimal
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import F, Max, Sum
+from django.db.models.functions import TruncMonth, TruncWeek, TruncYear
+from django.http import HttpResponse, JsonResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.decorators import method_decorator
 from django.utils.timezone import make_aware
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_POST
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.serializers import ListSerializer
 from rest_framework.viewsets import ModelViewSet, ViewSet
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from .models import FluxoAgua, Sensor, ConsumoDiario, MetaConsumo, ControleFluxo, EmailNotification
-from .serializers import FluxoAguaSerializer, SensorSerializer, MetaConsumoSerializer, ControleFluxoSerializer, EmailNotificationSerializer
+from .models import FluxoAgua, Sensor, ConsumoDiario, ConsumoHorario, ConsumoResidenciaDiario, DiaCompactado, MetaConsumo, ControleFluxo, EmailNotification, EmailOutbox
+from .serializers import FluxoAguaSerializer, SensorSerializer, MetaConsumoSerializer, ControleFluxoSerializer, EmailNotificationSerializer, LeituraLoteSerializer
+from . import buffer_escrita, controle_fluxo, estado_sensores, historico, metricas, versoes
+from .ingestao import calcular_valor_diferenca, registrar_leituras, ultimo_valor_do_sensor
+from .exportacao import FORMATOS, resposta_exportacao
+from .pagination import LeituraCursorPagination
+from .periodos import GRANULARIDADES, inicio_do_dia, intervalo_do_dia, numero_de_periodos
+from .rollups import MINUTOS_DIA, acumular_leituras, inicio_intervalo
+
+PARAMETROS_FILTRO_LEITURAS = [
+    openapi.Parameter('sensor', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                      description="Apenas leituras do sensor"),
+    openapi.Parameter('desde', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description="Leituras a partir desta data (AAAA-MM-DD) ou data/hora ISO 8601"),
+    openapi.Parameter('ate', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                      description="Leituras até esta data, inclusive (AAAA-MM-DD), ou antes desta data/hora ISO 8601"),
+]
+
+PARAMETRO_FORMATO = openapi.Parameter(
+    'formato', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=list(FORMATOS), default='csv',
+    description="Formato do arquivo: csv (padrão) ou ndjson (um objeto JSON por linha)"
+)
 
 
 class SensorViewSet(ModelViewSet):
@@ -23,9 +55,47 @@ class SensorViewSet(ModelViewSet):
 class FluxoViewSet(ModelViewSet):
     serializer_class = FluxoAguaSerializer
     queryset = FluxoAgua.objects.all().order_by("-id")
-    
+    pagination_class = LeituraCursorPagination
 
+    @swagger_auto_schema(
+        operation_description=(
+            "Lista as leituras da mais recente para a mais antiga, paginadas por cursor. "
+            "Use o link 'next' da resposta para a página seguinte."
+        ),
+        manual_parameters=PARAMETROS_FILTRO_LEITURAS
+    )
+    def list(self, request, *args, **kwargs):
+        queryset, erro = _filtrar_leituras(self.get_queryset(), request.query_params)
+        if erro:
+            return Response({"error": erro}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Registra uma leitura. Com o buffer de escrita ativo (FLUXO_BUFFER_ESCRITA), a "
+            "leitura é validada e respondida com 202, e gravada em lote logo em seguida."
+        ),
+        responses={
+            201: FluxoAguaSerializer,
+            202: openapi.Response(
+                description="Leitura aceita no buffer de escrita",
+                examples={
+                    "application/json": {
+                        "sensor": 1,
+                        "valor": "1523.75",
+                        "data_hora": "2025-01-15T14:30:00-03:00"
+                    }
+                }
+            )
+        }
+    )
     def create(self, request, *args, **kwargs):
+        if buffer_escrita.ativo():
+            return self._adicionar_ao_buffer(request)
+
         sensor_id = request.data.get("sensor")
         valor_str = request.data.get("valor")
 
@@ -35,23 +105,11 @@ class FluxoViewSet(ModelViewSet):
 
         valor_recebido = Decimal(valor_str)
 
-        # Busca última leitura do sensor
-        ultima_leitura = (
-            FluxoAgua.objects.filter(sensor_id=sensor_id).order_by("-id").first()
-        )
+        # Busca o último valor do sensor (estado compartilhado ou última leitura no banco)
+        ultimo_valor = ultimo_valor_do_sensor(sensor_id)
 
-        valor_diferenca = None
-
-        if ultima_leitura:
-            ultimo_valor = ultima_leitura.valor
-            
-            if valor_recebido < ultimo_valor:
-                valor_diferenca = valor_recebido
-            else:
-                valor_diferenca = valor_recebido - ultimo_valor
-        else:
-            # Primeira leitura do sensor → diferença será o próprio valor
-            valor_diferenca = valor_recebido
+        # Primeira leitura do sensor ou contador reiniciado → diferença será o próprio valor
+        valor_diferenca = calcular_valor_diferenca(valor_recebido, ultimo_valor)
 
         # Cria o registro com o valor original e a diferença
         data_para_salvar = request.data.copy()
@@ -60,7 +118,9 @@ class FluxoViewSet(ModelViewSet):
 
         serializer = self.get_serializer(data=data_para_salvar)
         serializer.is_valid(raise_exception=True)
-        fluxo = serializer.save()
+        # A leitura e o total do dia (atualizado pelo signal) são gravados na mesma transação
+        with transaction.atomic():
+            fluxo = serializer.save()
 
         # Garante que a data_hora seja timezone-aware
         if timezone.is_naive(fluxo.data_hora):
@@ -69,6 +129,121 @@ class FluxoViewSet(ModelViewSet):
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def _adicionar_ao_buffer(self, request):
+        """Valida a leitura e a adiciona ao buffer (gravado na requisição se estiver cheio)"""
+        dados = request.data.copy()
+        if isinstance(dados.get("valor"), str):
+            dados["valor"] = dados["valor"].strip().replace(',', '.')
+        serializer = self.get_serializer(data=dados)
+        serializer.is_valid(raise_exception=True)
+
+        # A data/hora é a do recebimento, não a da gravação do lote
+        leitura = {
+            "sensor": serializer.validated_data["sensor"].id,
+            "valor": serializer.validated_data["valor"],
+            "data_hora": serializer.validated_data.get("data_hora") or timezone.now(),
+        }
+        buffer_escrita.adicionar(leitura)
+        return Response(LeituraLoteSerializer(leitura).data, status=status.HTTP_202_ACCEPTED)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            acumular_leituras([serializer.instance], sinal=-1)
+            leitura = serializer.save()
+            acumular_leituras([leitura])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            acumular_leituras([instance], sinal=-1)
+            super().perform_destroy(instance)
+        # A leitura removida pode ser a última do sensor
+        estado_sensores.invalidar()
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Registra um lote de leituras de um ou mais sensores. As diferenças são "
+            "calculadas em ordem de data_hora por sensor e a meta diária é verificada "
+            "uma vez por lote."
+        ),
+        request_body=LeituraLoteSerializer(many=True),
+        responses={
+            201: openapi.Response(
+                description="Leituras registradas com sucesso",
+                examples={"application/json": {"registradas": 120}}
+            )
+        }
+    )
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Ingestão em lote: recebe uma lista de leituras"""
+        serializer = LeituraLoteSerializer(
+            data=request.data, many=True, max_length=settings.FLUXO_LOTE_MAX_LEITURAS
+        )
+        serializer.is_valid(raise_exception=True)
+        criadas = registrar_leituras(serializer.validated_data)
+        return Response({"registradas": len(criadas)}, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Exporta as leituras (em ordem de id) como arquivo CSV ou NDJSON, enviado em "
+            "streaming, com os mesmos filtros da listagem."
+        ),
+        manual_parameters=PARAMETROS_FILTRO_LEITURAS + [PARAMETRO_FORMATO],
+        responses={200: "Arquivo CSV ou NDJSON"}
+    )
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Exportação completa das leituras, sem paginação"""
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in FORMATOS:
+            return Response(
+                {"error": f"formato deve ser um de: {', '.join(FORMATOS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset, erro = _filtrar_leituras(FluxoAgua.objects.order_by("id"), request.query_params)
+        if erro:
+            return Response({"error": erro}, status=status.HTTP_400_BAD_REQUEST)
+
+        campos = {
+            "id": "id",
+            "sensor": "sensor_id",
+            "data_hora": "data_hora",
+            "valor": "valor",
+            "valor_diferenca": "valor_diferenca",
+        }
+        return resposta_exportacao(request, queryset, campos, formato, "leituras")
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Profundidade e contadores do buffer de escrita do processo que atendeu a "
+            "requisição (cada worker tem o seu buffer)."
+        ),
+        responses={
+            200: openapi.Response(
+                description="Métricas do buffer de escrita",
+                examples={
+                    "application/json": {
+                        "pid": 4242,
+                        "ativo": True,
+                        "pendentes": 37,
+                        "em_gravacao": 500,
+                        "capacidade": 10000,
+                        "gravadas": 120500,
+                        "descartadas": 0,
+                        "falhas": 0,
+                        "gravacoes_na_requisicao": 0,
+                        "lotes": 310,
+                        "ultima_gravacao": "2025-01-15T17:30:00.120000+00:00"
+                    }
+                }
+            )
+        }
+    )
+    @action(detail=False, methods=['get'])
+    def buffer(self, request):
+        """Métricas do buffer de escrita do POST /fluxo/"""
+        return Response(buffer_escrita.metricas())
+
     @action(detail=False, methods=['post'])
     def reset_database(self, request):
         """
@@ -90,28 +265,43 @@ class FluxoViewSet(ModelViewSet):
                 # Conta registros antes de deletar
                 deleted_fluxo = FluxoAgua.objects.all().count()
                 deleted_consumo = ConsumoDiario.objects.all().count()
+                deleted_consumo_residencia = ConsumoResidenciaDiario.objects.all().count()
+                deleted_consumo_horario = ConsumoHorario.objects.all().count()
+                deleted_dias_compactados = DiaCompactado.objects.all().count()
                 deleted_sensor = Sensor.objects.all().count()
                 deleted_meta = MetaConsumo.objects.all().count()
                 deleted_controle = ControleFluxo.objects.all().count()
                 deleted_email = EmailNotification.objects.all().count()
+                deleted_email_outbox = EmailOutbox.objects.all().count()
 
                 # Deleta todos os registros de todas as tabelas
                 FluxoAgua.objects.all().delete()
                 ConsumoDiario.objects.all().delete()
+                ConsumoResidenciaDiario.objects.all().delete()
+                ConsumoHorario.objects.all().delete()
+                DiaCompactado.objects.all().delete()
                 MetaConsumo.objects.all().delete()
                 ControleFluxo.objects.all().delete()
                 EmailNotification.objects.all().delete()
+                EmailOutbox.objects.all().delete()
                 Sensor.objects.all().delete()
 
+                transaction.on_commit(estado_sensores.invalidar)
+                transaction.on_commit(historico.invalidar)
+
                 return Response({
                     "success": True,
                     "message": "Banco de dados resetado com sucesso!",
                     "deleted_records": {
                         "fluxo_agua": deleted_fluxo,
                         "consumo_diario": deleted_consumo,
+                        "consumo_residencia_diario": deleted_consumo_residencia,
+                        "consumo_horario": deleted_consumo_horario,
+                        "dias_compactados": deleted_dias_compactados,
                         "meta_consumo": deleted_meta,
                         "controle_fluxo": deleted_controle,
                         "email_notificacao": deleted_email,
+                        "email_outbox": deleted_email_outbox,
                         "sensores": deleted_sensor
                     }
                 }, status=status.HTTP_200_OK)
@@ -126,19 +316,105 @@ class FluxoViewSet(ModelViewSet):
             )
 
 
+@csrf_exempt
+@require_POST
+async def registrar_leituras_async(request):
+    """
+    POST /fluxo/async/: ingestão assíncrona de uma leitura ({"sensor", "valor",
+    "data_hora"}) ou de uma lista delas, para servidores ASGI (uvicorn).
+
+    O corpo é validado no loop de eventos e a existência dos sensores é
+    verificada pelo ORM assíncrono. A gravação usa a mesma regra do POST
+    /fluxo/bulk/ (registrar_leituras), executada em sync_to_async porque a
+    leitura, os totais e a verificação da meta precisam de uma transação.
+
+    A espera por sensores lentos não depende desta view: no ASGI o Django lê o
+    corpo no loop de eventos antes de chamar qualquer view. Por isso o POST
+    /fluxo/ no mesmo servidor não é mais lento que esta (benchmarks/ingestao_async.py).
+    """
+    try:
+        dados = json.loads(request.body)
+    except (UnicodeDecodeError, ValueError):
+        return JsonResponse({"error": "Corpo da requisição deve ser um JSON válido"}, status=400)
+
+    # ListSerializer simples: LeituraLoteListSerializer consultaria os sensores de forma síncrona
+    serializer = ListSerializer(
+        child=LeituraLoteSerializer(),
+        data=dados if isinstance(dados, list) else [dados],
+        max_length=settings.FLUXO_LOTE_MAX_LEITURAS,
+    )
+    if not serializer.is_valid():
+        return JsonResponse({"error": serializer.errors}, status=400)
+    leituras = serializer.validated_data
+
+    sensor_ids = {leitura["sensor"] for leitura in leituras}
+    existentes = {
+        sensor_id async for sensor_id in Sensor.objects.filter(id__in=sensor_ids).values_list("id", flat=True)
+    }
+    inexistentes = sorted(sensor_ids - existentes)
+    if inexistentes:
+        return JsonResponse(
+            {"error": f"Sensores inexistentes: {', '.join(str(s) for s in inexistentes)}"}, status=400
+        )
+
+    criadas = await sync_to_async(registrar_leituras)(leituras)
+    return JsonResponse({"registradas": len(criadas)}, status=201)
+
+
+@require_GET
+def metricas_prometheus(request):
+    """GET /metrics: métricas da aplicação no formato de texto do Prometheus (fluxo.metricas)"""
+    conteudo, content_type = metricas.gerar()
+    return HttpResponse(conteudo, content_type=content_type)
+
+
+def _etag_consumo(request, *args, **kwargs):
+    """
+    ETag das consultas de consumo, calculado sem agregar nada: o dia atual,
+    os parâmetros, o maior id de FluxoAgua (muda a cada leitura nova) e as
+    versões que mudam quando leituras são editadas/removidas ou o histórico
+    é reescrito. Uma requisição com If-None-Match igual recebe 304.
+    """
+    ultimo_id = FluxoAgua.objects.aggregate(ultimo_id=Max("id"))["ultimo_id"] or 0
+    partes = [str(timezone.localdate()), str(ultimo_id), versoes.marca('consumo', 'historico')]
+    if request.GET:
+        partes.append(request.GET.urlencode())
+    return "-".join(partes)
+
+
+def _etag_consumo_mensal(request, *args, **kwargs):
+    """Como _etag_consumo, mas sem ETag quando o mês é inválido (a resposta é um erro)"""
+    mes = request.GET.get('mes')
+    if mes and not (mes.isdigit() and 1 <= int(mes) <= 12):
+        return None
+    return _etag_consumo(request)
+
+
+def _etag_controle_fluxo(request, *args, **kwargs):
+    """ETag do status do dia: a data e o data_hora_atualizacao (status já em cache)"""
+    hoje = timezone.localdate()
+    atualizacao = controle_fluxo.status_do_dia(hoje)["data_hora_atualizacao"]
+    return f"{hoje}-{atualizacao or 'padrao'}"
+
+
+def _ultima_alteracao_controle_fluxo(request, *args, **kwargs):
+    atualizacao = controle_fluxo.status_do_dia(timezone.localdate())["data_hora_atualizacao"]
+    return parse_datetime(atualizacao) if atualizacao else None
+
+
 class ConsumoResidenciaView(ViewSet):
     """
     Retorna consumo diário e total da residência
     """
 
+    @method_decorator(condition(etag_func=_etag_consumo))
     def list(self, request):
         hoje = timezone.localdate()
-        # Consulta todas as leituras do dia
-        leituras = FluxoAgua.objects.filter(data_hora__date=hoje)
-
-        # Agrega consumo por sensor
-        consumo_por_sensor = leituras.values("sensor__nome").annotate(
-            consumo_total=Sum("valor_diferenca")
+        # Consumo de cada sensor no dia, mantido a cada leitura (uma linha por sensor)
+        consumo_por_sensor = (
+            ConsumoDiario.objects.filter(data=hoje)
+            .values("sensor__nome", "consumo_total")
+            .order_by("sensor__nome")
         )
 
         # Formata a resposta
@@ -147,8 +423,8 @@ class ConsumoResidenciaView(ViewSet):
             for c in consumo_por_sensor
         ]
 
-        total_residencia = leituras.aggregate(total=Sum("valor_diferenca"))["total"] or Decimal(
-            "0.00"
+        total_residencia = sum(
+            (c["consumo_total"] for c in consumo_por_sensor), Decimal("0.00")
         )
 
         return Response(
@@ -205,6 +481,7 @@ class ConsumoMensalView(ViewSet):
             )
         }
     )
+    @method_decorator(condition(etag_func=_etag_consumo_mensal))
     def list(self, request):
         hoje = timezone.localdate()
         ano_atual = hoje.year
@@ -225,23 +502,19 @@ class ConsumoMensalView(ViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            leituras = FluxoAgua.objects.filter(data_hora__year=ano_atual, data_hora__month=mes)
-
-            # Agrupa consumo por dia e sensor
-            consumo_por_dia = leituras.values("data_hora__date", "sensor__nome").annotate(
-                consumo_total=Sum("valor_diferenca")
-            )
+            # Consumo por dia e sensor (ConsumoDiario); dias já encerrados vêm do cache
+            consumo_por_dia = historico.consumo_por_dia_do_mes(ano_atual, mes)
 
             resposta_dias = [
                 {
-                    "data": c["data_hora__date"].strftime("%d/%m/%Y"),
-                    "sensor": c["sensor__nome"],
-                    "consumo_total": f"{c['consumo_total']:.2f}",
+                    "data": data.strftime("%d/%m/%Y"),
+                    "sensor": sensor,
+                    "consumo_total": f"{consumo:.2f}",
                 }
-                for c in consumo_por_dia
+                for data, sensor, consumo in consumo_por_dia
             ]
 
-            total_mes = leituras.aggregate(total=Sum("valor_diferenca"))["total"] or Decimal("0.00")
+            total_mes = sum((consumo for _, _, consumo in consumo_por_dia), Decimal("0.00"))
 
             # Nomes dos meses em português
             meses_nomes = [
@@ -260,15 +533,8 @@ class ConsumoMensalView(ViewSet):
             )
 
         # Caso contrário, retorna todos os meses do ano atual
-        leituras_ano = FluxoAgua.objects.filter(data_hora__year=ano_atual)
-
-        # Agrupa consumo por mês
-        consumo_por_mes = leituras_ano.values("data_hora__month").annotate(
-            consumo_total=Sum("valor_diferenca")
-        ).order_by("data_hora__month")
-
-        # Cria um dicionário com o consumo de cada mês
-        meses_consumo = {c["data_hora__month"]: c["consumo_total"] for c in consumo_por_mes}
+        # Totais mensais da residência; meses já encerrados vêm do cache
+        meses_consumo = historico.consumo_dos_meses(ano_atual)
 
         # Nomes dos meses em português
         meses_nomes = [
@@ -286,7 +552,7 @@ class ConsumoMensalView(ViewSet):
             for i in range(12)
         ]
 
-        total_ano = leituras_ano.aggregate(total=Sum("valor_diferenca"))["total"] or Decimal("0.00")
+        total_ano = sum(meses_consumo.values(), Decimal("0.00"))
 
         return Response(
             {
@@ -297,6 +563,371 @@ class ConsumoMensalView(ViewSet):
         )
 
 
+def _parse_data(valor):
+    """Converte um parâmetro AAAA-MM-DD em date; None se for inválido ou inexistente"""
+    try:
+        return parse_date(valor)
+    except ValueError:
+        return None
+
+
+def _parse_data_hora(valor, fim=False):
+    """
+    Converte um parâmetro de consulta em datetime aware.
+    Aceita data/hora ISO 8601 ou apenas a data (início do dia; com fim=True, início do dia seguinte).
+    Retorna None se o valor for inválido.
+    """
+    try:
+        data = parse_date(valor)
+        data_hora = None if data is not None else parse_datetime(valor)
+    except ValueError:
+        # Formato válido, mas data inexistente (ex.: 2025-02-30)
+        return None
+    if data is not None:
+        return inicio_do_dia(data + timedelta(days=1) if fim else data)
+    if data_hora is None:
+        return None
+    if timezone.is_naive(data_hora):
+        data_hora = make_aware(data_hora)
+    return data_hora
+
+
+def _filtrar_leituras(queryset, params):
+    """
+    Aplica os filtros sensor, desde e ate às leituras.
+    desde/ate formam o intervalo semiaberto [desde, ate) sobre data_hora
+    (índice sensor + data_hora). Retorna (queryset, None) ou (None, mensagem de erro).
+    """
+    sensor_id = params.get('sensor')
+    if sensor_id:
+        try:
+            queryset = queryset.filter(sensor_id=int(sensor_id))
+        except ValueError:
+            return None, "sensor deve ser um número inteiro"
+
+    desde_param = params.get('desde')
+    ate_param = params.get('ate')
+    desde = _parse_data_hora(desde_param) if desde_param else None
+    ate = _parse_data_hora(ate_param, fim=True) if ate_param else None
+    if (desde_param and desde is None) or (ate_param and ate is None):
+        return None, "desde e ate devem ser datas (AAAA-MM-DD) ou datas/horas ISO 8601"
+    if desde:
+        queryset = queryset.filter(data_hora__gte=desde)
+    if ate:
+        queryset = queryset.filter(data_hora__lt=ate)
+    return queryset, None
+
+
+class ConsumoDiarioView(ViewSet):
+    """
+    Consumo diário por sensor (ConsumoDiario)
+
+    - **GET /consumo-diario/export/**: Exporta o consumo de cada sensor por dia em CSV ou NDJSON
+    """
+
+    @swagger_auto_schema(
+        operation_description="Exporta o consumo diário de cada sensor (em ordem de data) em streaming",
+        manual_parameters=[
+            openapi.Parameter('sensor', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description="Apenas o consumo do sensor"),
+            openapi.Parameter('desde', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Primeiro dia (AAAA-MM-DD)"),
+            openapi.Parameter('ate', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description="Último dia, inclusive (AAAA-MM-DD)"),
+            PARAMETRO_FORMATO,
+        ],
+        responses={200: "Arquivo CSV ou NDJSON"}
+    )
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        formato = request.query_params.get('formato', 'csv')
+        if formato not in FORMATOS:
+            return Response(
+                {"error": f"formato deve ser um de: {', '.join(FORMATOS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = ConsumoDiario.objects.order_by("data", "sensor_id")
+        sensor_id = request.query_params.get('sensor')
+        desde_param = request.query_params.get('desde')
+        ate_param = request.query_params.get('ate')
+        desde = _parse_data(desde_param) if desde_param else None
+        ate = _parse_data(ate_param) if ate_param else None
+        if (desde_param and desde is None) or (ate_param and ate is None):
+            return Response(
+                {"error": "desde e ate devem ser datas no formato AAAA-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if sensor_id:
+            try:
+                queryset = queryset.filter(sensor_id=int(sensor_id))
+            except ValueError:
+                return Response(
+                    {"error": "sensor deve ser um número inteiro"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        if desde:
+            queryset = queryset.filter(data__gte=desde)
+        if ate:
+            queryset = queryset.filter(data__lte=ate)
+
+        campos = {
+            "data": "data",
+            "sensor": "sensor_id",
+            "sensor_nome": "sensor__nome",
+            "consumo_total": "consumo_total",
+            "hora_ultima_leitura": "hora",
+        }
+        return resposta_exportacao(request, queryset, campos, formato, "consumo_diario")
+
+
+class ConsumoHorarioView(ViewSet):
+    """
+    Retorna a série de consumo por intervalo do dia
+
+    - **GET /consumo-horario/**: Consumo da residência em cada intervalo de hoje
+    - **GET /consumo-horario/?sensor=X&inicio=AAAA-MM-DD&fim=AAAA-MM-DD&intervalo=60**:
+      Consumo do sensor X no período, agrupado em intervalos de N minutos
+    """
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Retorna o consumo agrupado em intervalos (base definida por FLUXO_INTERVALO_MINUTOS). "
+            "Sem sensor retorna o total da residência. O período é semiaberto: [inicio, fim)."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                'sensor', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False,
+                description="ID do sensor. Se não informado, soma todos os sensores."
+            ),
+            openapi.Parameter(
+                'inicio', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                description="Início do período (data ou data/hora ISO 8601). Padrão: início de hoje."
+            ),
+            openapi.Parameter(
+                'fim', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                description="Fim do período, exclusivo (data ou data/hora ISO 8601). Uma data inclui o dia inteiro. Padrão: fim de hoje."
+            ),
+            openapi.Parameter(
+                'intervalo', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False,
+                description="Tamanho do intervalo em minutos, múltiplo do intervalo base e divisor de 1440 (um dia). Padrão: intervalo base."
+            ),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Série de consumo retornada com sucesso",
+                examples={
+                    "application/json": {
+                        "sensor": 1,
+                        "inicio": "2025-10-02T00:00:00-03:00",
+                        "fim": "2025-10-03T00:00:00-03:00",
+                        "intervalo_minutos": 60,
+                        "serie": [
+                            {"inicio": "2025-10-02T07:00:00-03:00", "consumo_total": "35.20"},
+                            {"inicio": "2025-10-02T08:00:00-03:00", "consumo_total": "12.00"}
+                        ],
+                        "total": "47.20"
+                    }
+                }
+            )
+        }
+    )
+    def list(self, request):
+        intervalo_base = settings.FLUXO_INTERVALO_MINUTOS
+        hoje = timezone.localdate()
+
+        inicio_param = request.query_params.get('inicio')
+        fim_param = request.query_params.get('fim')
+        inicio_hoje, fim_hoje = intervalo_do_dia(hoje)
+        inicio = _parse_data_hora(inicio_param) if inicio_param else inicio_hoje
+        fim = _parse_data_hora(fim_param, fim=True) if fim_param else fim_hoje
+        if inicio is None or fim is None:
+            return Response(
+                {"error": "inicio e fim devem ser datas (AAAA-MM-DD) ou datas/horas ISO 8601"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if fim <= inicio:
+            return Response(
+                {"error": "fim deve ser posterior a inicio"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            intervalo = int(request.query_params.get('intervalo', intervalo_base))
+            sensor_id = request.query_params.get('sensor')
+            sensor_id = int(sensor_id) if sensor_id else None
+        except ValueError:
+            return Response(
+                {"error": "sensor e intervalo devem ser números inteiros"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if intervalo <= 0 or intervalo % intervalo_base:
+            return Response(
+                {"error": f"intervalo deve ser múltiplo de {intervalo_base} minutos"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Os intervalos são contados a partir da meia-noite local: precisam dividir o dia
+        if MINUTOS_DIA % intervalo:
+            return Response(
+                {"error": f"intervalo deve dividir o dia ({MINUTOS_DIA} minutos); para totais diários ou maiores use /consumo/"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if (fim - inicio) / timedelta(minutes=intervalo) > settings.FLUXO_CONSUMO_MAX_PONTOS:
+            return Response(
+                {"error": f"O período pedido excede {settings.FLUXO_CONSUMO_MAX_PONTOS} intervalos; aumente o intervalo ou reduza o período"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        consumos = ConsumoHorario.objects.filter(inicio__gte=inicio, inicio__lt=fim)
+        if sensor_id is not None:
+            consumos = consumos.filter(sensor_id=sensor_id)
+        por_intervalo_base = (
+            consumos.values("inicio").annotate(consumo_total=Sum("consumo_total")).order_by("inicio")
+        )
+
+        # Agrupa os intervalos base no intervalo pedido
+        serie = defaultdict(Decimal)
+        for c in por_intervalo_base:
+            serie[inicio_intervalo(c["inicio"], intervalo)] += c["consumo_total"]
+
+        return Response(
+            {
+                "sensor": sensor_id,
+                "inicio": timezone.localtime(inicio).isoformat(),
+                "fim": timezone.localtime(fim).isoformat(),
+                "intervalo_minutos": intervalo,
+                "serie": [
+                    {"inicio": inicio_ponto.isoformat(), "consumo_total": f"{total:.2f}"}
+                    for inicio_ponto, total in serie.items()
+                ],
+                "total": f"{sum(serie.values(), Decimal('0.00')):.2f}",
+            }
+        )
+
+
+class ConsumoView(ViewSet):
+    """
+    Retorna o consumo de um período qualquer agrupado por dia, semana, mês ou ano
+
+    - **GET /consumo/?inicio=AAAA-MM-DD&fim=AAAA-MM-DD&granularidade=mes**: Consumo da residência
+    - **GET /consumo/?...&sensor=X**: Consumo do sensor X
+    """
+
+    @swagger_auto_schema(
+        operation_description=(
+            "Retorna a série de consumo do período agrupada pela granularidade, em uma única "
+            "consulta agrupada sobre os consumos diários consolidados. O período inclui os dias "
+            "inicio e fim. Períodos sem consumo não aparecem na série."
+        ),
+        manual_parameters=[
+            openapi.Parameter(
+                'inicio', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                description="Primeiro dia (AAAA-MM-DD). Padrão: 1º de janeiro do ano atual."
+            ),
+            openapi.Parameter(
+                'fim', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                description="Último dia, inclusive (AAAA-MM-DD). Padrão: hoje."
+            ),
+            openapi.Parameter(
+                'granularidade', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False,
+                enum=list(GRANULARIDADES), default='mes',
+                description="Agrupamento da série. Semanas começam na segunda-feira."
+            ),
+            openapi.Parameter(
+                'sensor', openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False,
+                description="ID do sensor. Se não informado, retorna o consumo da residência."
+            ),
+        ],
+        responses={
+            200: openapi.Response(
+                description="Série de consumo retornada com sucesso",
+                examples={
+                    "application/json": {
+                        "sensor": None,
+                        "inicio": "2024-01-01",
+                        "fim": "2025-12-31",
+                        "granularidade": "ano",
+                        "serie": [
+                            {"inicio": "2024-01-01", "consumo_total": "152000.50"},
+                            {"inicio": "2025-01-01", "consumo_total": "139500.00"}
+                        ],
+                        "total": "291500.50"
+                    }
+                }
+            )
+        }
+    )
+    @method_decorator(condition(etag_func=_etag_consumo))
+    def list(self, request):
+        hoje = timezone.localdate()
+        inicio_param = request.query_params.get('inicio')
+        fim_param = request.query_params.get('fim')
+        inicio = _parse_data(inicio_param) if inicio_param else hoje.replace(month=1, day=1)
+        fim = _parse_data(fim_param) if fim_param else hoje
+        if inicio is None or fim is None:
+            return Response(
+                {"error": "inicio e fim devem ser datas no formato AAAA-MM-DD"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if fim < inicio:
+            return Response(
+                {"error": "fim não pode ser anterior a inicio"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        granularidade = request.query_params.get('granularidade', 'mes')
+        if granularidade not in GRANULARIDADES:
+            return Response(
+                {"error": f"granularidade deve ser uma de: {', '.join(GRANULARIDADES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if numero_de_periodos(inicio, fim, granularidade) > settings.FLUXO_CONSUMO_MAX_PONTOS:
+            return Response(
+                {"error": f"O período pedido excede {settings.FLUXO_CONSUMO_MAX_PONTOS} pontos; aumente a granularidade ou reduza o período"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            sensor_id = request.query_params.get('sensor')
+            sensor_id = int(sensor_id) if sensor_id else None
+        except ValueError:
+            return Response(
+                {"error": "sensor deve ser um número inteiro"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Totais diários já consolidados: por sensor ou da residência (uma linha por dia)
+        if sensor_id is not None:
+            consumos = ConsumoDiario.objects.filter(sensor_id=sensor_id)
+        else:
+            consumos = ConsumoResidenciaDiario.objects.all()
+        truncamentos = {"dia": F("data"), "semana": TruncWeek("data"), "mes": TruncMonth("data"), "ano": TruncYear("data")}
+        por_periodo = (
+            consumos.filter(data__gte=inicio, data__lte=fim)
+            .annotate(periodo=truncamentos[granularidade])
+            .values("periodo")
+            .annotate(consumo_total=Sum("consumo_total"))
+            .order_by("periodo")
+        )
+
+        serie = [
+            {"inicio": c["periodo"].isoformat(), "consumo_total": f"{c['consumo_total']:.2f}"}
+            for c in por_periodo
+        ]
+        total = sum((c["consumo_total"] for c in por_periodo), Decimal("0.00"))
+
+        return Response(
+            {
+                "sensor": sensor_id,
+                "inicio": inicio.isoformat(),
+                "fim": fim.isoformat(),
+                "granularidade": granularidade,
+                "serie": serie,
+                "total": f"{total:.2f}",
+            }
+        )
+
+
 class MetaConsumoViewSet(ViewSet):
     """
     Gerenciamento da Meta de Consumo da Residência (Singleton)
@@ -430,20 +1061,11 @@ class ControleFluxoViewSet(ViewSet):
             )
         }
     )
+    @method_decorator(condition(etag_func=_etag_controle_fluxo, last_modified_func=_ultima_alteracao_controle_fluxo))
     def list(self, request):
-        """Retorna o status do fluxo de hoje"""
-        hoje = timezone.localdate()
-        controle, created = ControleFluxo.objects.get_or_create(
-            data=hoje,
-            defaults={
-                'status': 'on',
-                'desligamento_automatico_ocorreu': False,
-                'usuario_alterou_manualmente': False,
-                'email_enviado_hoje': False
-            }
-        )
-        serializer = ControleFluxoSerializer(controle)
-        return Response(serializer.data)
+        """Retorna o status do fluxo de hoje (somente leitura, com cache)"""
+        # Sem registro do dia o status padrão ("on") é retornado sem gravar nada
+        return Response(controle_fluxo.status_do_dia(timezone.localdate()))
 
     @swagger_auto_schema(
         methods=['patch'],
@@ -494,9 +1116,14 @@ class ControleFluxoViewSet(ViewSet):
             }
         )
 
+        status_anterior = controle.status
         controle.status = novo_status
         controle.usuario_alterou_manualmente = True
-        controle.save()
+        # Grava só os campos alterados: as flags de desligamento e email são
+        # atualizadas pela ingestão em paralelo (fluxo.signals)
+        controle.save(update_fields=['status', 'usuario_alterou_manualmente', 'data_hora_atualizacao'])
+        if novo_status != status_anterior:
+            metricas.contar_transicao(f'manual_{novo_status}')
 
         serializer = ControleFluxoSerializer(controle)
         return Response(serializer.data)
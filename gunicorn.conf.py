@@ -0,0 +1,34 @@
+"""
+Configuração do gunicorn (carregada automaticamente do diretório de trabalho).
+"""
+import os
+
+
+def on_starting(server):
+    """
+    Reconstrói o estado compartilhado dos sensores e descarta as métricas da
+    execução anterior (PROMETHEUS_MULTIPROC_DIR) antes de criar os workers
+    """
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "setup.settings")
+    django.setup()
+
+    from django.db import connections
+
+    from fluxo import estado_sensores, metricas
+
+    estado_sensores.reconstruir()
+    metricas.limpar_diretorio()
+    # Os workers são criados por fork: não herdam a conexão nem o pool abertos pelo master
+    connections.close_all()
+    for conexao in connections.all(initialized_only=True):
+        if getattr(conexao, "pool", None):
+            conexao.close_pool()
+
+
+def worker_exit(server, worker):
+    """Grava as leituras que ainda estão no buffer de escrita do worker"""
+    from fluxo import buffer_escrita
+
+    buffer_escrita.descarregar()
@@ -9,8 +9,29 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import sync_to_async
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'setup.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from fluxo import buffer_escrita  # noqa: E402 (depois do django.setup())
+
+
+async def application(scope, receive, send):
+    """
+    Aplicação Django com o protocolo lifespan (que o Django não implementa):
+    no encerramento do servidor grava o buffer de escrita. O uvicorn termina o
+    processo com o próprio SIGTERM, sem passar pelo atexit nem pelo worker_exit.
+    """
+    if scope["type"] != "lifespan":
+        return await django_application(scope, receive, send)
+    while True:
+        mensagem = await receive()
+        if mensagem["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif mensagem["type"] == "lifespan.shutdown":
+            await sync_to_async(buffer_escrita.descarregar)()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -46,6 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Primeiro: mede o tempo dos demais middlewares (GET /metrics)
+    "fluxo.middleware.MetricasMiddleware",
+    # Cabeçalho Server-Timing e log de requisições lentas (FLUXO_SERVER_TIMING)
+    "fluxo.middleware.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -54,7 +59,9 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # WhiteNoise com suporte a ASGI: com um middleware só síncrono, as views
+    # assíncronas seriam executadas em async_to_sync (fluxo.middleware)
+    "fluxo.middleware.ArquivosEstaticosMiddleware",
 ]
 
 ROOT_URLCONF = "setup.urls"
@@ -89,10 +96,35 @@ DATABASES = {
         os.environ.get(
             "DATABASE_URL",
             "postgresql://user:password@db:5432/db",
-        )
+        ),
+        # Sem o pool: segundos que a conexão é mantida entre requisições (0 = uma por requisição)
+        conn_max_age=int(os.environ.get("FLUXO_DB_CONN_MAX_AGE", "0")),
+        # Verifica a conexão reaproveitada (ou a retirada do pool) antes de usá-la
+        conn_health_checks=os.environ.get("FLUXO_DB_HEALTH_CHECKS", "True") == "True",
     )
 }
 
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    # Pool de conexões do Django (psycopg 3) em cada processo: as requisições
+    # reaproveitam as conexões em vez de abrir uma nova a cada vez
+    if os.environ.get("FLUXO_DB_POOL", "True") == "True":
+        DATABASES["default"]["CONN_MAX_AGE"] = 0  # o pool não admite conexões persistentes
+        DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {
+            "min_size": int(os.environ.get("FLUXO_DB_POOL_MIN", "2")),
+            "max_size": int(os.environ.get("FLUXO_DB_POOL_MAX", "10")),
+            # Segundos esperando uma conexão livre antes de falhar a requisição
+            "timeout": float(os.environ.get("FLUXO_DB_POOL_TIMEOUT", "10")),
+        }
+    # Prepared statements: uma consulta executada este número de vezes na mesma
+    # conexão passa a ser preparada no servidor (sem novo planejamento a cada
+    # leitura). Requer parâmetros enviados ao servidor (server_side_binding).
+    # Vazio desativa; desative também atrás de PgBouncer em modo transação.
+    if os.environ.get("FLUXO_DB_PREPARE_THRESHOLD", "5"):
+        DATABASES["default"].setdefault("OPTIONS", {}).update(
+            server_side_binding=True,
+            prepare_threshold=int(os.environ.get("FLUXO_DB_PREPARE_THRESHOLD", "5")),
+        )
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -234,3 +266,97 @@ EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True') == 'True'
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@example.com')
+# Diretório dos emails gravados com EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend
+# (substitui o SMTP em testes locais)
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', str(BASE_DIR / 'emails_enviados'))
+
+# Fila de emails (EmailOutbox) enviada pelo comando run_email_worker
+# Tentativas antes de marcar o email como falho; a espera entre elas dobra a cada falha
+FLUXO_EMAIL_MAX_TENTATIVAS = int(os.environ.get('FLUXO_EMAIL_MAX_TENTATIVAS', '8'))
+FLUXO_EMAIL_ESPERA_INICIAL = int(os.environ.get('FLUXO_EMAIL_ESPERA_INICIAL', '30'))  # segundos
+FLUXO_EMAIL_ESPERA_MAXIMA = int(os.environ.get('FLUXO_EMAIL_ESPERA_MAXIMA', '3600'))  # segundos
+
+
+# Ingestão de leituras
+# Número máximo de leituras aceitas por requisição em POST /fluxo/bulk/
+FLUXO_LOTE_MAX_LEITURAS = int(os.environ.get('FLUXO_LOTE_MAX_LEITURAS', '5000'))
+# Buffer de escrita do POST /fluxo/ (fluxo.buffer_escrita): quando ativo, a leitura é
+# validada e respondida com 202, e uma thread de cada processo grava o buffer em lotes
+FLUXO_BUFFER_ESCRITA = os.environ.get('FLUXO_BUFFER_ESCRITA', 'False') == 'True'
+# Leituras por gravação e espera máxima (ms) de uma leitura no buffer
+FLUXO_BUFFER_LOTE = int(os.environ.get('FLUXO_BUFFER_LOTE', '500'))
+FLUXO_BUFFER_INTERVALO_MS = int(os.environ.get('FLUXO_BUFFER_INTERVALO_MS', '200'))
+# Capacidade do buffer; cheio, o POST grava o buffer inteiro na própria requisição
+FLUXO_BUFFER_MAX = int(os.environ.get('FLUXO_BUFFER_MAX', '10000'))
+
+# Listagem de leituras (GET /fluxo/): tamanho padrão e máximo (?tamanho=) da página
+FLUXO_PAGINA_LEITURAS = int(os.environ.get('FLUXO_PAGINA_LEITURAS', '100'))
+FLUXO_PAGINA_LEITURAS_MAX = int(os.environ.get('FLUXO_PAGINA_LEITURAS_MAX', '1000'))
+# Linhas lidas do banco por vez nas exportações (/fluxo/export/, /consumo-diario/export/)
+FLUXO_EXPORT_CHUNK = int(os.environ.get('FLUXO_EXPORT_CHUNK', '2000'))
+
+# Consumo
+# Duração (minutos) dos intervalos de ConsumoHorario, contados da meia-noite
+# local: deve dividir o dia (ex.: 15, 30, 60 ou 120).
+# Após alterar, rode "python manage.py rebuild_consumo_diario".
+FLUXO_INTERVALO_MINUTOS = int(os.environ.get('FLUXO_INTERVALO_MINUTOS', '60'))
+if FLUXO_INTERVALO_MINUTOS < 1 or (24 * 60) % FLUXO_INTERVALO_MINUTOS:
+    raise ImproperlyConfigured('FLUXO_INTERVALO_MINUTOS deve dividir o dia (1440 minutos), ex.: 15, 30, 60 ou 120')
+# Número máximo de pontos (intervalos) retornados por uma consulta de série
+FLUXO_CONSUMO_MAX_PONTOS = int(os.environ.get('FLUXO_CONSUMO_MAX_PONTOS', '5000'))
+
+# Diretório de estado compartilhado entre os workers do host (ex.: /dev/shm/fluxo).
+# Quando configurado, o último valor de cada sensor é mantido em memória
+# compartilhada e a ingestão não consulta a última leitura no banco.
+# Deixe vazio quando mais de um servidor gravar leituras.
+FLUXO_ESTADO_DIR = os.environ.get('FLUXO_ESTADO_DIR', '')
+FLUXO_ESTADO_SLOTS = int(os.environ.get('FLUXO_ESTADO_SLOTS', '4096'))
+# Segundos que a meta e os emails ativos ficam em cache em cada processo quando
+# FLUXO_ESTADO_DIR está vazio (com o diretório, a invalidação é imediata em todos)
+FLUXO_CONFIG_TTL = int(os.environ.get('FLUXO_CONFIG_TTL', '30'))
+# O mesmo para o status servido por GET /controle-fluxo/ (consultado pelas válvulas)
+FLUXO_CONTROLE_TTL = int(os.environ.get('FLUXO_CONTROLE_TTL', '5'))
+# Consumos de dias e meses encerrados (fluxo.historico): sem FLUXO_ESTADO_DIR as
+# entradas expiram após estes segundos; com ele ficam até o histórico ser reescrito
+FLUXO_HISTORICO_TTL = int(os.environ.get('FLUXO_HISTORICO_TTL', '300'))
+
+# Métricas (GET /metrics, fluxo.metricas): com vários workers, defina a variável de
+# ambiente PROMETHEUS_MULTIPROC_DIR com um diretório exclusivo do servidor web
+# (ex.: /dev/shm/fluxo-metricas) para o /metrics somar os valores de todos os workers.
+# O gunicorn esvazia o diretório ao iniciar.
+
+# Server-Timing (fluxo.middleware.ServerTimingMiddleware): tempo de SQL, número de
+# consultas, tempo de serialização e tempo total no cabeçalho de cada resposta
+FLUXO_SERVER_TIMING = os.environ.get('FLUXO_SERVER_TIMING', 'False') == 'True'
+# Com o Server-Timing ativo, requisições mais lentas que isto (ms) são registradas
+# com as consultas mais demoradas; 0 desativa o registro
+FLUXO_REQUISICAO_LENTA_MS = int(os.environ.get('FLUXO_REQUISICAO_LENTA_MS', '1000'))
+FLUXO_REQUISICAO_LENTA_CONSULTAS = int(os.environ.get('FLUXO_REQUISICAO_LENTA_CONSULTAS', '5'))
+
+# Logs da aplicação (loggers "fluxo.*", ex.: requisições lentas e alertas enfileirados)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simples': {'format': '{asctime} {levelname} {name}: {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simples'},
+    },
+    'loggers': {
+        'fluxo': {'handlers': ['console'], 'level': os.environ.get('FLUXO_LOG_LEVEL', 'INFO')},
+    },
+}
+
+# Cache do Django: memória local de cada processo ou, com FLUXO_CACHE_DIR,
+# arquivos compartilhados pelos workers do host. Nenhum serviço externo.
+FLUXO_CACHE_DIR = os.environ.get('FLUXO_CACHE_DIR', '')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': FLUXO_CACHE_DIR,
+    } if FLUXO_CACHE_DIR else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}